@@ -1,20 +1,43 @@
 #################### Imports ####################
 
 # Import standard libraries
-import dash_mantine_components as dmc
-from dash import Dash, html, dcc, Input, Output, State, ctx
 import dash
+
+# Partial property updates (Patch) and duplicated callback outputs need Dash 2.9 or later
+if tuple(int(version) for version in dash.__version__.split(".")[:2]) < (2, 9):
+    raise ImportError(f"The app requires Dash 2.9 or later (found {dash.__version__})")
+
+import dash_mantine_components as dmc
+from dash import Dash, DiskcacheManager, html, dcc, dash_table, Input, Output, State, Patch, ctx
+from dash.exceptions import PreventUpdate
 from dash_iconify import DashIconify
 import logging
 import numpy as np
 import base64
+import functools
 import xtrack as xt
 import io
 import json
+import uuid
 
 # Import functions
+import cache_functions
+import coalescing_functions
+import comparison_functions
+import context_functions
+import footprint_functions
+import knob_functions
 import plotting_functions
 import loading_functions
+import matching_functions
+import spatial_index_functions
+import table_functions
+import raster_functions
+import registry_functions
+import replay_functions
+import snapshot_functions
+import tracker_server_functions
+import tracking_functions
 
 #################### Get global variables ####################
 
@@ -35,40 +58,57 @@ import loading_functions
 # logger.addHandler(dashLoggerHandler)
 
 
-def load_default_config():
-    # Define global variables # ! To be updated so no problems with multiple users
-    global line_b1, tracker_b1, df_elements_b1, df_sv_b1, df_tw_b1, df_elements_corrected_b1
-    global line_b4, tracker_b4, df_elements_b4, df_sv_b4, df_tw_b4, df_elements_corrected_b4
-    # Get trackers and dataframes for beam 1 and 4
-    (
-        line_b1,
-        tracker_b1,
-        df_elements_b1,
-        df_sv_b1,
-        df_tw_b1,
-        df_elements_corrected_b1,
-    ) = loading_functions.return_all_loaded_variables(
-        line_path="json_lines/line_b1.json",
-        save_path="temp/line_b1_dfs.pickle",
-        force_load=False,
-        correct_x_axis=True,
-    )
-    (
-        line_b4,
-        tracker_b4,
-        df_elements_b4,
-        df_sv_b4,
-        df_tw_b4,
-        df_elements_corrected_b4,
-    ) = loading_functions.return_all_loaded_variables(
-        line_path="json_lines/line_b4.json",
-        save_path="temp/line_b4_dfs.pickle",
-        force_load=False,
-        correct_x_axis=False,
-    )
-
-
-load_default_config()
+def register_default_config():
+    """Register the default datasets of both beams, shared by all sessions and never evicted."""
+    dic_default_dataset_keys = {}
+    for beam, line_path, save_path, beam_2 in [
+        ("beam_1", "json_lines/line_b1.json", "temp/line_b1_dfs.pickle", False),
+        ("beam_2", "json_lines/line_b4.json", "temp/line_b4_dfs.pickle", True),
+    ]:
+        with open(line_path, "rb") as fid:
+            dataset_key = registry_functions.return_dataset_key(
+                registry_functions.return_content_hash(fid.read()), beam_2=beam_2
+            )
+        registry_functions.register_dataset_file(
+            dataset_key, line_path, save_path, beam_2=beam_2, pinned=True
+        )
+        dic_default_dataset_keys[beam] = dataset_key
+
+    return dic_default_dataset_keys
+
+
+# The processes of the process pools are spawned, and import this module again under the name
+# "__mp_main__" when the app is run with "python app.py": they must not load the datasets
+IS_SPAWNED_PROCESS = __name__ == "__mp_main__"
+
+if not IS_SPAWNED_PROCESS:
+    # The server forks the background jobs, so its own trackers must run on a single thread. The
+    # twiss and tracking run on the multi-threaded trackers of the tracker server, a long-lived
+    # process started before any job is forked, and reached by the jobs as well.
+    context_functions.forbid_threads()
+    tracker_server_functions.start_tracker_server()
+
+    # Load the default datasets at startup
+    DIC_DEFAULT_DATASET_KEYS = register_default_config()
+    for dataset_key in DIC_DEFAULT_DATASET_KEYS.values():
+        registry_functions.return_dataset(dataset_key)
+
+
+def return_session_datasets(dic_session_datasets):
+    """Return the datasets of both beams used by a session (the default ones if nothing has been
+    uploaded)."""
+    if dic_session_datasets is None:
+        dic_session_datasets = DIC_DEFAULT_DATASET_KEYS
+    return (
+        registry_functions.return_dataset(
+            dic_session_datasets.get("beam_1", DIC_DEFAULT_DATASET_KEYS["beam_1"])
+        ),
+        registry_functions.return_dataset(
+            dic_session_datasets.get("beam_2", DIC_DEFAULT_DATASET_KEYS["beam_2"])
+        ),
+    )
+
+
 #################### App ####################
 app = Dash(
     __name__,
@@ -76,6 +116,9 @@ app = Dash(
         "https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.5/MathJax.js?config=TeX-MML-AM_CHTML"
     ],
     title="LHC explorer",
+    # Long computations (uploads, twiss) are run as background jobs, so that the workers remain
+    # available for fast interactive requests
+    background_callback_manager=DiskcacheManager(cache_functions.cache_jobs),
     # suppress_callback_exceptions=True,
 )
 server = app.server
@@ -99,7 +142,7 @@ def return_LHC_survey_layout():
                                             value=x,
                                             variant="outline",
                                         )
-                                        for x in ["8-2", "2-4", "4-6", "6-8"]
+                                        for x in loading_functions.L_SECTORS
                                     ],
                                     id="chips-ip",
                                     value=["4-6"],
@@ -184,7 +227,9 @@ def return_optics_layout():
                         children=[
                             dmc.Select(
                                 id="knob-select",
-                                data=list(tracker_b1.vars._owner.keys()),
+                                data=registry_functions.return_dataset(
+                                    DIC_DEFAULT_DATASET_KEYS["beam_1"]
+                                )["knob_catalog"]["l_knobs"],
                                 searchable=True,
                                 nothingFound="No options found",
                                 style={"width": 200},
@@ -194,11 +239,20 @@ def return_optics_layout():
                             dmc.NumberInput(
                                 id="knob-input",
                                 label="Knob value",
-                                value=tracker_b1.vars["on_x1"]._value,
+                                value=registry_functions.return_dataset(
+                                    DIC_DEFAULT_DATASET_KEYS["beam_1"]
+                                )["tracker"].vars["on_x1"]._value,
                                 step=1,
                                 style={"width": 200},
                             ),
-                            dmc.Button("Update knob", id="update-knob-button", mr=10),
+                            dmc.Button("Update knob", id="update-knob-button"),
+                            dmc.Button(
+                                "Cancel",
+                                id="cancel-knob-button",
+                                variant="outline",
+                                disabled=True,
+                                mr=10,
+                            ),
                             dmc.Button("Display whole ring", id="display-ring-button"),
                             dmc.Button("Display around IR 1", id="display-ir1-button"),
                             dmc.Button("Display around IR 5", id="display-ir5-button"),
@@ -206,6 +260,88 @@ def return_optics_layout():
                         align="end",
                     ),
                 ),
+                dmc.Center(
+                    dmc.Group(
+                        children=[
+                            dmc.Button("Stage knob", id="stage-knob-button", variant="outline"),
+                            dmc.Button("Commit staged knobs", id="commit-knobs-button"),
+                            dmc.Button(
+                                "Clear staged knobs", id="clear-knobs-button", variant="outline"
+                            ),
+                            dcc.Upload(
+                                id="upload-knobs",
+                                children=dmc.Button("Import knobs (json/csv)", variant="outline"),
+                                multiple=False,
+                            ),
+                        ],
+                    ),
+                ),
+                html.Div(id="staged-knobs-text"),
+                dmc.Center(
+                    dmc.Group(
+                        children=[
+                            dmc.TextInput(
+                                id="snapshot-name",
+                                label="Snapshot name",
+                                placeholder="e.g. collision",
+                                style={"width": 200},
+                            ),
+                            dmc.Button("Save snapshot", id="save-snapshot-button"),
+                            dmc.Select(
+                                id="snapshot-select",
+                                data=[],
+                                label="Snapshot",
+                                style={"width": 200},
+                            ),
+                            dmc.Button("Restore snapshot", id="restore-snapshot-button", mr=10),
+                            dmc.Select(
+                                id="snapshot-compare-select",
+                                data=[],
+                                label="Compare with",
+                                style={"width": 200},
+                            ),
+                        ],
+                        align="end",
+                    ),
+                ),
+                html.Div(id="snapshot-diff-text"),
+                dmc.Center(
+                    dmc.Group(
+                        children=[
+                            dmc.NumberInput(
+                                id=f"match-{target}",
+                                label=f"Target {target}",
+                                precision=5 if target in ["qx", "qy"] else 2,
+                                step=0.001 if target in ["qx", "qy"] else 1,
+                                style={"width": 120},
+                            )
+                            for target in matching_functions.L_MATCHING_TARGETS
+                        ]
+                        + [
+                            dmc.MultiSelect(
+                                id="matching-knobs",
+                                label="Varied knobs",
+                                data=registry_functions.return_dataset(
+                                    DIC_DEFAULT_DATASET_KEYS["beam_1"]
+                                )["knob_catalog"]["l_knobs"],
+                                value=list(matching_functions.DIC_DEFAULT_MATCHING_KNOBS.values()),
+                                searchable=True,
+                                nothingFound="No options found",
+                                style={"width": 300},
+                            ),
+                            dmc.Button("Match", id="match-button"),
+                            dmc.Button(
+                                "Cancel", id="cancel-match-button", variant="outline", disabled=True
+                            ),
+                        ],
+                        align="end",
+                    ),
+                ),
+                dmc.Progress(id="matching-progress", value=0, size="xl"),
+                dmc.Text(id="matching-message", size="sm", color="dimmed"),
+                dmc.Text(id="knob-transaction-message", size="sm", color="red"),
+                dmc.Progress(id="knob-progress", value=0, size="xl"),
+                dmc.Text(id="twiss-latency", size="sm", color="dimmed"),
                 dmc.Group(
                     children=[
                         # dcc.Loading(
@@ -230,6 +366,292 @@ def return_optics_layout():
     return optics_layout
 
 
+def return_replay_layout():
+    replay_layout = dmc.Center(
+        dmc.Stack(
+            children=[
+                dmc.Alert(
+                    "Upload a csv or parquet file containing a knob time series (one row per step,"
+                    " one column per knob, and an optional time column), to replay it on top of"
+                    " the current knob state.",
+                    title="Replay knobs",
+                    mt=10,
+                ),
+                dmc.Center(
+                    dmc.Group(
+                        children=[
+                            dcc.Upload(
+                                id="upload-replay",
+                                children=dmc.Button("Load knob time series (csv/parquet)"),
+                                multiple=False,
+                            ),
+                            dmc.NumberInput(
+                                id="replay-speed",
+                                label="Playback speed (x real time)",
+                                value=1,
+                                min=0.01,
+                                precision=2,
+                                step=0.5,
+                                style={"width": 200},
+                            ),
+                            dmc.Button("Play", id="play-replay-button"),
+                            dmc.Button(
+                                "Stop", id="stop-replay-button", variant="outline", disabled=True
+                            ),
+                        ],
+                        align="end",
+                    ),
+                ),
+                dmc.Text(id="replay-message", size="sm", color="dimmed"),
+                dmc.Progress(id="replay-progress", value=0, size="xl"),
+                # Replay being played, and interval at which it is advanced (often enough for a
+                # smooth playback)
+                dcc.Store(id="replay-state"),
+                dcc.Interval(id="replay-interval", interval=250, disabled=True),
+                dcc.Graph(
+                    id="replay-graph",
+                    mathjax=True,
+                    config={
+                        "displayModeBar": True,
+                        "scrollZoom": True,
+                        "responsive": True,
+                        "displaylogo": False,
+                    },
+                ),
+            ],
+        )
+    )
+    return replay_layout
+
+
+def return_tracking_layout():
+    tracking_layout = dmc.Center(
+        dmc.Stack(
+            children=[
+                dmc.Alert(
+                    "Track a Gaussian ensemble of particles with the current knob state. The"
+                    " figure is updated after each chunk of turns.",
+                    title="Track particles",
+                    mt=10,
+                ),
+                dmc.Center(
+                    dmc.Group(
+                        children=[
+                            dmc.NumberInput(
+                                id="tracking-n-particles",
+                                label="Number of particles",
+                                value=1000,
+                                min=1,
+                                max=tracking_functions.MAX_TRACKED_PARTICLES,
+                                step=100,
+                                style={"width": 150},
+                            ),
+                            dmc.NumberInput(
+                                id="tracking-n-turns",
+                                label="Number of turns",
+                                value=1000,
+                                min=1,
+                                max=tracking_functions.MAX_TRACKED_TURNS,
+                                step=100,
+                                style={"width": 150},
+                            ),
+                            dmc.NumberInput(
+                                id="tracking-chunk-size",
+                                label="Turns per chunk",
+                                value=100,
+                                min=1,
+                                step=10,
+                                style={"width": 150},
+                            ),
+                            dmc.NumberInput(
+                                id="tracking-amplitude",
+                                label="Amplitude (sigma)",
+                                value=1,
+                                min=0,
+                                precision=1,
+                                step=0.5,
+                                style={"width": 150},
+                            ),
+                            dmc.Button("Track", id="track-button"),
+                            dmc.Button(
+                                "Stop", id="stop-tracking-button", variant="outline", disabled=True
+                            ),
+                        ],
+                        align="end",
+                    ),
+                ),
+                dmc.Text(id="tracking-message", size="sm", color="dimmed"),
+                dmc.Progress(id="tracking-progress", value=0, size="xl"),
+                dcc.Graph(
+                    id="tracking-graph",
+                    mathjax=True,
+                    config={
+                        "displayModeBar": True,
+                        "scrollZoom": True,
+                        "responsive": True,
+                        "displaylogo": False,
+                    },
+                ),
+                dmc.Alert(
+                    "Compute the tune footprint of a grid of initial amplitudes with the current"
+                    " knob state (e.g. to study the effect of the octupoles).",
+                    title="Tune footprint",
+                    mt=10,
+                ),
+                dmc.Center(
+                    dmc.Group(
+                        children=[
+                            dmc.NumberInput(
+                                id="footprint-r-max",
+                                label="Maximum amplitude (sigma)",
+                                value=footprint_functions.DIC_DEFAULT_FOOTPRINT_PARAMETERS["r_max"],
+                                min=0.1,
+                                precision=1,
+                                step=0.5,
+                                style={"width": 150},
+                            ),
+                            dmc.NumberInput(
+                                id="footprint-n-r",
+                                label="Number of amplitudes",
+                                value=footprint_functions.DIC_DEFAULT_FOOTPRINT_PARAMETERS["n_r"],
+                                min=2,
+                                step=1,
+                                style={"width": 150},
+                            ),
+                            dmc.NumberInput(
+                                id="footprint-n-theta",
+                                label="Number of angles",
+                                value=footprint_functions.DIC_DEFAULT_FOOTPRINT_PARAMETERS[
+                                    "n_theta"
+                                ],
+                                min=2,
+                                step=1,
+                                style={"width": 150},
+                            ),
+                            dmc.NumberInput(
+                                id="footprint-n-turns",
+                                label="Number of turns",
+                                value=footprint_functions.DIC_DEFAULT_FOOTPRINT_PARAMETERS[
+                                    "n_turns"
+                                ],
+                                min=16,
+                                step=256,
+                                style={"width": 150},
+                            ),
+                            dmc.Button("Compute footprint", id="footprint-button"),
+                            dmc.Button(
+                                "Cancel",
+                                id="cancel-footprint-button",
+                                variant="outline",
+                                disabled=True,
+                            ),
+                        ],
+                        align="end",
+                    ),
+                ),
+                dmc.Text(id="footprint-message", size="sm", color="dimmed"),
+                dmc.Progress(id="footprint-progress", value=0, size="xl"),
+                # Footprint job being computed, and interval at which its progress is polled
+                dcc.Store(id="footprint-job"),
+                dcc.Interval(id="footprint-interval", interval=500, disabled=True),
+                dcc.Graph(
+                    id="footprint-graph",
+                    mathjax=True,
+                    config={
+                        "displayModeBar": True,
+                        "scrollZoom": True,
+                        "responsive": True,
+                        "displaylogo": False,
+                    },
+                ),
+            ],
+        )
+    )
+    return tracking_layout
+
+
+def return_comparison_layout():
+    comparison_layout = dmc.Center(
+        dmc.Stack(
+            children=[
+                dmc.Alert(
+                    "Compare the optics of the uploaded dataset with the default configuration"
+                    " (beta-beating, orbit and dispersion differences along s).",
+                    title="Compare datasets",
+                    mt=10,
+                ),
+                dmc.Center(
+                    dmc.Group(
+                        children=[
+                            dmc.SegmentedControl(
+                                id="comparison-beam",
+                                data=[
+                                    {"value": "beam_1", "label": "Beam 1"},
+                                    {"value": "beam_2", "label": "Beam 2"},
+                                ],
+                                value="beam_1",
+                            ),
+                            dmc.Button("Compare with default", id="compare-button"),
+                        ],
+                    ),
+                ),
+                dmc.Text(id="comparison-message", size="sm", color="dimmed"),
+                dcc.Graph(
+                    id="comparison-graph",
+                    mathjax=True,
+                    config={
+                        "displayModeBar": True,
+                        "scrollZoom": True,
+                        "responsive": True,
+                        "displaylogo": False,
+                    },
+                ),
+            ],
+        )
+    )
+    return comparison_layout
+
+
+def return_table_layout():
+    table_layout = dmc.Center(
+        dmc.Stack(
+            children=[
+                dmc.Alert(
+                    "Explore the elements and the twiss (with the knobs of the dataset) of the beam"
+                    " 1 dataset. Filter with e.g. '> 100' or 'mq', and sort by clicking on the"
+                    " column headers.",
+                    title="Explore tables",
+                    mt=10,
+                ),
+                dmc.Center(
+                    dmc.SegmentedControl(
+                        id="table-select",
+                        data=[
+                            {"value": table, "label": label}
+                            for table, label in table_functions.DIC_TABLES.items()
+                        ],
+                        value="elements",
+                    ),
+                ),
+                # Only the displayed page is sent by the server
+                dash_table.DataTable(
+                    id="table-explorer",
+                    page_current=0,
+                    page_size=20,
+                    page_action="custom",
+                    sort_action="custom",
+                    sort_mode="multi",
+                    sort_by=[],
+                    filter_action="custom",
+                    filter_query="",
+                    style_table={"overflowX": "auto"},
+                ),
+            ],
+        )
+    )
+    return table_layout
+
+
 def return_load_data_layout():
     load_data_layout = dmc.Center(
         dmc.Stack(
@@ -252,6 +674,12 @@ def return_load_data_layout():
                                 # Allow multiple files to be uploaded
                                 multiple=False,
                             ),
+                            dmc.Button(
+                                "Cancel",
+                                id="cancel-upload-beam-1",
+                                variant="outline",
+                                disabled=True,
+                            ),
                             dcc.Upload(
                                 id="upload-json-beam-2",
                                 children=dmc.Button(
@@ -260,10 +688,18 @@ def return_load_data_layout():
                                 # Allow multiple files to be uploaded
                                 multiple=False,
                             ),
+                            dmc.Button(
+                                "Cancel",
+                                id="cancel-upload-beam-2",
+                                variant="outline",
+                                disabled=True,
+                            ),
                             dmc.Button("Reload default configuration", id="reload-default-button"),
                         ],
                     ),
                 ),
+                dmc.Progress(id="upload-progress-beam-1", value=0, size="xl"),
+                dmc.Progress(id="upload-progress-beam-2", value=0, size="xl"),
                 html.Div(id="output-default-data"),
                 html.Div(id="output-data-upload-1"),
                 html.Div(id="output-data-upload-2"),
@@ -275,111 +711,179 @@ def return_load_data_layout():
     return load_data_layout
 
 
-layout = html.Div(
-    style={"width": "80%", "margin": "auto"},
-    children=[
-        # Interval for the logging handler
-        # dcc.Interval(id="interval1", interval=5 * 1000, n_intervals=0),
-        dmc.Header(
-            height=50,
-            children=dmc.Center(
-                children=dmc.Text(
-                    "LHC explorer",
-                    size=30,
-                    variant="gradient",
-                    gradient={"from": "blue", "to": "green", "deg": 45},
-                )
-            ),
-            style={"margin": "auto"},
-        ),
-        # html.Iframe(id="console-out", srcDoc="", style={"width": "100%", "height": 400}),
-        dmc.Center(
-            children=[
-                html.Div(
-                    id="main-div",
-                    style={"width": "100%", "margin": "auto"},
-                    children=[
-                        dmc.Tabs(
-                            [
-                                dmc.TabsList(
-                                    position="center",
-                                    children=[
-                                        dmc.Tab(
-                                            "Load data",
-                                            value="load-data",
-                                            style={"font-size": "18px"},
-                                        ),
-                                        dmc.Tab(
-                                            "Display LHC survey",
-                                            value="display-survey",
-                                            style={"font-size": "18px"},
-                                        ),
-                                        dmc.Tab(
-                                            "Display LHC optics",
-                                            value="display-optics",
-                                            style={"font-size": "18px"},
-                                        ),
-                                    ],
-                                ),
-                                dmc.TabsPanel(
-                                    children=return_load_data_layout(), value="load-data"
-                                ),
-                                dmc.TabsPanel(
-                                    children=return_LHC_survey_layout(),
-                                    value="display-survey",
-                                ),
-                                dmc.TabsPanel(
-                                    children=return_optics_layout(), value="display-optics"
-                                ),
-                            ],
-                            value="display-survey",
-                            variant="pills",
-                        ),
-                    ],
+def return_layout():
+    layout = html.Div(
+        style={"width": "80%", "margin": "auto"},
+        children=[
+            # Unique identifier of the browser session
+            dcc.Store(id="session-id", storage_type="session"),
+            # Keys of the datasets (one per beam) used by the session
+            dcc.Store(id="session-datasets", storage_type="session"),
+            # Knobs set by the session (with respect to the dataset), applied on pooled trackers
+            dcc.Store(id="session-knobs", storage_type="session"),
+            # Optics overlays of the survey that changed after the last knob update
+            dcc.Store(id="survey-optics-changed"),
+            # Indices of the survey traces replaced by tiles when zoomed out
+            dcc.Store(id="survey-rasterizable-traces"),
+            # Knob changes staged by the session, and knob changes to apply with a single twiss
+            dcc.Store(id="staged-knobs", storage_type="session"),
+            dcc.Store(id="knob-transaction"),
+            # Knob snapshots saved by the session (name, dataset, fingerprint and knobs)
+            dcc.Store(id="session-snapshots", storage_type="session"),
+            # Knob time series loaded for replay
+            dcc.Store(id="replay-series"),
+            # Knob state for which the full twiss of the optics figure is still to be computed
+            dcc.Store(id="full-twiss-request"),
+            # Version of the twiss columns displayed by the optics figure of the browser, updated
+            # along with the figure (so only once the figure has been delivered)
+            dcc.Store(id="optics-figure-version"),
+            # Interval for the logging handler
+            # dcc.Interval(id="interval1", interval=5 * 1000, n_intervals=0),
+            dmc.Header(
+                height=50,
+                children=dmc.Center(
+                    children=dmc.Text(
+                        "LHC explorer",
+                        size=30,
+                        variant="gradient",
+                        gradient={"from": "blue", "to": "green", "deg": 45},
+                    )
                 ),
-            ],
-        ),
-    ],
-)
-app.layout = layout
+                style={"margin": "auto"},
+            ),
+            # html.Iframe(id="console-out", srcDoc="", style={"width": "100%", "height": 400}),
+            dmc.Center(
+                children=[
+                    html.Div(
+                        id="main-div",
+                        style={"width": "100%", "margin": "auto"},
+                        children=[
+                            dmc.Tabs(
+                                [
+                                    dmc.TabsList(
+                                        position="center",
+                                        children=[
+                                            dmc.Tab(
+                                                "Load data",
+                                                value="load-data",
+                                                style={"font-size": "18px"},
+                                            ),
+                                            dmc.Tab(
+                                                "Display LHC survey",
+                                                value="display-survey",
+                                                style={"font-size": "18px"},
+                                            ),
+                                            dmc.Tab(
+                                                "Display LHC optics",
+                                                value="display-optics",
+                                                style={"font-size": "18px"},
+                                            ),
+                                            dmc.Tab(
+                                                "Replay knobs",
+                                                value="replay-knobs",
+                                                style={"font-size": "18px"},
+                                            ),
+                                            dmc.Tab(
+                                                "Track particles",
+                                                value="track-particles",
+                                                style={"font-size": "18px"},
+                                            ),
+                                            dmc.Tab(
+                                                "Compare datasets",
+                                                value="compare-datasets",
+                                                style={"font-size": "18px"},
+                                            ),
+                                            dmc.Tab(
+                                                "Explore tables",
+                                                value="explore-tables",
+                                                style={"font-size": "18px"},
+                                            ),
+                                        ],
+                                    ),
+                                    dmc.TabsPanel(
+                                        children=return_load_data_layout(), value="load-data"
+                                    ),
+                                    dmc.TabsPanel(
+                                        children=return_LHC_survey_layout(),
+                                        value="display-survey",
+                                    ),
+                                    dmc.TabsPanel(
+                                        children=return_optics_layout(), value="display-optics"
+                                    ),
+                                    dmc.TabsPanel(
+                                        children=return_replay_layout(), value="replay-knobs"
+                                    ),
+                                    dmc.TabsPanel(
+                                        children=return_tracking_layout(), value="track-particles"
+                                    ),
+                                    dmc.TabsPanel(
+                                        children=return_comparison_layout(),
+                                        value="compare-datasets",
+                                    ),
+                                    dmc.TabsPanel(
+                                        children=return_table_layout(), value="explore-tables"
+                                    ),
+                                ],
+                                value="display-survey",
+                                variant="pills",
+                            ),
+                        ],
+                    ),
+                ],
+            ),
+        ],
+    )
+    return layout
+
+
+# Processes spawned by the process pools do not serve the app
+if not IS_SPAWNED_PROCESS:
+    app.layout = return_layout()
 
 
 #################### App Callbacks ####################
 
 
-def parse_content(content, filename, beam=1):
+@app.callback(
+    Output("session-id", "data"),
+    Input("session-id", "modified_timestamp"),
+    State("session-id", "data"),
+)
+def initialize_session_id(modified_timestamp, session_id):
+    if session_id is None:
+        return str(uuid.uuid4())
+    return dash.no_update
+
+
+def parse_content(content, filename, beam=1, set_progress=None):
+    """Register an uploaded line in the dataset registry, and compute its dataframes. Return a
+    message and the key of the dataset (None if the file could not be processed)."""
+    if set_progress is None:
+        set_progress = lambda progress: None
     content_type, content_string = content.split(",")
     decoded = base64.b64decode(content_string)
     try:
-        if "json" in filename:
-            json_dict = json.loads(io.StringIO(decoded.decode("utf-8")).getvalue())
-            line = xt.Line.from_dict(json_dict)
-            if beam == 1:
-                (
-                    line_b1,
-                    tracker_b1,
-                    df_elements_b1,
-                    df_sv_b1,
-                    df_tw_b1,
-                    df_elements_corrected_b1,
-                ) = loading_functions.return_all_loaded_variables(
-                    save_path=None, force_load=False, correct_x_axis=True, line_path=None, line=line
-                )
-            else:
-                (
-                    line_b4,
-                    tracker_b4,
-                    df_elements_b4,
-                    df_sv_b4,
-                    df_tw_b4,
-                    df_elements_corrected_b4,
-                ) = loading_functions.return_all_loaded_variables(
-                    save_path=None, force_load=False, correct_x_axis=True, line_path=None, line=line
-                )
+        if "json" not in filename:
+            raise ValueError(f"File {filename} is not a json file")
+
+        # Check that the file contains a line before saving it
+        set_progress((10, "Reading line"))
+        xt.Line.from_dict(json.loads(io.StringIO(decoded.decode("utf-8")).getvalue()))
+
+        # Identical uploads (from any session) share the same dataset
+        set_progress((30, "Computing survey and twiss"))
+        dataset_key = registry_functions.register_uploaded_content(decoded, beam_2=beam == 2)
+
+        # The job runs in a separate process: the dataset (dataframes, survey structures and
+        # tiles) is saved, and loaded by the workers when first used
+        registry_functions.prepare_uploaded_dataset(dataset_key, set_progress=set_progress)
+        set_progress((100, "Done"))
 
     except Exception as e:
         print(e)
-        return html.Div(["There was an error processing this file."])
+        return html.Div(["There was an error processing this file."]), None
+
+    return html.Div([f"File {filename} has been loaded for beam {beam}."]), dataset_key
 
 
 # @app.callback(
@@ -401,187 +905,829 @@ def parse_content(content, filename, beam=1):
 
 @app.callback(
     Output("output-default-data", "children"),
+    Output("session-datasets", "data"),
+    Output("session-knobs", "data", allow_duplicate=True),
     Input("reload-default-button", "n_clicks"),
+    State("session-id", "data"),
+    prevent_initial_call=True,
 )
-def reload_default_config(n_clicks):
-    if n_clicks is not None:
-        load_default_config()
+def reload_default_config(n_clicks, session_id):
+    # Rebuild the default datasets from their files, and use them in the session with their
+    # original knobs
+    for dataset_key in DIC_DEFAULT_DATASET_KEYS.values():
+        registry_functions.reload_dataset(dataset_key)
+    if session_id is not None:
+        coalescing_functions.reset_knob_requests(session_id)
 
-    return dash.no_update
+    return (
+        html.Div(["The default configuration has been reloaded."]),
+        dict(DIC_DEFAULT_DATASET_KEYS),
+        {},
+    )
+
+
+def update_session_datasets(set_progress, content, name, beam, dic_session_datasets, session_id):
+    """Load an uploaded file and use the corresponding dataset for the given beam of the
+    session (with its original knobs)."""
+    message, dataset_key = parse_content(content, name, beam=beam, set_progress=set_progress)
+    if dataset_key is None:
+        return message, dash.no_update, dash.no_update
+    if session_id is not None:
+        coalescing_functions.reset_knob_requests(session_id)
+
+    dic_session_datasets = dict(
+        DIC_DEFAULT_DATASET_KEYS if dic_session_datasets is None else dic_session_datasets
+    )
+    dic_session_datasets["beam_" + str(beam)] = dataset_key
+    return message, dic_session_datasets, {}
 
 
 @app.callback(
     Output("output-data-upload-1", "children"),
+    Output("session-datasets", "data", allow_duplicate=True),
+    Output("session-knobs", "data", allow_duplicate=True),
     Input("upload-json-beam-1", "contents"),
     State("upload-json-beam-1", "filename"),
+    State("session-datasets", "data"),
+    State("session-id", "data"),
+    background=True,
+    running=[
+        (Output("button-upload-beam-1", "disabled"), True, False),
+        (Output("cancel-upload-beam-1", "disabled"), False, True),
+    ],
+    progress=[
+        Output("upload-progress-beam-1", "value"),
+        Output("upload-progress-beam-1", "label"),
+    ],
+    cancel=[Input("cancel-upload-beam-1", "n_clicks")],
+    prevent_initial_call=True,
 )
-def update_output_beam_1(content, name):
+def update_output_beam_1(set_progress, content, name, dic_session_datasets, session_id):
     if content is not None:
-        return parse_content(content, name, beam=1)
+        return update_session_datasets(
+            set_progress, content, name, 1, dic_session_datasets, session_id
+        )
     else:
-        return dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update
 
 
 @app.callback(
     Output("output-data-upload-2", "children"),
+    Output("session-datasets", "data", allow_duplicate=True),
+    Output("session-knobs", "data", allow_duplicate=True),
     Input("upload-json-beam-2", "contents"),
     State("upload-json-beam-2", "filename"),
+    State("session-datasets", "data"),
+    State("session-id", "data"),
+    background=True,
+    running=[
+        (Output("button-upload-beam-2", "disabled"), True, False),
+        (Output("cancel-upload-beam-2", "disabled"), False, True),
+    ],
+    progress=[
+        Output("upload-progress-beam-2", "value"),
+        Output("upload-progress-beam-2", "label"),
+    ],
+    cancel=[Input("cancel-upload-beam-2", "n_clicks")],
+    prevent_initial_call=True,
 )
-def update_output_beam_2(content, name):
+def update_output_beam_2(set_progress, content, name, dic_session_datasets, session_id):
     if content is not None:
-        return parse_content(content, name, beam=2)
+        return update_session_datasets(
+            set_progress, content, name, 2, dic_session_datasets, session_id
+        )
     else:
-        return dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update
 
 
 @app.callback(
     Output("LHC-layout", "figure"),
+    Output("survey-rasterizable-traces", "data"),
     Input("chips-ip", "value"),
+    Input("session-datasets", "data"),
+    State("session-knobs", "data"),
 )
-def update_graph_LHC_layout(l_values):
-    l_indices_to_keep = []
-    for val in l_values:
-        str_ind_1, str_ind_2 = val.split("-")
-        # Get indices of elements to keep (# ! implemented only for beam 1)
-        l_indices_to_keep.extend(
-            loading_functions.get_indices_of_interest(df_tw_b1, "ip" + str_ind_1, "ip" + str_ind_2)
+def update_graph_LHC_layout(l_values, dic_session_datasets, dic_knobs):
+    # (# ! implemented only for beam 1)
+    dataset_b1, dataset_b4 = return_session_datasets(dic_session_datasets)
+    survey_state = registry_functions.return_survey_state(dataset_b1, dic_knobs)
+    fig = plotting_functions.return_plot_lattice_with_tracking(
+        dataset_b1["df_sv"],
+        survey_state["dic_store"],
+        dataset_b1["df_tw"],
+        df_sv_4=dataset_b4["df_sv"],
+        df_tw_4=dataset_b4["df_tw"],
+        l_sectors_to_keep=l_values,
+        projection_basis=survey_state["projection_basis"],
+        projection_basis_4=dataset_b4["projection_basis"],
+    )
+
+    # Display the whole ring with tiles instead of vector traces, if they are already available
+    # and match the multipole strengths of the knob state
+    l_indices_rasterizable = plotting_functions.return_indices_rasterizable_traces(fig)
+    tile_pyramid = registry_functions.return_survey_tile_pyramid(dataset_b1, survey_state)
+    if tile_pyramid is not None:
+        for idx_trace in l_indices_rasterizable:
+            fig.data[idx_trace].visible = False
+        fig.update_layout(
+            images=raster_functions.return_layout_images(
+                tile_pyramid,
+                ["ring"] + l_values,
+                fig.layout.xaxis.range,
+                fig.layout.yaxis.range,
+            )
         )
 
-    fig = plotting_functions.return_plot_lattice_with_tracking(
-        df_sv_b1,
-        df_elements_corrected_b1,
-        df_tw_b1,
-        df_sv_4=df_sv_b4,
-        df_tw_4=df_tw_b4,
-        l_indices_to_keep=l_indices_to_keep,
+    return fig, l_indices_rasterizable
+
+
+@app.callback(
+    Output("LHC-layout", "figure", allow_duplicate=True),
+    Input("LHC-layout", "relayoutData"),
+    State("chips-ip", "value"),
+    State("survey-rasterizable-traces", "data"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
+    prevent_initial_call=True,
+)
+def update_tiles_graph_LHC_layout(
+    relayoutData, l_values, l_indices_rasterizable, dic_session_datasets, dic_knobs
+):
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    tile_pyramid = registry_functions.return_survey_tile_pyramid(
+        dataset_b1, registry_functions.return_survey_state(dataset_b1, dic_knobs)
+    )
+    if relayoutData is None or l_indices_rasterizable is None:
+        return dash.no_update
+
+    # Only display the vector traces if the tiles are not available, or do not match the knob state
+    if tile_pyramid is None:
+        patched_fig = Patch()
+        for idx_trace in l_indices_rasterizable:
+            patched_fig["data"][idx_trace]["visible"] = True
+        patched_fig["layout"]["images"] = []
+        return patched_fig
+
+    # Get visible range (whole ring if not zoomed)
+    x_min, x_max, z_min, z_max = tile_pyramid["bounds"]
+    x_range = [
+        relayoutData.get("xaxis.range[0]", x_min),
+        relayoutData.get("xaxis.range[1]", x_max),
+    ]
+    y_range = [
+        relayoutData.get("yaxis.range[0]", z_min),
+        relayoutData.get("yaxis.range[1]", z_max),
+    ]
+
+    # Switch to vector traces below the zoom threshold, and to tiles otherwise
+    display_vector = abs(x_range[1] - x_range[0]) < raster_functions.VECTOR_SPAN_THRESHOLD
+    patched_fig = Patch()
+    for idx_trace in l_indices_rasterizable:
+        patched_fig["data"][idx_trace]["visible"] = display_vector
+    patched_fig["layout"]["images"] = (
+        []
+        if display_vector
+        else raster_functions.return_layout_images(
+            tile_pyramid, ["ring"] + l_values, x_range, y_range
+        )
     )
 
-    return fig
+    return patched_fig
+
+
+@app.callback(
+    Output("LHC-layout", "figure", allow_duplicate=True),
+    Input("survey-optics-changed", "data"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
+    prevent_initial_call=True,
+)
+def update_optics_graph_LHC_layout(l_types_trace_changed, dic_session_datasets, dic_knobs):
+    # Only send the optics overlays of the survey that changed after a knob update
+    if not l_types_trace_changed:
+        return dash.no_update
+
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    patched_fig = Patch()
+    for idx_trace, (x, y) in plotting_functions.return_survey_optics_updates(
+        registry_functions.return_survey_state(dataset_b1, dic_knobs)["projection_basis"],
+        l_types_trace_changed
+    ).items():
+        patched_fig["data"][idx_trace]["x"] = x
+        patched_fig["data"][idx_trace]["y"] = y
+
+    return patched_fig
+
+
+@app.callback(
+    Output("knob-select", "data"),
+    Output("matching-knobs", "data"),
+    Input("session-datasets", "data"),
+    prevent_initial_call=True,
+)
+def update_knob_select(dic_session_datasets):
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    # Only the independent knobs can be set
+    l_knobs = dataset_b1["knob_catalog"]["l_knobs"]
+    return l_knobs, l_knobs
 
 
 @app.callback(
     Output("knob-input", "value"),
     Input("knob-select", "value"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
 )
-def update_knob_input(value):
-    return tracker_b1.vars[value]._value
+def update_knob_input(value, dic_session_datasets, dic_knobs):
+    # Knobs not set by the session keep the value of the (never modified) dataset tracker
+    if dic_knobs is not None and value in dic_knobs:
+        return dic_knobs[value]
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    return dataset_b1["tracker"].vars[value]._value
+
+
+def return_latency_text(latency, mode, omp_num_threads):
+    """Return the text reporting the time taken by a twiss, and the number of threads of the
+    tracker it was computed on."""
+    if latency is None:
+        return f"Twiss ({mode}) loaded from cache"
+    return f"Twiss ({mode}) computed in {latency:.2f} s ({omp_num_threads} thread(s))"
+
+
+def return_x_range_around_IP(triggered_id):
+    """Return the s-range to display in the optics figure for a given zoom button."""
+    match triggered_id:
+        case "display-ring-button":
+            return [0, 26658.8832]
+        case "display-ir1-button":
+            return [16247.725780457391, 23675.296424202796]
+        case "display-ir5-button":
+            return [2833.530005905868, 10407.388328867295]
+        case _:
+            return [0, 26658.8832]
 
 
 @app.callback(
-    Output("LHC-2D-near-IP", "figure"),
-    Output("LHC-2D-near-IP", "relayoutData"),
-    Input("update-knob-button", "n_clicks"),
-    Input("display-ring-button", "n_clicks"),
-    Input("display-ir1-button", "n_clicks"),
-    Input("display-ir5-button", "n_clicks"),
+    Output("staged-knobs", "data"),
+    Output("knob-transaction-message", "children"),
+    Input("stage-knob-button", "n_clicks"),
+    Input("clear-knobs-button", "n_clicks"),
+    Input("upload-knobs", "contents"),
+    State("upload-knobs", "filename"),
+    State("knob-select", "value"),
     State("knob-input", "value"),
+    State("staged-knobs", "data"),
+    State("session-datasets", "data"),
+    prevent_initial_call=True,
+)
+def update_staged_knobs(
+    n_click_stage,
+    n_click_clear,
+    content,
+    filename,
+    knob,
+    knob_value,
+    dic_staged,
+    dic_session_datasets,
+):
+    # Stage knob changes, to be applied together with a single twiss
+    dic_staged = {} if dic_staged is None else dict(dic_staged)
+    if ctx.triggered_id == "clear-knobs-button":
+        return {}, ""
+    elif ctx.triggered_id == "upload-knobs":
+        if content is None:
+            return dash.no_update, dash.no_update
+        try:
+            dic_changes = knob_functions.parse_knob_file(content, filename)
+        except ValueError as e:
+            # Invalid encoding, json or csv content
+            return (
+                dash.no_update,
+                f"The file {filename} could not be read ({type(e).__name__}: {e}).",
+            )
+    else:
+        dic_changes = {knob: knob_value}
+
+    # Only stage the knobs that exist in the dataset, with a valid value
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    dic_valid_changes, l_errors = knob_functions.validate_knob_changes(
+        dataset_b1["tracker"], dic_changes
+    )
+    dic_staged.update(dic_valid_changes)
+    return dic_staged, "; ".join(l_errors)
+
+
+@app.callback(
+    Output("staged-knobs-text", "children"),
+    Input("staged-knobs", "data"),
+)
+def display_staged_knobs(dic_staged):
+    if not dic_staged:
+        return dmc.Text("No staged knob.", size="sm", color="dimmed")
+    return [
+        dmc.Text(f"Staged: {knob} = {value}", size="sm") for knob, value in dic_staged.items()
+    ]
+
+
+@app.callback(
+    Output("knob-transaction", "data"),
+    Output("staged-knobs", "data", allow_duplicate=True),
+    Output("knob-transaction-message", "children", allow_duplicate=True),
+    Input("update-knob-button", "n_clicks"),
+    Input("commit-knobs-button", "n_clicks"),
     State("knob-select", "value"),
+    State("knob-input", "value"),
+    State("staged-knobs", "data"),
+    State("session-datasets", "data"),
+    prevent_initial_call=True,
+)
+def commit_knob_transaction(
+    n_click_update, n_click_commit, knob, knob_value, dic_staged, dic_session_datasets
+):
+    # Either update the selected knob alone, or commit all the staged knobs at once
+    if ctx.triggered_id == "commit-knobs-button":
+        dic_changes = {} if dic_staged is None else dic_staged
+    else:
+        dic_changes = {knob: knob_value}
+    if len(dic_changes) == 0:
+        return dash.no_update, dash.no_update, "No knob to commit."
+
+    # The whole transaction is rejected if any change is invalid
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    dic_valid_changes, l_errors = knob_functions.validate_knob_changes(
+        dataset_b1["tracker"], dic_changes
+    )
+    if len(l_errors) > 0:
+        return dash.no_update, dash.no_update, "; ".join(l_errors)
+
+    # Staged knobs are cleared once committed
+    return (
+        {"changes": dic_valid_changes, "id": str(uuid.uuid4())},
+        {} if ctx.triggered_id == "commit-knobs-button" else dash.no_update,
+        "",
+    )
+
+
+@app.callback(
+    Output("session-snapshots", "data"),
+    Output("knob-transaction-message", "children", allow_duplicate=True),
+    Input("save-snapshot-button", "n_clicks"),
+    State("snapshot-name", "value"),
+    State("session-snapshots", "data"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
+    prevent_initial_call=True,
+)
+def save_snapshot(n_click_save, name, dic_snapshots, dic_session_datasets, dic_knobs):
+    if name is None or name.strip() == "":
+        return dash.no_update, "Please provide a name for the snapshot."
+
+    # The snapshot is kept by the session (as the knobs that differ from the default), so that it
+    # remains available as long as the session
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    dic_snapshots = {} if dic_snapshots is None else dict(dic_snapshots)
+    dic_snapshots[name.strip()] = {
+        "dataset_key": dataset_b1["key"],
+        **snapshot_functions.return_snapshot(dataset_b1["knob_catalog"], dic_knobs),
+    }
+    return dic_snapshots, ""
+
+
+@app.callback(
+    Output("snapshot-select", "data"),
+    Output("snapshot-compare-select", "data"),
+    Input("session-snapshots", "data"),
+    Input("session-datasets", "data"),
+)
+def update_snapshot_select(dic_snapshots, dic_session_datasets):
+    # Only the snapshots of the current dataset can be restored
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    l_names = [
+        name
+        for name, snapshot in ({} if dic_snapshots is None else dic_snapshots).items()
+        if snapshot["dataset_key"] == dataset_b1["key"]
+    ]
+    return l_names, [{"value": "__current__", "label": "Current knobs"}] + l_names
+
+
+def return_snapshot_vector(dataset, dic_snapshots, name, dic_knobs):
+    """Return the knob vector of a snapshot of the session (the current knob state if no snapshot
+    is selected), or None if it is not known."""
+    if name is None or name == "__current__":
+        return snapshot_functions.return_knob_vector(dataset["knob_catalog"], dic_knobs)
+    if dic_snapshots is None or name not in dic_snapshots:
+        return None
+    return snapshot_functions.return_snapshot_vector(dataset["knob_catalog"], dic_snapshots[name])
+
+
+@app.callback(
+    Output("snapshot-diff-text", "children"),
+    Input("snapshot-select", "value"),
+    Input("snapshot-compare-select", "value"),
+    Input("session-knobs", "data"),
+    State("session-snapshots", "data"),
+    State("session-datasets", "data"),
+)
+def display_snapshot_diff(name, name_compare, dic_knobs, dic_snapshots, dic_session_datasets):
+    if name is None:
+        return ""
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    vector = return_snapshot_vector(dataset_b1, dic_snapshots, name, dic_knobs)
+    vector_compare = return_snapshot_vector(dataset_b1, dic_snapshots, name_compare, dic_knobs)
+    if vector is None or vector_compare is None:
+        return dmc.Text("Snapshot not available.", size="sm", color="red")
+
+    dic_diff = snapshot_functions.return_snapshot_diff(
+        dataset_b1["knob_catalog"], vector, vector_compare
+    )
+    if len(dic_diff) == 0:
+        return dmc.Text("No difference.", size="sm", color="dimmed")
+    l_texts = [
+        dmc.Text(f"{knob}: {value} → {value_compare}", size="sm")
+        for knob, (value, value_compare) in list(dic_diff.items())[
+            : snapshot_functions.MAX_DISPLAYED_DIFFERENCES
+        ]
+    ]
+    if len(dic_diff) > snapshot_functions.MAX_DISPLAYED_DIFFERENCES:
+        l_texts.append(
+            dmc.Text(
+                f"... and {len(dic_diff) - snapshot_functions.MAX_DISPLAYED_DIFFERENCES} more.",
+                size="sm",
+                color="dimmed",
+            )
+        )
+    return l_texts
+
+
+@app.callback(
+    Output("knob-transaction", "data", allow_duplicate=True),
+    Output("knob-transaction-message", "children", allow_duplicate=True),
+    Input("restore-snapshot-button", "n_clicks"),
+    State("snapshot-select", "value"),
+    State("session-snapshots", "data"),
+    State("session-datasets", "data"),
+    prevent_initial_call=True,
+)
+def restore_snapshot(n_click_restore, name, dic_snapshots, dic_session_datasets):
+    if name is None:
+        return dash.no_update, "Please select a snapshot to restore."
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    vector = return_snapshot_vector(dataset_b1, dic_snapshots, name, None)
+    if vector is None:
+        return dash.no_update, f"The snapshot {name} is not available."
+
+    # The whole knob state is replaced, but only the knobs that differ from the ones currently set
+    # on the tracker are changed before the twiss is recomputed
+    return (
+        {
+            "changes": snapshot_functions.return_knobs_from_vector(
+                dataset_b1["knob_catalog"], vector
+            ),
+            "restore": True,
+            "id": str(uuid.uuid4()),
+        },
+        "",
+    )
+
+
+@app.callback(
+    Output("knob-transaction", "data", allow_duplicate=True),
+    Output("matching-message", "children"),
+    Input("match-button", "n_clicks"),
+    *[State(f"match-{target}", "value") for target in matching_functions.L_MATCHING_TARGETS],
+    State("matching-knobs", "value"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
+    background=True,
+    running=[
+        (Output("match-button", "disabled"), True, False),
+        (Output("cancel-match-button", "disabled"), False, True),
+    ],
+    progress=[Output("matching-progress", "value"), Output("matching-progress", "label")],
+    cancel=[Input("cancel-match-button", "n_clicks")],
+    prevent_initial_call=True,
+)
+def run_matching(
+    set_progress,
+    n_click_match,
+    qx,
+    qy,
+    dqx,
+    dqy,
+    l_knobs,
+    dic_session_datasets,
+    dic_knobs,
+):
+    # Only match the quantities for which a value is requested
+    dic_targets = {
+        target: value
+        for target, value in zip(matching_functions.L_MATCHING_TARGETS, [qx, qy, dqx, dqy])
+        if value is not None and value != ""
+    }
+    if len(dic_targets) == 0:
+        return dash.no_update, "Please provide at least one target value."
+    if not l_knobs or len(l_knobs) < len(dic_targets):
+        return dash.no_update, "Please vary at least as many knobs as there are targets."
+
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    _, l_errors = knob_functions.validate_knob_changes(
+        dataset_b1["tracker"], {knob: 0.0 for knob in l_knobs}
+    )
+    if len(l_errors) > 0:
+        return dash.no_update, "; ".join(l_errors)
+
+    def callback_progress(iteration, residual):
+        set_progress(
+            (
+                100 * (iteration + 1) / matching_functions.MAX_MATCHING_ITERATIONS,
+                f"Iteration {iteration + 1} (residual {residual:.2g} tolerance(s))",
+            )
+        )
+
+    dic_matched_knobs, dic_reached, n_twiss, converged = matching_functions.match_knobs(
+        dataset_b1,
+        {} if dic_knobs is None else dic_knobs,
+        dic_targets,
+        l_knobs,
+        callback_progress=callback_progress,
+    )
+    set_progress((100, "Done"))
+    message = ", ".join(f"{target} = {value:.5g}" for target, value in dic_reached.items())
+    if not converged:
+        return dash.no_update, f"Matching did not converge after {n_twiss} twiss ({message})."
+
+    # Apply the matched knobs to the session like any other knob change
+    return (
+        {"changes": dic_matched_knobs, "id": str(uuid.uuid4())},
+        f"Matched in {n_twiss} twiss: {message}.",
+    )
+
+
+@app.callback(
+    Output("LHC-2D-near-IP", "figure"),
+    Output("survey-optics-changed", "data"),
+    Output("session-knobs", "data"),
+    Output("twiss-latency", "children"),
+    Output("full-twiss-request", "data"),
+    Output("optics-figure-version", "data"),
+    Input("knob-transaction", "data"),
+    Input("session-datasets", "data"),
     State("LHC-2D-near-IP", "relayoutData"),
-    State("LHC-2D-near-IP", "figure"),
+    State("session-id", "data"),
+    State("session-knobs", "data"),
+    State("optics-figure-version", "data"),
+    background=True,
+    # The update button remains enabled, as a new update supersedes the one in progress
+    running=[(Output("cancel-knob-button", "disabled"), False, True)],
+    progress=[Output("knob-progress", "value"), Output("knob-progress", "label")],
+    cancel=[Input("cancel-knob-button", "n_clicks")],
     prevent_initial_call=False,
 )
 def update_graph_LHC_2D(
-    n_click_knob, n_click_whole_ring, n_click_ir1, n_click_ir5, knob_value, knob, relayoutData, fig
+    set_progress,
+    dic_transaction,
+    dic_session_datasets,
+    relayoutData,
+    session_id,
+    dic_knobs,
+    figure_version,
 ):
-    # Prevent problems if figure is not defined for any reason
-    # if fig is None:
-    #    return dash.no_update
+    # The figure itself is never sent back by the browser: it is rebuilt from the twiss, and
+    # only the (small) relayoutData is used to preserve the current zoom level
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+
+    # A new dataset (e.g. after an upload) is displayed as a whole, with its original knobs
+    if ctx.triggered_id == "session-datasets":
+        dic_transaction = None
+        dic_knobs = {}
+
+    # Apply the (validated) knob changes of the transaction, if any (not on the initial call)
+    dic_previous_knobs = {} if dic_knobs is None else dic_knobs
+    dic_knobs = dict(dic_previous_knobs)
+    request_id = None
+    if dic_transaction is not None:
+        # A restored snapshot replaces the whole knob state
+        if dic_transaction.get("restore", False):
+            dic_knobs = dict(dic_transaction["changes"])
+        else:
+            dic_knobs.update(dic_transaction["changes"])
+
+        # Coalesce rapid updates: the knobs are set on top of the latest state requested by the
+        # session, and, while the previous update is still being computed, the update is dropped
+        # if a newer one arrives in the meantime (the previous jobs of the session are also
+        # terminated when a new one starts)
+        if session_id is not None:
+            request_id, dic_knobs = coalescing_functions.register_knob_request(
+                session_id,
+                dic_previous_knobs,
+                dic_changes=dic_transaction["changes"],
+                replace=dic_transaction.get("restore", False),
+            )
+            if coalescing_functions.wait_for_newer_knob_request(session_id, request_id):
+                raise PreventUpdate
+
+    # Compute the twiss on a tracker set to the knob state of the session, without interfering
+    # with the other sessions, unless any worker already computed this knob state. The trackers
+    # live in the tracker server of the worker, so that they remain warm across the background
+    # jobs: everything else that must outlive the job is shared through the disk cache.
+    # Only the fast twiss is computed here, the full one being deferred to another job.
+    set_progress((10, "Computing twiss"))
+    fingerprint = registry_functions.return_knob_fingerprint(dataset_b1, dic_knobs)
+    previous_survey_state = registry_functions.return_cached_survey_state(
+        dataset_b1, dic_previous_knobs
+    )
+    tw_b1 = cache_functions.return_twiss(dataset_b1["key"], fingerprint, mode="fast")
+    latency = None
+    omp_num_threads = None
+    survey_state = registry_functions.return_cached_survey_state(dataset_b1, dic_knobs)
+    if tw_b1 is not None and survey_state is not None:
+        l_types_trace_changed = registry_functions.return_changed_optics_overlays(
+            survey_state, previous_survey_state
+        )
+    else:
+        tw_b1, latency, omp_num_threads = registry_functions.return_twiss(
+            dataset_b1, dic_knobs, mode="fast"
+        )
+        set_progress((70, "Updating survey"))
+
+        # Refresh the multipole strengths displayed in the survey, the index of their endpoints,
+        # and the optics overlays of the survey that changed
+        survey_state, l_types_trace_changed = registry_functions.return_survey_state_from_twiss(
+            dataset_b1, dic_knobs, tw_b1, previous_survey_state=previous_survey_state
+        )
+        registry_functions.store_survey_state(dataset_b1, dic_knobs, survey_state)
+
+    # The result of a superseded update is never sent
+    if request_id is not None:
+        coalescing_functions.finish_knob_request(session_id, request_id)
+        if not coalescing_functions.is_latest_knob_request(session_id, request_id):
+            raise PreventUpdate
+    set_progress((90, "Updating figure"))
+
+    # Request the full twiss (for the chromatic quantities of the title) if it is not known yet
+    full_twiss_available = all(
+        scalar in tw_b1 for scalar in loading_functions.L_PLOTTED_TWISS_SCALARS
+    )
+    latency_text = return_latency_text(
+        latency, "full" if full_twiss_available else "fast", omp_num_threads
+    )
+    full_twiss_request = (
+        dash.no_update if full_twiss_available else {"knobs": dic_knobs, "request_id": request_id}
+    )
 
-    # Update knob if needed
-    tracker_b1.vars[knob] = knob_value
-    tw_b1 = tracker_b1.twiss()
+    # If the browser displays the figure of the same dataset, only send the traces that changed
+    # with respect to the columns it displays. The version of these columns is only updated by
+    # the browser along with the figure, so that an update that is cancelled or superseded before
+    # being delivered is never taken as reference.
+    new_figure_version = str(uuid.uuid4())
+    columns_around_IP = (
+        cache_functions.return_columns_around_IP(figure_version)
+        if dic_transaction is not None and figure_version is not None
+        else None
+    )
+    if columns_around_IP is not None and columns_around_IP[0] == dataset_b1["key"]:
+        (
+            dic_updated_traces,
+            dic_columns_around_IP,
+        ) = plotting_functions.return_updated_columns_around_IP(tw_b1, columns_around_IP[1])
+        cache_functions.store_columns_around_IP(
+            new_figure_version, dataset_b1["key"], dic_columns_around_IP
+        )
 
-    if ctx.triggered_id == "update-knob-button" or ctx.triggered_id is None:
+        patched_fig = Patch()
+        for idx_trace, y in dic_updated_traces.items():
+            patched_fig["data"][idx_trace]["y"] = y
+        patched_fig["layout"]["title"]["text"] = plotting_functions.return_title_around_IP(tw_b1)
+        set_progress((100, "Done"))
+        return (
+            patched_fig,
+            l_types_trace_changed,
+            dic_knobs,
+            latency_text,
+            full_twiss_request,
+            new_figure_version,
+        )
+
+    # Otherwise, send the whole figure (built by any worker, if this knob state is known with a
+    # full twiss)
+    fig = (
+        cache_functions.return_figure("around_IP", dataset_b1["key"], fingerprint)
+        if full_twiss_available
+        else None
+    )
+    if fig is None:
         fig = plotting_functions.plot_around_IP(tw_b1)
 
-        # Update figure ranges according to relayoutData
-        if relayoutData is not None:
-            fig["layout"]["xaxis"]["range"] = [
-                relayoutData["xaxis.range[0]"],
-                relayoutData["xaxis.range[1]"],
-            ]
-            fig["layout"]["xaxis2"]["range"] = [
-                relayoutData["xaxis2.range[0]"],
-                relayoutData["xaxis2.range[1]"],
-            ]
-            fig["layout"]["xaxis3"]["range"] = [
-                relayoutData["xaxis3.range[0]"],
-                relayoutData["xaxis3.range[1]"],
-            ]
-            fig["layout"]["xaxis"]["autorange"] = False
+        # Update title position
+        fig["layout"]["title"]["x"] = 0.3
+        if full_twiss_available:
+            cache_functions.store_figure("around_IP", dataset_b1["key"], fingerprint, fig)
+        fig = fig.to_dict()
+
+    # Update figure ranges according to relayoutData
+    if relayoutData is not None:
+        for axis in ["xaxis", "xaxis2", "xaxis3"]:
+            if axis + ".range[0]" in relayoutData and axis + ".range[1]" in relayoutData:
+                fig["layout"].setdefault(axis, {})["range"] = [
+                    relayoutData[axis + ".range[0]"],
+                    relayoutData[axis + ".range[1]"],
+                ]
+                fig["layout"][axis]["autorange"] = False
+
+    # Keep the columns sent, as reference for the next updates once the browser displays them
+    cache_functions.store_columns_around_IP(
+        new_figure_version, dataset_b1["key"], plotting_functions.return_columns_around_IP(tw_b1)
+    )
 
-    else:
-        # Update zoom level depending on button clicked
-        match ctx.triggered_id:
-            case "display-ring-button":
-                x, y = [0, 26658.8832]
-            case "display-ir1-button":
-                x, y = [16247.725780457391, 23675.296424202796]
-            case "display-ir5-button":
-                x, y = [2833.530005905868, 10407.388328867295]
-            case _:
-                x, y = [0, 26658.8832]
-
-        # Update figure ranges
-        if "range" in fig["layout"]["xaxis"]:
-            fig["layout"]["xaxis"]["range"] = [x, y]
-            fig["layout"]["xaxis"]["autorange"] = False
-        else:
-            fig["layout"]["xaxis"] = {"range": [x, y], "autorange": False}
+    set_progress((100, "Done"))
+    return (
+        fig,
+        l_types_trace_changed,
+        dic_knobs,
+        latency_text,
+        full_twiss_request,
+        new_figure_version,
+    )
 
-        if "range" in fig["layout"]["xaxis2"]:
-            fig["layout"]["xaxis2"]["range"] = [x, y]
-            fig["layout"]["xaxis2"]["autorange"] = False
-        else:
-            fig["layout"]["xaxis2"] = {"range": [x, y]}
-            fig["layout"]["xaxis2"] = {"range": [x, y], "autorange": False}
 
-        if "range" in fig["layout"]["xaxis3"]:
-            fig["layout"]["xaxis3"]["range"] = [x, y]
-            fig["layout"]["xaxis3"]["autorange"] = False
-        else:
-            fig["layout"]["xaxis3"] = {"range": [x, y]}
-            fig["layout"]["xaxis3"] = {"range": [x, y], "autorange": False}
+@app.callback(
+    Output("LHC-2D-near-IP", "figure", allow_duplicate=True),
+    Output("twiss-latency", "children", allow_duplicate=True),
+    Input("full-twiss-request", "data"),
+    State("session-id", "data"),
+    State("session-datasets", "data"),
+    background=True,
+    prevent_initial_call=True,
+)
+def update_title_graph_LHC_2D(dic_request, session_id, dic_session_datasets):
+    # Complete the title of the optics figure with the quantities of the full twiss
+    if dic_request is None:
+        raise PreventUpdate
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    tw_b1, latency, omp_num_threads = registry_functions.return_twiss(
+        dataset_b1, dic_request["knobs"], mode="full"
+    )
+
+    # Drop the result if the knobs of the session changed in the meantime
+    if dic_request["request_id"] is not None and not coalescing_functions.is_latest_knob_request(
+        session_id, dic_request["request_id"]
+    ):
+        raise PreventUpdate
+
+    patched_fig = Patch()
+    patched_fig["layout"]["title"]["text"] = plotting_functions.return_title_around_IP(tw_b1)
+    return patched_fig, return_latency_text(latency, "full", omp_num_threads)
+
+
+@app.callback(
+    Output("LHC-2D-near-IP", "figure", allow_duplicate=True),
+    Output("LHC-2D-near-IP", "relayoutData"),
+    Input("display-ring-button", "n_clicks"),
+    Input("display-ir1-button", "n_clicks"),
+    Input("display-ir5-button", "n_clicks"),
+    prevent_initial_call=True,
+)
+def update_range_graph_LHC_2D(n_click_whole_ring, n_click_ir1, n_click_ir5):
+    # Update zoom level depending on button clicked
+    x, y = return_x_range_around_IP(ctx.triggered_id)
+
+    # Only send the range update to the browser, not the whole figure
+    patched_fig = Patch()
+    relayoutData = {}
+    for axis in ["xaxis", "xaxis2", "xaxis3"]:
+        patched_fig["layout"][axis]["range"] = [x, y]
+        patched_fig["layout"][axis]["autorange"] = False
 
         # Update relayoutData as well
-        if relayoutData is not None:
-            relayoutData["xaxis.range[0]"] = x
-            relayoutData["xaxis.range[1]"] = y
-            relayoutData["xaxis2.range[0]"] = x
-            relayoutData["xaxis2.range[1]"] = y
-            relayoutData["xaxis3.range[0]"] = x
-            relayoutData["xaxis3.range[1]"] = y
+        relayoutData[axis + ".range[0]"] = x
+        relayoutData[axis + ".range[1]"] = y
+
+    return patched_fig, relayoutData
+
+
+def return_element_text(l_knobs):
+    """Return the description of the knobs acting on a multipole (or IP)."""
+    text = []
+    for dic_knob in l_knobs:
+        text.append(dmc.Text("Name: ", weight=500))
+        text.append(dmc.Text(dic_knob["name"], size="sm"))
+        text.append(dmc.Text("Element value: ", weight=500))
+        text.append(dmc.Text(dic_knob["value"], size="sm"))
+        text.append(dmc.Text("Expression: ", weight=500))
+        text.append(dmc.Text(dic_knob["expression"], size="sm"))
+        text.append(dmc.Text("Dependencies: ", weight=500))
+        text.append(dmc.Text(dic_knob["dependencies"], size="sm"))
+        text.append(dmc.Text("Targets: ", weight=500))
+        targets = dic_knob["targets"]
+        if len(targets) > 10:
+            text.append(
+                dmc.Text(str(targets[:10]), size="sm"),
+            )
+            text.append(dmc.Text("...", size="sm"))
         else:
-            relayoutData = {
-                "xaxis.range[0]": x,
-                "xaxis.range[1]": y,
-                "xaxis2.range[0]": x,
-                "xaxis2.range[1]": y,
-                "xaxis3.range[0]": x,
-                "xaxis3.range[1]": y,
-            }
-
-    # Update title
-    fig["layout"]["title"]["text"] = (
-        r"$q_x = "
-        + f'{tw_b1["qx"]:.5f}'
-        + r"\hspace{0.5cm}"
-        + r" q_y = "
-        + f'{tw_b1["qy"]:.5f}'
-        + r"\hspace{0.5cm}"
-        + r"Q'_x = "
-        + f'{tw_b1["dqx"]:.2f}'
-        + r"\hspace{0.5cm}"
-        + r" Q'_y = "
-        + f'{tw_b1["dqy"]:.2f}'
-        + r"\hspace{0.5cm}"
-        + r" \gamma_{tr} = "
-        + f'{1/np.sqrt(tw_b1["momentum_compaction_factor"]):.2f}'
-        + r"$"
-    )
-
-    fig["layout"]["title"]["x"] = 0.3
-    return fig, relayoutData
+            text.append(dmc.Text(str(targets), size="sm"))
+
+    return text
 
 
 @app.callback(
@@ -589,67 +1735,28 @@ def update_graph_LHC_2D(
     Output("title-element", "children"),
     Output("type-element", "children"),
     Input("LHC-layout", "clickData"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
     prevent_initial_call=False,
 )
-def update_text_graph_LHC_2D(clickData):
+def update_text_graph_LHC_2D(clickData, dic_session_datasets, dic_knobs):
     if clickData is not None:
-        if "customdata" in clickData["points"][0]:
-            name = clickData["points"][0]["customdata"]
-            if name.startswith("mb"):
-                type_text = "Dipole"
-                try:
-                    set_var = tracker_b1.element_refs[name].knl[0]._expr._get_dependencies()
-                except:
-                    set_var = tracker_b1.element_refs[name + "..1"].knl[0]._expr._get_dependencies()
-            elif name.startswith("mq"):
-                type_text = "Quadrupole"
-                try:
-                    set_var = tracker_b1.element_refs[name].knl[1]._expr._get_dependencies()
-                except:
-                    set_var = tracker_b1.element_refs[name + "..1"].knl[1]._expr._get_dependencies()
-            elif name.startswith("ms"):
-                type_text = "Sextupole"
-                try:
-                    set_var = tracker_b1.element_refs[name].knl[2]._expr._get_dependencies()
-                except:
-                    set_var = tracker_b1.element_refs[name + "..1"].knl[2]._expr._get_dependencies()
-            elif name.startswith("mo"):
-                type_text = "Octupole"
-                try:
-                    set_var = tracker_b1.element_refs[name].knl[3]._expr._get_dependencies()
-                except:
-                    set_var = tracker_b1.element_refs[name + "..1"].knl[3]._expr._get_dependencies()
-
-            text = []
-            for var in set_var:
-                name_var = str(var).split("'")[1]
-                val = tracker_b1.vars[name_var]._get_value()
-                expr = tracker_b1.vars[name_var]._expr
-                if expr is not None:
-                    dependencies = tracker_b1.vars[name_var]._expr._get_dependencies()
-                else:
-                    dependencies = "No dependencies"
-                    expr = "No expression"
-                targets = tracker_b1.vars[name_var]._find_dependant_targets()
-
-                text.append(dmc.Text("Name: ", weight=500))
-                text.append(dmc.Text(name_var, size="sm"))
-                text.append(dmc.Text("Element value: ", weight=500))
-                text.append(dmc.Text(str(val), size="sm"))
-                text.append(dmc.Text("Expression: ", weight=500))
-                text.append(dmc.Text(str(expr), size="sm"))
-                text.append(dmc.Text("Dependencies: ", weight=500))
-                text.append(dmc.Text(str(dependencies), size="sm"))
-                text.append(dmc.Text("Targets: ", weight=500))
-                if len(targets) > 10:
-                    text.append(
-                        dmc.Text(str(targets[:10]), size="sm"),
-                    )
-                    text.append(dmc.Text("...", size="sm"))
-                else:
-                    text.append(dmc.Text(str(targets), size="sm"))
-
-            return text, name, type_text
+        dataset_b1, _ = return_session_datasets(dic_session_datasets)
+
+        # Resolve the clicked point to its multipole or IP
+        name = spatial_index_functions.return_clicked_name(
+            clickData["points"][0],
+            dataset_b1["multipole_names"],
+            dataset_b1["spatial_index"],
+            plotting_functions.N_TRACES_BEFORE_ELEMENTS_SURVEY,
+        )
+        if name is not None:
+            # Read the knobs on a tracker (of the tracker server) set to the knob state of the
+            # session
+            type_text, l_knobs = tracker_server_functions.return_element_knobs(
+                dataset_b1["line_path"], dic_knobs, name
+            )
+            return return_element_text(l_knobs), name, type_text
 
     return (
         dmc.Text("Please click on a multipole to get the corresponding knob information."),
@@ -658,6 +1765,382 @@ def update_text_graph_LHC_2D(clickData):
     )
 
 
+@app.callback(
+    Output("replay-series", "data"),
+    Output("replay-message", "children"),
+    Input("upload-replay", "contents"),
+    State("upload-replay", "filename"),
+    State("session-datasets", "data"),
+    prevent_initial_call=True,
+)
+def load_replay_series(content, filename, dic_session_datasets):
+    if content is None:
+        raise PreventUpdate
+    try:
+        times, df_knobs = knob_functions.parse_knob_time_series(content, filename)
+    except (ValueError, ImportError) as e:
+        # Invalid content, or missing parquet engine
+        return None, f"The file {filename} could not be read ({type(e).__name__}: {e})."
+
+    # All the knobs of the time series must exist in the dataset
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    _, l_errors = knob_functions.validate_knob_changes(
+        dataset_b1["tracker"], df_knobs.iloc[0].to_dict()
+    )
+    if len(l_errors) > 0:
+        return None, "; ".join(l_errors)
+
+    dic_series = {
+        "times": None if times is None else times.tolist(),
+        "knobs": list(df_knobs.columns),
+        "values": df_knobs.to_numpy().tolist(),
+    }
+    return dic_series, f"{filename}: {len(df_knobs)} steps of {len(df_knobs.columns)} knob(s)."
+
+
+@app.callback(
+    Output("replay-state", "data"),
+    Output("replay-message", "children", allow_duplicate=True),
+    Input("play-replay-button", "n_clicks"),
+    State("replay-series", "data"),
+    State("replay-speed", "value"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
+    prevent_initial_call=True,
+)
+def play_replay(n_click_play, dic_series, speed, dic_session_datasets, dic_knobs):
+    if dic_series is None:
+        return dash.no_update, "Please load a knob time series first."
+
+    # The knobs of each step are set on top of the knob state of the session, and the twiss of the
+    # steps are computed by the (persistent) process pool of the dataset
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    replay = replay_functions.start_replay(
+        dataset_b1, {} if dic_knobs is None else dic_knobs, dic_series, speed
+    )
+    return replay, f"Replaying {replay['n_steps']} steps..."
+
+
+@app.callback(
+    Output("replay-interval", "disabled"),
+    Output("play-replay-button", "disabled"),
+    Output("stop-replay-button", "disabled"),
+    Input("replay-state", "data"),
+)
+def update_replay_controls(replay):
+    return replay is None, replay is not None, replay is None
+
+
+@app.callback(
+    Output("replay-state", "data", allow_duplicate=True),
+    Output("replay-message", "children", allow_duplicate=True),
+    Input("stop-replay-button", "n_clicks"),
+    State("replay-state", "data"),
+    prevent_initial_call=True,
+)
+def stop_replay(n_click_stop, replay):
+    if replay is None:
+        raise PreventUpdate
+    replay_functions.stop_replay(replay)
+    return None, f"Replay stopped after {replay['idx_step'] + 1}/{replay['n_steps']} steps."
+
+
+@app.callback(
+    Output("replay-graph", "figure"),
+    Output("replay-progress", "value"),
+    Output("replay-progress", "label"),
+    Output("replay-state", "data", allow_duplicate=True),
+    Output("replay-message", "children", allow_duplicate=True),
+    Input("replay-interval", "n_intervals"),
+    State("replay-state", "data"),
+    prevent_initial_call=True,
+)
+def advance_replay(n_intervals, replay):
+    if replay is None:
+        raise PreventUpdate
+
+    # A step that failed is never computed, and the steps of a replay may have expired: stop the
+    # replay (which disables the interval) and report the error
+    error = replay_functions.return_replay_error(replay)
+    if error is not None:
+        replay_functions.stop_replay(replay)
+        return (
+            dash.no_update,
+            dash.no_update,
+            dash.no_update,
+            None,
+            f"Replay stopped at step {replay['idx_step'] + 2}/{replay['n_steps']} ({error}).",
+        )
+
+    dataset = registry_functions.return_dataset(replay["dataset_key"])
+    replay_advanced, tw = replay_functions.advance_replay(dataset, replay)
+    if tw is None:
+        if replay_advanced == replay:
+            raise PreventUpdate
+        return dash.no_update, dash.no_update, dash.no_update, replay_advanced, dash.no_update
+
+    idx_step = replay_advanced["idx_step"]
+    n_steps = replay_advanced["n_steps"]
+    message = dash.no_update
+    if idx_step + 1 == n_steps:
+        replay_functions.stop_replay(replay_advanced)
+        message = (
+            f"Replay done ({n_steps} steps, {replay_advanced['n_skipped']} skipped to keep up with"
+            " the playback)."
+        )
+        replay_advanced = None
+    return (
+        plotting_functions.plot_around_IP(tw),
+        100 * (idx_step + 1) / n_steps,
+        f"Step {idx_step + 1}/{n_steps}",
+        replay_advanced,
+        message,
+    )
+
+
+@app.callback(
+    Output("tracking-message", "children"),
+    Input("track-button", "n_clicks"),
+    State("tracking-n-particles", "value"),
+    State("tracking-n-turns", "value"),
+    State("tracking-chunk-size", "value"),
+    State("tracking-amplitude", "value"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
+    background=True,
+    running=[
+        (Output("track-button", "disabled"), True, False),
+        (Output("stop-tracking-button", "disabled"), False, True),
+    ],
+    progress=[
+        Output("tracking-graph", "figure"),
+        Output("tracking-progress", "value"),
+        Output("tracking-progress", "label"),
+    ],
+    cancel=[Input("stop-tracking-button", "n_clicks")],
+    prevent_initial_call=True,
+)
+def track_particles(
+    set_progress,
+    n_click_track,
+    n_particles,
+    n_turns,
+    chunk_size,
+    amplitude,
+    dic_session_datasets,
+    dic_knobs,
+):
+    if not n_particles or not n_turns or not chunk_size or amplitude is None:
+        return "Please provide the number of particles, turns, turns per chunk and amplitude."
+    n_particles = min(int(n_particles), tracking_functions.MAX_TRACKED_PARTICLES)
+    n_turns = min(int(n_turns), tracking_functions.MAX_TRACKED_TURNS)
+    chunk_size = min(int(chunk_size), n_turns)
+
+    # Track on a pooled tracker (of the tracker server) set to the knob state of the session, and
+    # stream the (decimated) data of each chunk of turns to the browser. The particles stay in the
+    # tracker server for the whole tracking, and the tracker is only checked out while a chunk is
+    # tracked.
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    registry_functions.validate_knob_state(dataset_b1, dic_knobs)
+    tracking_session_id = tracker_server_functions.start_tracking(
+        dataset_b1["line_path"],
+        dic_knobs,
+        n_particles,
+        float(amplitude),
+        tracking_functions.DEFAULT_NEMITT,
+        0,
+        n_turns,
+        chunk_size,
+    )
+    try:
+        for turn, (dic_phase_space, dic_turn_by_turn) in tracking_functions.iterate_tracking(
+            functools.partial(tracker_server_functions.track_chunk, tracking_session_id),
+            n_turns,
+            chunk_size,
+        ):
+            set_progress(
+                (
+                    plotting_functions.plot_tracking(
+                        dic_phase_space, dic_turn_by_turn, turn, n_turns
+                    ),
+                    100 * turn / n_turns,
+                    f"Turn {turn}/{n_turns}",
+                )
+            )
+    finally:
+        tracker_server_functions.end_tracking(tracking_session_id)
+
+    n_alive = int(dic_turn_by_turn["n_alive"][-1]) if len(dic_turn_by_turn["n_alive"]) > 0 else 0
+    return f"Tracked {n_particles} particles for {turn} turns ({n_alive} alive)."
+
+
+@app.callback(
+    Output("footprint-job", "data"),
+    Output("footprint-message", "children"),
+    Input("footprint-button", "n_clicks"),
+    State("footprint-r-max", "value"),
+    State("footprint-n-r", "value"),
+    State("footprint-n-theta", "value"),
+    State("footprint-n-turns", "value"),
+    State("session-datasets", "data"),
+    State("session-knobs", "data"),
+    prevent_initial_call=True,
+)
+def compute_footprint(
+    n_click_footprint, r_max, n_r, n_theta, n_turns, dic_session_datasets, dic_knobs
+):
+    if not r_max or not n_r or not n_theta or not n_turns:
+        return dash.no_update, "Please provide all the parameters of the footprint."
+    dic_parameters = dict(
+        footprint_functions.DIC_DEFAULT_FOOTPRINT_PARAMETERS,
+        r_max=float(r_max),
+        n_r=int(n_r),
+        n_theta=int(n_theta),
+        n_turns=int(n_turns),
+    )
+
+    # The footprint is computed by the (persistent) process pool of the dataset, and cached per
+    # knob state, like the twiss
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    dic_knobs = {} if dic_knobs is None else dic_knobs
+    fingerprint = registry_functions.return_knob_fingerprint(dataset_b1, dic_knobs)
+    return (
+        footprint_functions.submit_footprint(dataset_b1, dic_knobs, fingerprint, dic_parameters),
+        "Tracking the grid of initial conditions...",
+    )
+
+
+@app.callback(
+    Output("footprint-interval", "disabled"),
+    Output("footprint-button", "disabled"),
+    Output("cancel-footprint-button", "disabled"),
+    Input("footprint-job", "data"),
+)
+def update_footprint_controls(job):
+    return job is None, job is not None, job is None
+
+
+@app.callback(
+    Output("footprint-job", "data", allow_duplicate=True),
+    Output("footprint-message", "children", allow_duplicate=True),
+    Input("cancel-footprint-button", "n_clicks"),
+    State("footprint-job", "data"),
+    prevent_initial_call=True,
+)
+def cancel_footprint(n_click_cancel, job):
+    if job is None:
+        raise PreventUpdate
+    footprint_functions.cancel_footprint(job)
+    return None, "Footprint cancelled."
+
+
+@app.callback(
+    Output("footprint-graph", "figure"),
+    Output("footprint-message", "children", allow_duplicate=True),
+    Output("footprint-progress", "value"),
+    Output("footprint-progress", "label"),
+    Output("footprint-job", "data", allow_duplicate=True),
+    Input("footprint-interval", "n_intervals"),
+    State("footprint-job", "data"),
+    prevent_initial_call=True,
+)
+def update_footprint_progress(n_intervals, job):
+    if job is None:
+        raise PreventUpdate
+
+    # A chunk that failed is never tracked: stop the job and report the error
+    error = footprint_functions.return_footprint_error(job)
+    if error is not None:
+        footprint_functions.cancel_footprint(job)
+        return (
+            dash.no_update,
+            f"The footprint could not be computed ({error}).",
+            0,
+            "Failed",
+            None,
+        )
+
+    fraction, footprint = footprint_functions.return_footprint_progress(job)
+    progress = (100 * fraction, f"{100 * fraction:.0f} % of the grid tracked")
+    if footprint is None:
+        return dash.no_update, dash.no_update, *progress, dash.no_update
+
+    dic_parameters = job["parameters"]
+    n_lost = int(np.count_nonzero(np.isnan(footprint["qx"])))
+    return (
+        plotting_functions.plot_footprint(
+            footprint, dic_parameters["n_r"], dic_parameters["n_theta"]
+        ),
+        f"Footprint of {len(footprint['qx'])} particles over {dic_parameters['n_turns']} turns"
+        f" ({n_lost} lost).",
+        *progress,
+        None,
+    )
+
+
+@app.callback(
+    Output("comparison-graph", "figure"),
+    Output("comparison-message", "children"),
+    Input("compare-button", "n_clicks"),
+    State("comparison-beam", "value"),
+    State("session-datasets", "data"),
+    prevent_initial_call=True,
+)
+def compare_datasets(n_click_compare, beam, dic_session_datasets):
+    dataset_b1, dataset_b4 = return_session_datasets(dic_session_datasets)
+    dataset = dataset_b1 if beam == "beam_1" else dataset_b4
+    dataset_reference = registry_functions.return_dataset(DIC_DEFAULT_DATASET_KEYS[beam])
+    if dataset["key"] == dataset_reference["key"]:
+        return dash.no_update, "The session uses the default configuration for this beam."
+
+    # The rows of both twiss tables are aligned once per pair of datasets, and the differences
+    # are cached
+    dic_comparison = comparison_functions.return_comparison(dataset_reference, dataset)
+    n_elements = len(dic_comparison["s"])
+    if n_elements == 0:
+        return dash.no_update, "The datasets do not have any element in common."
+    return (
+        plotting_functions.plot_comparison(dic_comparison),
+        f"{n_elements} elements in common ({len(dataset_reference['df_tw'])} in the default"
+        f" configuration, {len(dataset['df_tw'])} in the uploaded dataset). Maximum beta-beating:"
+        f" {np.nanmax(np.abs(dic_comparison['beating_betx'])):.2%} (x),"
+        f" {np.nanmax(np.abs(dic_comparison['beating_bety'])):.2%} (y).",
+    )
+
+
+@app.callback(
+    Output("table-explorer", "columns"),
+    Output("table-explorer", "page_current"),
+    Output("table-explorer", "sort_by"),
+    Output("table-explorer", "filter_query"),
+    Input("table-select", "value"),
+    Input("session-datasets", "data"),
+)
+def update_table_columns(table, dic_session_datasets):
+    # Reset the page, sort and filter when the table changes
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    dic_columns = table_functions.return_table_columns(dataset_b1, table)
+    return [{"name": column, "id": column} for column in dic_columns], 0, [], ""
+
+
+@app.callback(
+    Output("table-explorer", "data"),
+    Output("table-explorer", "page_count"),
+    Input("table-explorer", "page_current"),
+    Input("table-explorer", "page_size"),
+    Input("table-explorer", "sort_by"),
+    Input("table-explorer", "filter_query"),
+    Input("table-select", "value"),
+    Input("session-datasets", "data"),
+)
+def update_table_page(page_current, page_size, sort_by, filter_query, table, dic_session_datasets):
+    dataset_b1, _ = return_session_datasets(dic_session_datasets)
+    dic_columns = table_functions.return_table_columns(dataset_b1, table)
+    return table_functions.return_table_page(
+        dic_columns, page_current or 0, page_size, sort_by, filter_query
+    )
+
+
 # # Callback for the handler
 # @app.callback(Output("console-out", "srcDoc"), Input("interval1", "n_intervals"))
 # def update_output(n):
@@ -0,0 +1,304 @@
+#################### Imports ####################
+import diskcache
+import json
+import numpy as np
+import os
+import zlib
+
+# Import functions
+import loading_functions
+
+#################### Constants ####################
+
+# Folder of the caches shared by all the workers and background jobs of the server
+CACHE_FOLDER = "temp/cache"
+
+# Maximum size of the shared cache (least recently stored entries are evicted first). It holds the
+# twiss results, figures and survey structures computed by any worker, keyed by dataset and knob
+# state fingerprint.
+CACHE_SIZE_LIMIT_MB = int(os.environ.get("LHC_DASH_CACHE_SIZE_LIMIT_MB", "1024"))
+
+# Compression level of the arrays and figures stored in the shared cache (fast compression, as
+# the cache is read and written in the request path)
+COMPRESSION_LEVEL = 1
+
+# Twiss columns and scalars stored in the shared cache (enough to build the optics figures)
+L_CACHED_TWISS_COLUMNS = [
+    column for column in loading_functions.L_PLOTTED_TWISS_COLUMNS if column != "name"
+]
+
+# Time (in seconds) after which the data of an inactive session is dropped
+SESSION_EXPIRE_TIME = 24 * 3600
+
+# Time (in seconds) after which the partial results of a job run in a process pool are dropped
+JOB_EXPIRE_TIME = 3600
+
+# Time (in seconds) after which the columns of a version of the optics figure are dropped (the
+# next update of a figure displayed for longer is sent as a whole)
+FIGURE_VERSION_EXPIRE_TIME = 3600
+
+# Cache used by the background callback manager to store the jobs and their results, and cache
+# used to share data between the processes
+cache_jobs = diskcache.Cache(os.path.join(CACHE_FOLDER, "jobs"))
+cache_shared = diskcache.Cache(
+    os.path.join(CACHE_FOLDER, "shared"), size_limit=CACHE_SIZE_LIMIT_MB * 1024**2
+)
+
+# Cache holding the state of the sessions and of the jobs run in process pools, shared between the
+# processes as well. Its entries are never evicted (a session could otherwise lose track of its
+# requests, and a job never complete), they only expire.
+cache_state = diskcache.Cache(os.path.join(CACHE_FOLDER, "state"), eviction_policy="none")
+
+#################### Functions ####################
+
+
+def return_columns_around_IP(figure_version):
+    """Return the dataset key and the twiss columns of a version of the optics figure, or None if
+    they are not known."""
+    columns_around_IP = cache_state.get(("columns_around_IP", figure_version))
+    if columns_around_IP is None:
+        return None
+    dataset_key, dic_compressed_columns = columns_around_IP
+    return dataset_key, {
+        column: decompress_array(array) for column, array in dic_compressed_columns.items()
+    }
+
+
+def store_columns_around_IP(figure_version, dataset_key, dic_columns):
+    """Keep the dataset key and the twiss columns of a version of the optics figure, compressed."""
+    cache_state.set(
+        ("columns_around_IP", figure_version),
+        (dataset_key, {column: compress_array(array) for column, array in dic_columns.items()}),
+        expire=FIGURE_VERSION_EXPIRE_TIME,
+    )
+
+
+def return_survey_state(dataset_key, fingerprint):
+    """Return the multipole strengths (per order) and the twiss columns of the optics overlays
+    (per overlay index) of the survey of a dataset for a knob state, for the ones that differ from
+    the dataset, or None if they are not known."""
+    compressed_survey_state = cache_shared.get(("survey_state_changes", dataset_key, fingerprint))
+    if compressed_survey_state is None:
+        return None
+    dic_compressed_strengths, dic_compressed_tw_columns = compressed_survey_state
+    return (
+        {order: decompress_array(array) for order, array in dic_compressed_strengths.items()},
+        {idx: decompress_array(array) for idx, array in dic_compressed_tw_columns.items()},
+    )
+
+
+def store_survey_state(dataset_key, fingerprint, dic_strengths, dic_tw_columns):
+    """Share the multipole strengths and the twiss columns of the optics overlays of the survey of
+    a dataset for a knob state that differ from the dataset, compressed (the other survey
+    structures are rebuilt by each process)."""
+    cache_shared.set(
+        ("survey_state_changes", dataset_key, fingerprint),
+        (
+            {order: compress_array(array) for order, array in dic_strengths.items()},
+            {idx: compress_array(array) for idx, array in dic_tw_columns.items()},
+        ),
+    )
+
+
+def compress_array(array):
+    """Return a compressed representation of a numerical array."""
+    array = np.ascontiguousarray(array)
+    return array.dtype.str, array.shape, zlib.compress(array.tobytes(), COMPRESSION_LEVEL)
+
+
+def decompress_array(compressed_array):
+    """Return the (read-only) array from its compressed representation."""
+    dtype, shape, data = compressed_array
+    return np.frombuffer(zlib.decompress(data), dtype=dtype).reshape(shape)
+
+
+def return_response_matrix(dataset_key, l_knobs, l_targets):
+    """Return the last response matrix of a set of matched quantities to a set of knobs of a
+    dataset, or None if it is not known."""
+    return cache_shared.get(("response_matrix", dataset_key, tuple(l_knobs), tuple(l_targets)))
+
+
+def store_response_matrix(dataset_key, l_knobs, l_targets, response_matrix):
+    """Share the response matrix of a set of matched quantities to a set of knobs of a dataset."""
+    cache_shared.set(
+        ("response_matrix", dataset_key, tuple(l_knobs), tuple(l_targets)), response_matrix
+    )
+
+
+def return_matching_solutions(dataset_key, l_knobs, l_targets):
+    """Return the previous solutions (values of the matched quantities and of the knobs) of a
+    matching of a dataset, most recent first."""
+    return cache_shared.get(
+        ("matching_solutions", dataset_key, tuple(l_knobs), tuple(l_targets)), []
+    )
+
+
+def store_matching_solutions(dataset_key, l_knobs, l_targets, l_solutions):
+    """Share the previous solutions of a matching of a dataset."""
+    cache_shared.set(
+        ("matching_solutions", dataset_key, tuple(l_knobs), tuple(l_targets)), l_solutions
+    )
+
+
+def return_footprint(dataset_key, fingerprint, dic_parameters):
+    """Return the tune footprint of a dataset for a knob state and a set of parameters, or None if
+    it is not known."""
+    compressed_footprint = cache_shared.get(
+        ("footprint", dataset_key, fingerprint, tuple(sorted(dic_parameters.items())))
+    )
+    if compressed_footprint is None:
+        return None
+    return {column: decompress_array(array) for column, array in compressed_footprint.items()}
+
+
+def store_footprint(dataset_key, fingerprint, dic_parameters, footprint):
+    """Share the tune footprint of a dataset for a knob state and a set of parameters,
+    compressed."""
+    cache_shared.set(
+        ("footprint", dataset_key, fingerprint, tuple(sorted(dic_parameters.items()))),
+        {column: compress_array(array) for column, array in footprint.items()},
+    )
+
+
+def return_replay(replay_key):
+    """Return the playback times, knob states and fingerprints of the steps of a replay, or None
+    if they are not known."""
+    return cache_state.get(("replay", replay_key))
+
+
+def store_replay(replay_key, times, l_dic_knobs, l_fingerprints):
+    """Share the playback times, knob states and fingerprints of the steps of a replay."""
+    cache_state.set(
+        ("replay", replay_key), (times, l_dic_knobs, l_fingerprints), expire=SESSION_EXPIRE_TIME
+    )
+
+
+def return_footprint_chunk(job_key, idx_chunk):
+    """Return the tunes of a chunk of the grid of a footprint job, or None if they are not
+    known."""
+    compressed_tunes = cache_state.get(("footprint_chunk", job_key, idx_chunk))
+    if compressed_tunes is None:
+        return None
+    return tuple(decompress_array(array) for array in compressed_tunes)
+
+
+def store_footprint_chunk(job_key, idx_chunk, qx, qy):
+    """Share the tunes of a chunk of the grid of a footprint job, compressed."""
+    cache_state.set(
+        ("footprint_chunk", job_key, idx_chunk),
+        (compress_array(qx), compress_array(qy)),
+        expire=JOB_EXPIRE_TIME,
+    )
+
+
+def is_job_cancelled(job_key):
+    """Return whether a job run in a process pool has been cancelled."""
+    return cache_state.get(("job_cancelled", job_key), False)
+
+
+def cancel_job(job_key):
+    """Cancel a job run in a process pool (the work not started yet is skipped), from any
+    process."""
+    cache_state.set(("job_cancelled", job_key), True, expire=JOB_EXPIRE_TIME)
+
+
+def return_job_error(job_key):
+    """Return the error of a job run in a process pool, or None if none of its tasks failed."""
+    return cache_state.get(("job_error", job_key))
+
+
+def store_job_error(job_key, error):
+    """Record the error of a task of a job run in a process pool (the first one is kept)."""
+    cache_state.add(("job_error", job_key), error, expire=JOB_EXPIRE_TIME)
+
+
+def return_twiss_join(dataset_key_reference, dataset_key):
+    """Return the indices of the rows of the twiss tables of two datasets corresponding to the same
+    elements, or None if they are not known."""
+    compressed_join = cache_shared.get(("twiss_join", dataset_key_reference, dataset_key))
+    if compressed_join is None:
+        return None
+    return tuple(decompress_array(array) for array in compressed_join)
+
+
+def store_twiss_join(dataset_key_reference, dataset_key, twiss_join):
+    """Share the join of the twiss tables of two datasets, compressed."""
+    cache_shared.set(
+        ("twiss_join", dataset_key_reference, dataset_key),
+        tuple(compress_array(array) for array in twiss_join),
+    )
+
+
+def return_comparison(dataset_key_reference, dataset_key):
+    """Return the optics differences of a dataset with respect to a reference one, or None if
+    they are not known."""
+    compressed_comparison = cache_shared.get(("comparison", dataset_key_reference, dataset_key))
+    if compressed_comparison is None:
+        return None
+    return {column: decompress_array(array) for column, array in compressed_comparison.items()}
+
+
+def store_comparison(dataset_key_reference, dataset_key, dic_comparison):
+    """Share the optics differences of a dataset with respect to a reference one, compressed."""
+    cache_shared.set(
+        ("comparison", dataset_key_reference, dataset_key),
+        {column: compress_array(array) for column, array in dic_comparison.items()},
+    )
+
+
+def return_plotted_twiss(tw, mode="full"):
+    """Return the plotted twiss columns and the scalars obtained with a given twiss mode, as a
+    dictionnary that can be used in place of the twiss table for plotting."""
+    dic_twiss = {
+        column: np.asarray(tw[column], dtype=np.float64) for column in L_CACHED_TWISS_COLUMNS
+    }
+    for scalar in loading_functions.DIC_PLOTTED_TWISS_SCALARS_PER_MODE[mode]:
+        dic_twiss[scalar] = float(tw[scalar])
+    return dic_twiss
+
+
+def return_twiss(dataset_key, fingerprint, mode="full"):
+    """Return the plotted twiss of a dataset for a knob state, computed in a given mode (the full
+    twiss is also returned in fast mode, if known), or None if it is not known."""
+    l_modes = ["full"] if mode == "full" else ["full", mode]
+    for mode_cached in l_modes:
+        compressed_twiss = cache_shared.get(("twiss", mode_cached, dataset_key, fingerprint))
+        if compressed_twiss is not None:
+            break
+    else:
+        return None
+    dic_compressed_columns, dic_scalars = compressed_twiss
+    tw = {column: decompress_array(array) for column, array in dic_compressed_columns.items()}
+    tw.update(dic_scalars)
+    return tw
+
+
+def store_twiss(dataset_key, fingerprint, dic_twiss, mode="full"):
+    """Share the plotted twiss of a dataset for a knob state, compressed."""
+    cache_shared.set(
+        ("twiss", mode, dataset_key, fingerprint),
+        (
+            {column: compress_array(dic_twiss[column]) for column in L_CACHED_TWISS_COLUMNS},
+            {
+                scalar: dic_twiss[scalar]
+                for scalar in loading_functions.DIC_PLOTTED_TWISS_SCALARS_PER_MODE[mode]
+            },
+        ),
+    )
+
+
+def return_figure(name_figure, dataset_key, fingerprint):
+    """Return a figure of a dataset for a knob state (as a dictionnary), or None if it is not
+    known."""
+    compressed_figure = cache_shared.get(("figure", name_figure, dataset_key, fingerprint))
+    if compressed_figure is None:
+        return None
+    return json.loads(zlib.decompress(compressed_figure))
+
+
+def store_figure(name_figure, dataset_key, fingerprint, fig):
+    """Share a (plotly) figure of a dataset for a knob state, serialized and compressed."""
+    cache_shared.set(
+        ("figure", name_figure, dataset_key, fingerprint),
+        zlib.compress(fig.to_json().encode("utf-8"), COMPRESSION_LEVEL),
+    )
@@ -0,0 +1,95 @@
+#################### Imports ####################
+import os
+import time
+
+# Import functions
+import cache_functions
+
+#################### Constants ####################
+
+# Time (in seconds) during which a knob update waits for a newer one from the same session before
+# being computed, if the previous update of the session is still being computed
+KNOB_DEBOUNCE_TIME = float(os.environ.get("LHC_DASH_KNOB_DEBOUNCE_TIME", "0.2"))
+
+#################### Functions ####################
+
+
+def return_knob_requests_key(session_id):
+    """Return the key of the latest knob request of a session in the state cache."""
+    return ("knob_requests", session_id)
+
+
+def return_knob_requests(session_id):
+    """Return the id of the latest knob request of a session, the knob state it requested, and the
+    id of the latest request whose computation finished (or was dropped)."""
+    return cache_functions.cache_state.get(return_knob_requests_key(session_id), (0, None, 0))
+
+
+def store_knob_requests(session_id, request_id, dic_requested_knobs, request_id_finished):
+    """Record the knob requests of a session (see return_knob_requests)."""
+    cache_functions.cache_state.set(
+        return_knob_requests_key(session_id),
+        (request_id, dic_requested_knobs, request_id_finished),
+        expire=cache_functions.SESSION_EXPIRE_TIME,
+    )
+
+
+def register_knob_request(session_id, dic_knobs, dic_changes=None, replace=False):
+    """Record a knob update (one or several knob changes) of a session, applied on top of the
+    latest knob state requested by the session (which may not have reached the browser yet, if
+    the corresponding request has been superseded), or replacing it altogether (e.g. when a
+    snapshot is restored). Return the id of the request and the requested knob state."""
+    with cache_functions.cache_state.transact():
+        request_id, dic_requested_knobs, request_id_finished = return_knob_requests(session_id)
+        dic_requested_knobs = dict(
+            dic_knobs if dic_requested_knobs is None else dic_requested_knobs
+        )
+        if replace:
+            dic_requested_knobs = {}
+        if dic_changes is not None:
+            dic_requested_knobs.update(dic_changes)
+        request_id += 1
+        store_knob_requests(session_id, request_id, dic_requested_knobs, request_id_finished)
+    return request_id, dic_requested_knobs
+
+
+def finish_knob_request(session_id, request_id):
+    """Record that the computation of a knob request is over (done or dropped), so that the next
+    request of the session is not debounced. A request whose job is terminated is never finished:
+    the next request is then debounced once."""
+    with cache_functions.cache_state.transact():
+        request = cache_functions.cache_state.get(return_knob_requests_key(session_id))
+        if request is not None and request[2] < request_id:
+            store_knob_requests(session_id, request[0], request[1], request_id)
+
+
+def is_latest_knob_request(session_id, request_id):
+    """Return True if no knob update has been requested by the session since the given one. A
+    request that is not known anymore (e.g. expired) is never the latest."""
+    request = cache_functions.cache_state.get(return_knob_requests_key(session_id))
+    return request is not None and request[0] == request_id
+
+
+def is_knob_request_pending(session_id, request_id):
+    """Return True if a knob request of the session older than the given one is still being
+    computed."""
+    return return_knob_requests(session_id)[2] < request_id - 1
+
+
+def wait_for_newer_knob_request(session_id, request_id):
+    """If a previous request of the session is still being computed, wait for the debounce time.
+    Return True if the request has been superseded (it is then finished)."""
+    if is_knob_request_pending(session_id, request_id):
+        time.sleep(KNOB_DEBOUNCE_TIME)
+    if is_latest_knob_request(session_id, request_id):
+        return False
+    finish_knob_request(session_id, request_id)
+    return True
+
+
+def reset_knob_requests(session_id):
+    """Forget the knob state requested by a session (e.g. when its dataset changes), superseding
+    the requests in progress."""
+    with cache_functions.cache_state.transact():
+        request_id, _, _ = return_knob_requests(session_id)
+        store_knob_requests(session_id, request_id + 1, None, request_id + 1)
@@ -0,0 +1,81 @@
+#################### Imports ####################
+import numpy as np
+import pandas as pd
+
+# Import functions
+import cache_functions
+
+#################### Functions ####################
+
+
+def return_name_hashes(names):
+    """Return a 64-bit hash of each element name."""
+    return pd.util.hash_array(np.asarray(names, dtype=object))
+
+
+def return_twiss_join(names_reference, names):
+    """Return the indices of the rows of two twiss tables that correspond to the same element
+    (aligned on the element names, keeping the first occurrence of repeated names), using sorted
+    name hashes instead of a Python loop over the rows."""
+    names_reference = np.asarray(names_reference, dtype=object)
+    names = np.asarray(names, dtype=object)
+    hashes_reference = return_name_hashes(names_reference)
+    hashes = return_name_hashes(names)
+
+    # Sorted hashes of the reference (first occurrence of each name)
+    unique_hashes_reference, idx_unique_reference = np.unique(hashes_reference, return_index=True)
+    idx_sorted = np.searchsorted(unique_hashes_reference, hashes)
+    idx_sorted[idx_sorted == len(unique_hashes_reference)] = 0
+    idx_reference = idx_unique_reference[idx_sorted]
+    _, idx_unique = np.unique(hashes, return_index=True)
+    first_occurrence = np.zeros(len(names), dtype=bool)
+    first_occurrence[idx_unique] = True
+
+    # Keep the rows whose name is found in the reference (checking the names themselves, in case
+    # of hash collision)
+    matched = (
+        first_occurrence
+        & (unique_hashes_reference[idx_sorted] == hashes)
+        & (names_reference[idx_reference] == names)
+    )
+    return idx_reference[matched], np.flatnonzero(matched)
+
+
+def return_cached_twiss_join(dataset_reference, dataset):
+    """Return the join of the twiss tables of two datasets, computed once per pair of datasets and
+    shared through the cache."""
+    twiss_join = cache_functions.return_twiss_join(dataset_reference["key"], dataset["key"])
+    if twiss_join is None:
+        twiss_join = return_twiss_join(dataset_reference["df_tw"]["name"], dataset["df_tw"]["name"])
+        cache_functions.store_twiss_join(dataset_reference["key"], dataset["key"], twiss_join)
+    return twiss_join
+
+
+def return_comparison(dataset_reference, dataset):
+    """Return the beta-beating, orbit and dispersion differences of a dataset with respect to a
+    reference one, along the longitudinal coordinate of the reference, for the elements common to
+    both. The comparison is cached per pair of datasets."""
+    dic_comparison = cache_functions.return_comparison(dataset_reference["key"], dataset["key"])
+    if dic_comparison is not None:
+        return dic_comparison
+
+    idx_reference, idx = return_cached_twiss_join(dataset_reference, dataset)
+    tw_reference = dataset_reference["df_tw"]
+    tw = dataset["df_tw"]
+
+    def return_aligned_columns(column):
+        return (
+            np.asarray(tw_reference[column], dtype=np.float64)[idx_reference],
+            np.asarray(tw[column], dtype=np.float64)[idx],
+        )
+
+    dic_comparison = {"s": return_aligned_columns("s")[0]}
+    for column in ["betx", "bety"]:
+        reference, compared = return_aligned_columns(column)
+        dic_comparison[f"beating_{column}"] = (compared - reference) / reference
+    for column in ["x", "y", "dx", "dy"]:
+        reference, compared = return_aligned_columns(column)
+        dic_comparison[f"delta_{column}"] = compared - reference
+
+    cache_functions.store_comparison(dataset_reference["key"], dataset["key"], dic_comparison)
+    return dic_comparison
@@ -0,0 +1,2 @@
+# The modules of the app are imported by the tests from the root folder, which pytest adds to the
+# path because this file is located there
@@ -0,0 +1,151 @@
+#################### Imports ####################
+import logging
+import os
+import time
+import xobjects as xo
+
+#################### Constants ####################
+
+# Number of OpenMP threads used by each tracker of the tracker server. With "auto", the cores
+# available to the server are shared between its worker processes, so that they do not
+# oversubscribe the machine, and the cores of each worker are split between its tracker server and
+# its process pools. The number of trackers running at once is limited so that their threads do
+# not exceed the cores of the tracker server.
+OMP_NUM_THREADS = os.environ.get("LHC_DASH_OMP_NUM_THREADS", "auto")
+
+# Number of single-threaded processes of each process pool of a worker (replay, footprint). With
+# "auto", half of the cores of the worker.
+N_PROCESSES = os.environ.get("LHC_DASH_N_PROCESSES", "auto")
+
+# Number of worker processes sharing the machine (gunicorn uses WEB_CONCURRENCY as default number
+# of workers)
+N_WORKERS = int(os.environ.get("LHC_DASH_N_WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
+
+# Arguments of the twiss for each mode. The fast mode (4D, without chromatic properties) gives all
+# the plotted columns and the tunes, for interactive updates, while the full mode also gives the
+# chromaticities and the momentum compaction factor.
+DIC_TWISS_MODES = {
+    "fast": {"method": "4d", "compute_chromatic_properties": False},
+    "full": {},
+}
+
+# Whether the installed xtrack supports the arguments of the fast twiss (None until first used).
+# If not, the full twiss is computed instead.
+fast_twiss_supported = None
+
+# Context shared by all the trackers of the process, built on first use, and its number of
+# OpenMP threads
+context = None
+context_omp_num_threads = None
+
+# Processes that fork (the server, which forks the background jobs) must not start OpenMP threads:
+# a child forked after libgomp started its thread pool can deadlock. Threads are therefore only
+# used by the trackers of the tracker server, a spawned process that never forks.
+threads_allowed = True
+
+logger = logging.getLogger(__name__)
+
+#################### Functions ####################
+
+
+def forbid_threads():
+    """Build the trackers of this process (and of the processes forked from it) on a single
+    thread, as it forks other processes."""
+    global threads_allowed, context, context_omp_num_threads
+    threads_allowed = False
+    context = None
+    context_omp_num_threads = None
+
+
+def return_n_cores():
+    """Return the number of cores available to the process."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def return_n_cores_per_worker():
+    """Return the number of cores available to each worker process of the server."""
+    return max(return_n_cores() // max(N_WORKERS, 1), 1)
+
+
+def return_n_processes():
+    """Return the number of (single-threaded) processes of each process pool."""
+    if N_PROCESSES != "auto":
+        return max(int(N_PROCESSES), 1)
+    return max(return_n_cores_per_worker() // 2, 1)
+
+
+def return_n_tracker_server_cores():
+    """Return the number of cores of a worker left to the trackers of its tracker server, once the
+    ones of its process pools are reserved."""
+    return max(return_n_cores_per_worker() - return_n_processes(), 1)
+
+
+def return_omp_num_threads():
+    """Return the number of OpenMP threads of a context built by the process."""
+    if not threads_allowed:
+        return 1
+    if OMP_NUM_THREADS != "auto":
+        return max(int(OMP_NUM_THREADS), 1)
+    return return_n_tracker_server_cores()
+
+
+def return_n_running_trackers():
+    """Return the number of trackers of the tracker server that may run at once (over all the line
+    files), so that their threads do not exceed the cores left to the tracker server."""
+    return max(return_n_tracker_server_cores() // return_omp_num_threads(), 1)
+
+
+def return_context():
+    """Return the (CPU) context on which all the trackers of the process are built."""
+    global context, context_omp_num_threads
+    if context is None:
+        omp_num_threads = return_omp_num_threads()
+        logger.debug(
+            f"Trackers use {omp_num_threads} OpenMP thread(s) ({return_n_cores()} cores shared"
+            f" by {N_WORKERS} worker(s))."
+        )
+        context = (
+            xo.ContextCpu(omp_num_threads=omp_num_threads)
+            if omp_num_threads > 1
+            else xo.ContextCpu()
+        )
+        context_omp_num_threads = omp_num_threads
+    return context
+
+
+def return_context_omp_num_threads():
+    """Return the number of OpenMP threads of the context of the process (built if needed)."""
+    return_context()
+    return context_omp_num_threads
+
+
+def build_tracker(line):
+    """Build the tracker of a line on the context of the process."""
+    return line.build_tracker(_context=return_context())
+
+
+def compute_twiss(tracker, mode="full"):
+    """Compute the twiss of a tracker in a given mode ("fast" or "full"), and return it along with
+    the time it took (in seconds). The full twiss is computed if the fast one is not supported by
+    the installed xtrack."""
+    global fast_twiss_supported
+    if mode == "fast" and fast_twiss_supported is False:
+        mode = "full"
+    start = time.perf_counter()
+    try:
+        tw = tracker.twiss(**DIC_TWISS_MODES[mode])
+    except TypeError:
+        if mode != "fast" or fast_twiss_supported:
+            raise
+        logger.warning("The installed xtrack does not support the fast twiss, using the full one.")
+        fast_twiss_supported = False
+        mode = "full"
+        tw = tracker.twiss(**DIC_TWISS_MODES[mode])
+    else:
+        if mode == "fast":
+            fast_twiss_supported = True
+    latency = time.perf_counter() - start
+    logger.debug(f"Twiss ({mode}) computed in {latency:.2f} s.")
+    return tw, latency
@@ -3,8 +3,13 @@ import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 
+# Import the rendering backend shared with the app (the notebooks add the root of the repository
+# to the path)
+import rendering_functions
 
 #################### Functions ####################
+
+
 def return_radial_background_traces(df_sv):
     # Add 4 radial lines, each parametrized with a different set of x1, x2, y1, y2
     l_traces_background = []
@@ -15,7 +20,8 @@ def return_radial_background_traces(df_sv):
         [-10000 + np.mean(df_sv["X"]), 10000 + np.mean(df_sv["X"]), 10000, -10000],
     ]:
         l_traces_background.append(
-            go.Scatter(
+            rendering_functions.return_overlay_scatter_trace(
+                target="notebook",
                 x=[x1, x2],
                 y=[y1, y2],
                 mode="lines",
@@ -33,7 +39,8 @@ def return_radial_background_traces(df_sv):
 
 def return_beam_pipe_trace(df_sv):
     # Return a Plotly trace containing the beam pipe
-    return go.Scatter(
+    return rendering_functions.return_overlay_scatter_trace(
+        target="notebook",
         x=df_sv["X"],
         y=df_sv["Z"],
         mode="lines",
@@ -82,7 +89,8 @@ def return_multipole_trace(
 
     # Ghost trace for legend if requested
     if add_ghost_trace:
-        ghost_trace = go.Scattergl(
+        ghost_trace = rendering_functions.return_overlay_scatter_trace(
+            target="notebook",
             x=[10000, 10001],
             y=[0, 0],
             mode="lines",
@@ -103,7 +111,8 @@ def return_multipole_trace(
 
         # Add traces
         l_traces.append(
-            go.Scattergl(
+            rendering_functions.return_overlay_scatter_trace(
+                target="notebook",
                 x=[
                     # row["X"] - s_knl[i] / 2 * np.cos(theta),
                     row["X"],
@@ -138,7 +147,8 @@ def return_IP_trace(df_sv, add_ghost_trace=True):
 
     # Ghost trace for legend if requested
     if add_ghost_trace:
-        ghost_trace = go.Scattergl(
+        ghost_trace = rendering_functions.return_overlay_scatter_trace(
+            target="notebook",
             x=[10000, 10000],
             y=[0, 0],
             mode="markers",
@@ -157,7 +167,8 @@ def return_IP_trace(df_sv, add_ghost_trace=True):
     for i, row in df_ip.iterrows():
         theta = np.pi + row["theta"]
         l_traces.append(
-            go.Scattergl(
+            rendering_functions.return_overlay_scatter_trace(
+                target="notebook",
                 mode="markers",
                 x=[row["X"]],
                 y=[row["Z"]],
@@ -245,7 +256,8 @@ def return_optic_trace(df_sv, df_tw, type_trace, hide_optics_traces_initially=Tr
         correction = 1
 
     # Return the trace
-    return go.Scattergl(
+    return rendering_functions.return_overlay_scatter_trace(
+        target="notebook",
         x=df_sv["X"]
         - df_tw[tw_name] ** exponent * correction * magnification_factor * np.cos(df_sv["theta"]),
         y=df_sv["Z"] - df_tw[tw_name] ** exponent * magnification_factor * np.sin(df_sv["theta"]),
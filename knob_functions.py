@@ -0,0 +1,147 @@
+#################### Imports ####################
+import numpy as np
+import pandas as pd
+import base64
+import csv
+import io
+import json
+
+#################### Constants ####################
+
+# Names of the column holding the time of each step in a knob time series (case insensitive)
+L_TIME_COLUMNS = ["time", "timestamp", "t"]
+
+#################### Functions ####################
+
+
+def validate_knob_changes(tracker, dic_changes):
+    """Check a set of knob changes against the knobs of a tracker (which is only read): only the
+    independent knobs can be set. Return the valid changes (with float values) and the list of
+    errors."""
+    dic_valid_changes = {}
+    l_errors = []
+    for knob, value in dic_changes.items():
+        if knob not in tracker.vars._owner:
+            l_errors.append(f"Unknown knob {knob}")
+            continue
+        if tracker.vars[knob]._expr is not None:
+            l_errors.append(f"Knob {knob} is given by an expression and cannot be set")
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            l_errors.append(f"Invalid value {value} for knob {knob}")
+            continue
+        if not np.isfinite(value):
+            l_errors.append(f"Invalid value {value} for knob {knob}")
+            continue
+        dic_valid_changes[knob] = value
+
+    return dic_valid_changes, l_errors
+
+
+def return_element_knobs(tracker, name):
+    """Return the type of a multipole (or IP), and the description (value, expression,
+    dependencies and targets, as text) of the knobs acting on it."""
+    type_text = "IP" if name.startswith("ip") else "Undefined type"
+    set_var = []
+    for prefix, type_element, order in [
+        ("mb", "Dipole", 0),
+        ("mq", "Quadrupole", 1),
+        ("ms", "Sextupole", 2),
+        ("mo", "Octupole", 3),
+    ]:
+        if name.startswith(prefix):
+            type_text = type_element
+            try:
+                set_var = tracker.element_refs[name].knl[order]._expr._get_dependencies()
+            except:
+                set_var = tracker.element_refs[name + "..1"].knl[order]._expr._get_dependencies()
+            break
+
+    l_knobs = []
+    for var in set_var:
+        name_var = str(var).split("'")[1]
+        expr = tracker.vars[name_var]._expr
+        l_knobs.append(
+            {
+                "name": name_var,
+                "value": str(tracker.vars[name_var]._get_value()),
+                "expression": "No expression" if expr is None else str(expr),
+                "dependencies": (
+                    "No dependencies" if expr is None else str(expr._get_dependencies())
+                ),
+                "targets": [
+                    str(target) for target in tracker.vars[name_var]._find_dependant_targets()
+                ],
+            }
+        )
+
+    return type_text, l_knobs
+
+
+def parse_knob_file(content, filename):
+    """Return the knob changes contained in an uploaded file: either a json dictionnary mapping
+    knobs to values, or a csv file with one knob and its value per line (an optional header is
+    ignored)."""
+    content_type, content_string = content.split(",")
+    decoded = base64.b64decode(content_string).decode("utf-8")
+    if filename.endswith(".json"):
+        dic_changes = json.loads(decoded)
+        if not isinstance(dic_changes, dict):
+            raise ValueError("The json file must contain a dictionnary mapping knobs to values")
+        return dic_changes
+
+    dic_changes = {}
+    for idx_row, row in enumerate(csv.reader(io.StringIO(decoded))):
+        # Skip empty lines and comments
+        if len(row) == 0 or row[0].strip() == "" or row[0].strip().startswith("#"):
+            continue
+        if len(row) < 2:
+            raise ValueError(f"Line {idx_row + 1} must contain a knob and its value")
+        knob, value = row[0].strip(), row[1].strip()
+
+        # Skip the header, if any
+        if idx_row == 0:
+            try:
+                float(value)
+            except ValueError:
+                continue
+        dic_changes[knob] = value
+
+    return dic_changes
+
+
+def parse_knob_time_series(content, filename):
+    """Return the steps of an uploaded knob time series (csv or parquet file, with one row per
+    step and one column per knob, plus an optional time column), as the time of each step in
+    seconds since the first one (None if the file has no time column) and a dataframe of the knob
+    values."""
+    content_type, content_string = content.split(",")
+    decoded = base64.b64decode(content_string)
+    if filename.endswith(".parquet"):
+        # Requires pyarrow or fastparquet
+        df = pd.read_parquet(io.BytesIO(decoded))
+    else:
+        df = pd.read_csv(io.StringIO(decoded.decode("utf-8")), comment="#")
+    if len(df) == 0:
+        raise ValueError("The time series does not contain any step")
+
+    # Convert the time column (numerical, in seconds, or dates) to seconds since the first step
+    times = None
+    l_time_columns = [column for column in df.columns if str(column).lower() in L_TIME_COLUMNS]
+    if len(l_time_columns) > 0:
+        time = df.pop(l_time_columns[0])
+        if pd.api.types.is_numeric_dtype(time):
+            times = time.to_numpy(dtype=np.float64)
+        else:
+            times = (pd.to_datetime(time) - pd.to_datetime(time).iloc[0]).dt.total_seconds()
+            times = times.to_numpy(dtype=np.float64)
+        times = times - times[0]
+        if np.any(np.diff(times) < 0):
+            raise ValueError("The steps of the time series must be sorted by time")
+
+    df_knobs = df.apply(pd.to_numeric, errors="raise").astype(np.float64)
+    if not np.all(np.isfinite(df_knobs.to_numpy())):
+        raise ValueError("The time series contains invalid knob values")
+    return times, df_knobs
@@ -5,6 +5,79 @@ import pandas as pd
 import xtrack as xt
 import pickle
 import os
+import hashlib
+import zlib
+
+# Import functions
+import context_functions
+import precision_functions
+
+#################### Constants ####################
+
+# Twiss columns and scalars used by the plots, kept as arrays in the twiss tables of the app
+L_PLOTTED_TWISS_COLUMNS = ["name", "s", "betx", "bety", "x", "y", "dx", "dy"]
+L_PLOTTED_TWISS_SCALARS = ["qx", "qy", "dqx", "dqy", "momentum_compaction_factor"]
+
+# Plotted twiss scalars obtained with each twiss mode (see context_functions.DIC_TWISS_MODES)
+DIC_PLOTTED_TWISS_SCALARS_PER_MODE = {"fast": ["qx", "qy"], "full": L_PLOTTED_TWISS_SCALARS}
+
+# Version of the pickled dataframes of a dataset. Pickles of another version (e.g. holding the twiss
+# dataframe of earlier versions of the app) are regenerated.
+DATAFRAMES_FORMAT_VERSION = 2
+
+# Sectors of the ring, delimited by IPs
+L_SECTORS = ["8-2", "2-4", "4-6", "6-8"]
+
+# Orders of the multipoles drawn in the survey
+L_PLOTTED_MULTIPOLE_ORDERS = [0, 1, 2, 3]
+
+#################### Classes ####################
+
+
+class TwissColumnTable:
+    """Twiss table holding copies of the plotted columns (in the plotting precision, with the
+    x-axis reversed if requested) and scalars, so that the full twiss result is released once the
+    table is built. The other columns are kept compressed, and only materialized on access."""
+
+    def __init__(self, tw, correct_x_axis=True):
+        self._correct_x_axis = correct_x_axis
+        self._columns = {}
+        for column in L_PLOTTED_TWISS_COLUMNS:
+            array = np.array(tw[column])
+            if column == "x" and correct_x_axis:
+                array = -array
+            self._columns[column] = precision_functions.return_plotting_array(array)
+        self._packed_columns = {
+            column: zlib.compress(pickle.dumps(np.asarray(tw[column]), protocol=5), 1)
+            for column in tw._col_names
+            if column not in self._columns
+        }
+        self._scalars = {scalar: tw[scalar] for scalar in L_PLOTTED_TWISS_SCALARS}
+
+    def __getitem__(self, key):
+        if key in self._columns:
+            return self._columns[key]
+        if key in self._scalars:
+            return self._scalars[key]
+        packed_column = self._packed_columns.get(key)
+        if packed_column is None:
+            raise KeyError(f"{key} is not a twiss column or a plotted twiss scalar")
+
+        # Materialize the column once, and drop its compressed copy
+        column = self._columns.setdefault(key, pickle.loads(zlib.decompress(packed_column)))
+        self._packed_columns.pop(key, None)
+        return column
+
+    def __contains__(self, key):
+        return key in self._columns or key in self._scalars or key in self._packed_columns
+
+    def __len__(self):
+        return len(self._columns["s"])
+
+    def to_pandas(self):
+        """Return the plotted columns as a dataframe."""
+        return pd.DataFrame({column: self._columns[column] for column in L_PLOTTED_TWISS_COLUMNS})
+
 
 #################### Functions ####################
 
@@ -26,32 +99,42 @@ def return_dataframe_elements_from_line(line):
 
 
 def return_survey_and_twiss_dataframes_from_tracker(tracker, correct_x_axis=True):
-    """Return the survey and twiss dataframes from a tracker."""
+    """Return the survey dataframe and the twiss table (plotted columns only) from a tracker."""
     # Get survey dataframes
     df_sv = tracker.survey().to_pandas()
 
-    # Get Twiss dataframes
-    tw = tracker.twiss()
-    df_tw = tw.to_pandas()
+    # Get Twiss table (only the plotted columns are kept, the x-axis is reversed if requested)
+    tw, _ = context_functions.compute_twiss(tracker)
+    df_tw = TwissColumnTable(tw, correct_x_axis=correct_x_axis)
 
     # Reverse x-axis if requested
     if correct_x_axis:
         df_sv["X"] = -df_sv["X"]
-        df_tw["x"] = -df_tw["x"]
 
     return df_sv, df_tw
 
 
+def return_corrected_twiss_columns(tw, l_columns, correct_x_axis=True):
+    """Return the requested columns of a twiss table, with the x-axis reversed if requested (as
+    done for the twiss dataframe)."""
+    dic_columns = {column: np.asarray(tw[column]) for column in l_columns}
+    if correct_x_axis and "x" in dic_columns:
+        dic_columns["x"] = -dic_columns["x"]
+    return dic_columns
+
+
 def return_dataframe_corrected_for_thin_lens_approx(df_elements, df_tw):
     """Correct the dataframe of elements for thin lens approximation."""
     df_elements_corrected = df_elements.copy(deep=True)
 
     # Add all thin lenses (length + strength)
-    for i, row in df_tw.iterrows():
+    l_names = list(df_tw["name"])
+    dic_index_elements = {name: idx for idx, name in reversed(list(enumerate(l_names)))}
+    for i, name_element in enumerate(l_names):
         # Correct for thin lens approximation and weird duplicates
-        if ".." in row["name"] and "f" not in row["name"].split("..")[1]:
-            name = row["name"].split("..")[0]
-            index = df_tw[df_tw.name == name].index[0]
+        if ".." in name_element and "f" not in name_element.split("..")[1]:
+            name = name_element.split("..")[0]
+            index = dic_index_elements[name]
 
             # Add length
             if np.isnan(df_elements_corrected.loc[index]["length"]):
@@ -80,6 +163,170 @@ def return_dataframe_corrected_for_thin_lens_approx(df_elements, df_tw):
     return df_elements_corrected
 
 
+def return_multipole_strength_map(tracker):
+    """Return views over the strengths (knl) of the multipoles of the tracker, along with the map
+    from each (thin lens) slice to its parent element, as defined in
+    return_dataframe_corrected_for_thin_lens_approx()."""
+    line = tracker.line
+    dic_index_elements = {
+        name: idx for idx, name in reversed(list(enumerate(line.element_names)))
+    }
+
+    l_views = []
+    l_idx_parent = []
+    for idx, name in enumerate(line.element_names):
+        element = line.element_dict[name]
+        if not hasattr(element, "knl"):
+            continue
+
+        # Slices are attached to their parent element
+        if ".." in name and "f" not in name.split("..")[1]:
+            idx_parent = dic_index_elements[name.split("..")[0]]
+        else:
+            idx_parent = idx
+
+        # The knl of an element is a view over the tracker buffer (up to the order of the
+        # element), so the strengths set by the knobs are read without copying the elements
+        l_views.append(element.knl)
+        l_idx_parent.append(idx_parent)
+
+    strength_map = {
+        "views": l_views,
+        "idx_parent": np.array(l_idx_parent, dtype=np.int64),
+        "knl_lengths": np.array([len(view) for view in l_views], dtype=np.int64),
+        "buffer": None,
+        "offsets": None,
+    }
+
+    # Optimization: if all the views live in the same (CPU) buffer, read all strengths with a
+    # single gather rather than element by element (about 0.4 ms instead of 8 ms per order for
+    # 20000 multipoles). It is only used if it reads the same strengths as the views.
+    buffer, offsets = return_strength_buffer_offsets(l_views)
+    if buffer is not None:
+        strength_map_gather = dict(strength_map, buffer=buffer, offsets=offsets)
+        if all(
+            np.array_equal(
+                return_multipole_strengths_from_buffers(strength_map_gather, order).to_numpy(),
+                return_multipole_strengths_from_buffers(strength_map, order).to_numpy(),
+            )
+            for order in L_PLOTTED_MULTIPOLE_ORDERS
+        ):
+            strength_map = strength_map_gather
+
+    return strength_map
+
+
+def return_strength_buffer_offsets(l_views):
+    """Return the buffer in which all the knl views live, as a float64 array, and the offset of
+    each view in it, or (None, None) if the views do not share a single contiguous buffer."""
+    if len(l_views) == 0:
+        return None, None
+    root = l_views[0]
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if not isinstance(root, np.ndarray) or not root.flags["C_CONTIGUOUS"]:
+        return None, None
+    address_root = root.__array_interface__["data"][0]
+    offsets = np.array(
+        [view.__array_interface__["data"][0] - address_root for view in l_views], dtype=np.int64
+    )
+    knl_lengths = np.array([len(view) for view in l_views], dtype=np.int64)
+    if not (
+        np.all(offsets >= 0)
+        and np.all(offsets % 8 == 0)
+        and np.all(offsets + 8 * knl_lengths <= root.nbytes)
+        and all(view.dtype == np.float64 and view.strides == (8,) for view in l_views)
+    ):
+        return None, None
+    return np.frombuffer(root, dtype=np.float64, count=root.nbytes // 8), offsets // 8
+
+
+def return_multipole_strengths_from_buffers(strength_map, order):
+    """Return the current strength of a given order of the multipoles, read from the tracker
+    buffers and summed over thin lens slices, as a Series indexed by parent element."""
+    mask = strength_map["knl_lengths"] > order
+    if strength_map["buffer"] is not None:
+        values = strength_map["buffer"][strength_map["offsets"][mask] + order]
+    else:
+        values = np.array(
+            [view[order] for view, keep in zip(strength_map["views"], mask) if keep],
+            dtype=np.float64,
+        )
+
+    # Aggregate slices into their parent
+    l_idx_parent, inverse = np.unique(strength_map["idx_parent"][mask], return_inverse=True)
+    return pd.Series(np.bincount(inverse, weights=values), index=l_idx_parent)
+
+
+def return_plotting_store(df_elements_corrected, df_sv, df_tw):
+    """Return a compact store with only the elements drawn in the survey (multipoles, per order,
+    and IPs), with their survey coordinates and sector already joined."""
+    # Get the sector of each element
+    sectors = np.full(len(df_tw), "", dtype=object)
+    for sector in L_SECTORS:
+        sectors[return_indices_sector(df_tw, sector)] = sector
+
+    # Multipoles, one dataframe per order
+    dic_store = {"multipoles": {}}
+    for order in L_PLOTTED_MULTIPOLE_ORDERS:
+        df_order = df_elements_corrected[df_elements_corrected.order == order]
+        df_sv_order = df_sv.loc[df_order.index]
+        dic_store["multipoles"][order] = pd.DataFrame(
+            {
+                "name": df_sv_order["name"].to_numpy(),
+                "strength": precision_functions.return_plotting_array(
+                    df_order["knl"].apply(lambda x: x[order]).to_numpy(dtype=np.float64)
+                ),
+                "length": precision_functions.return_plotting_array(
+                    df_order["length"].to_numpy(dtype=np.float64)
+                ),
+                "X": precision_functions.return_plotting_array(df_sv_order["X"].to_numpy()),
+                "Z": precision_functions.return_plotting_array(df_sv_order["Z"].to_numpy()),
+                "theta": precision_functions.return_plotting_array(
+                    df_sv_order["theta"].to_numpy()
+                ),
+                "sector": sectors[df_order.index],
+            },
+            index=df_order.index,
+        )
+
+    # IPs
+    df_ip = df_sv[df_sv["name"].str.startswith("ip")]
+    dic_store["ip"] = pd.DataFrame(
+        {
+            "name": df_ip["name"].to_numpy(),
+            "X": precision_functions.return_plotting_array(df_ip["X"].to_numpy()),
+            "Z": precision_functions.return_plotting_array(df_ip["Z"].to_numpy()),
+        },
+        index=df_ip.index,
+    )
+
+    return dic_store
+
+
+def refresh_plotting_store_strengths(dic_store, dic_strengths):
+    """Update, in place, the strengths of the multipoles of the plotting store with the current
+    values of a tracker (see return_multipole_strengths_from_buffers(), one Series per order)."""
+    for order, df_multipoles in dic_store["multipoles"].items():
+        df_multipoles["strength"] = precision_functions.return_plotting_array(
+            dic_strengths[order].reindex(df_multipoles.index, fill_value=0.0).to_numpy()
+        )
+
+
+def load_saved_variables(save_path):
+    """Return the dataframes saved for a dataset, or None if they were saved in another format
+    (or can not be read) and must be regenerated."""
+    try:
+        with open(save_path, "rb") as handle:
+            saved = pickle.load(handle)
+    except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+        # Pickles of earlier versions may refer to classes that no longer exist
+        return None
+    if not isinstance(saved, dict) or saved.get("version") != DATAFRAMES_FORMAT_VERSION:
+        return None
+    return saved["variables"]
+
+
 def return_all_loaded_variables(
     save_path=None, force_load=False, correct_x_axis=True, line_path=None, line=None
 ):
@@ -92,22 +339,32 @@ def return_all_loaded_variables(
     elif line is None and line_path is None:
         raise ValueError("Either line or line_path must be provided")
 
-    # Build tracker
-    tracker = line.build_tracker()
+    # Build tracker (on the context shared by all the trackers of the app)
+    tracker = context_functions.build_tracker(line)
 
-    # Check if df are already saved
+    # Check if df are already saved (in the current format)
+    l_variables = None
     if save_path is not None and os.path.exists(save_path):
-        with open(save_path, "rb") as handle:
-            df_elements, df_sv, df_tw, df_elements_corrected = pickle.load(handle)
+        l_variables = load_saved_variables(save_path)
+    if l_variables is not None:
+        df_elements, df_sv, df_tw, df_elements_corrected = l_variables
     else:
         df_elements = return_dataframe_elements_from_line(line)
         df_sv, df_tw = return_survey_and_twiss_dataframes_from_tracker(tracker, correct_x_axis)
         df_elements_corrected = return_dataframe_corrected_for_thin_lens_approx(df_elements, df_tw)
 
-    if save_path is not None:
-        # Save variables
-        with open(save_path, "wb") as handle:
-            pickle.dump([df_elements, df_sv, df_tw, df_elements_corrected], handle)
+        if save_path is not None:
+            # Save variables (to a temporary file first, so that other workers never read a
+            # partial file)
+            with open(save_path + ".tmp", "wb") as handle:
+                pickle.dump(
+                    {
+                        "version": DATAFRAMES_FORMAT_VERSION,
+                        "variables": [df_elements, df_sv, df_tw, df_elements_corrected],
+                    },
+                    handle,
+                )
+            os.replace(save_path + ".tmp", save_path)
 
     # Return all variables
     return line, tracker, df_elements, df_sv, df_tw, df_elements_corrected
@@ -115,8 +372,21 @@ def return_all_loaded_variables(
 
 def get_indices_of_interest(df_tw, element_1, element_2):
     """Return the indices of the elements of interest."""
-    idx_1 = df_tw.loc[df_tw["name"] == element_1].index[0]
-    idx_2 = df_tw.loc[df_tw["name"] == element_2].index[0]
+    idx_1 = int(np.flatnonzero(np.asarray(df_tw["name"]) == element_1)[0])
+    idx_2 = int(np.flatnonzero(np.asarray(df_tw["name"]) == element_2)[0])
     if idx_2 < idx_1:
         return list(range(0, idx_2)) + list(range(idx_1, len(df_tw)))
     return list(range(idx_1, idx_2))
+
+
+def return_survey_hash(df_sv):
+    """Return a hash identifying the survey of a dataset."""
+    return hashlib.sha1(
+        pd.util.hash_pandas_object(df_sv[["name", "X", "Z"]], index=False).to_numpy().tobytes()
+    ).hexdigest()
+
+
+def return_indices_sector(df_tw, sector):
+    """Return the indices of the elements of a sector, given as e.g. "8-2"."""
+    str_ind_1, str_ind_2 = sector.split("-")
+    return get_indices_of_interest(df_tw, "ip" + str_ind_1, "ip" + str_ind_2)
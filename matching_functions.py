@@ -0,0 +1,201 @@
+#################### Imports ####################
+import numpy as np
+
+# Import functions
+import cache_functions
+import registry_functions
+
+#################### Constants ####################
+
+# Quantities that can be matched, and the knob varied by default for each of them (the tune and
+# chromaticity trims of beam 1)
+L_MATCHING_TARGETS = ["qx", "qy", "dqx", "dqy"]
+DIC_DEFAULT_MATCHING_KNOBS = {"qx": "kqtf.b1", "qy": "kqtd.b1", "dqx": "ksf.b1", "dqy": "ksd.b1"}
+
+# Tolerance on each matched quantity
+DIC_MATCHING_TOLERANCES = {"qx": 1e-6, "qy": 1e-6, "dqx": 1e-3, "dqy": 1e-3}
+
+# Maximum number of Newton iterations (one twiss each) of a matching
+MAX_MATCHING_ITERATIONS = 20
+
+# Maximum number of times a Newton step that does not decrease the residual is halved (one twiss
+# each), with an up-to-date response matrix
+MAX_STEP_HALVINGS = 5
+
+# Step used to compute the response matrix by finite differences, relative to the knob value
+# (with a minimum for knobs set to zero)
+RELATIVE_KNOB_STEP = 1e-4
+MIN_KNOB_STEP = 1e-8
+
+# Number of previous solutions kept per dataset, varied knobs and matched quantities
+MAX_MATCHING_SOLUTIONS = 16
+
+#################### Functions ####################
+
+
+def return_matching_twiss_mode(l_targets):
+    """Return the twiss mode needed to match a set of quantities (the chromaticities are only
+    computed by the full twiss)."""
+    return "full" if any(target in ["dqx", "dqy"] for target in l_targets) else "fast"
+
+
+def evaluate_targets(dataset, dic_knobs, l_targets, mode):
+    """Return the value of the matched quantities for a knob state, along with its twiss, computed
+    on a tracker of the tracker server (only the knobs that changed are set). The twiss is read
+    from the cache if known, but not shared: most of the knob states evaluated by a matching are
+    never displayed."""
+    tw, _, _ = registry_functions.return_twiss(dataset, dic_knobs, mode=mode, share=False)
+    return np.array([tw[target] for target in l_targets], dtype=np.float64), tw
+
+
+def compute_response_matrix(evaluate, knob_values, target_values):
+    """Return the response of the matched quantities to each varied knob, by finite
+    differences (one twiss per knob)."""
+    response_matrix = np.zeros((len(target_values), len(knob_values)))
+    for idx_knob, value in enumerate(knob_values):
+        step = max(abs(value) * RELATIVE_KNOB_STEP, MIN_KNOB_STEP)
+        knob_values_step = knob_values.copy()
+        knob_values_step[idx_knob] += step
+        response_matrix[:, idx_knob] = (evaluate(knob_values_step) - target_values) / step
+    return response_matrix
+
+
+def return_broyden_update(response_matrix, knob_step, delta_target_values):
+    """Return the response matrix updated with a (good) Broyden rank-one update, so that it
+    matches the change of the matched quantities observed for a knob step (secant condition),
+    without computing another twiss."""
+    return response_matrix + np.outer(
+        delta_target_values - response_matrix @ knob_step, knob_step
+    ) / np.dot(knob_step, knob_step)
+
+
+def return_closest_solution(l_solutions, target_values, tolerances):
+    """Return the previous solution whose matched quantities are the closest to the requested ones,
+    along with its (normalized) distance to them, or (None, inf) if there is none."""
+    if not l_solutions:
+        return None, np.inf
+    l_distances = [
+        np.linalg.norm((solution_target_values - target_values) / tolerances)
+        for solution_target_values, _ in l_solutions
+    ]
+    idx_closest = int(np.argmin(l_distances))
+    return l_solutions[idx_closest][1], l_distances[idx_closest]
+
+
+def match_knobs(dataset, dic_knobs, dic_targets, l_knobs, callback_progress=None):
+    """Find the values of the varied knobs (on top of a knob state) giving the requested values of
+    the matched quantities, with a Newton solver. The response matrix and the previous solutions
+    of the same matching (dataset, varied knobs and matched quantities) are reused as a warm start,
+    and the response matrix is refined with Broyden updates, so that a matching usually converges
+    in a few twiss. Only the twiss of the matched knob state is shared through the cache. Return
+    the matched knob values, the values reached by the matched quantities, the number of twiss
+    computed, and whether the matching converged."""
+    registry_functions.validate_knob_state(dataset, dic_knobs)
+    l_targets = list(dic_targets.keys())
+    requested_values = np.array([dic_targets[target] for target in l_targets], dtype=np.float64)
+    tolerances = np.array([DIC_MATCHING_TOLERANCES[target] for target in l_targets])
+    mode = return_matching_twiss_mode(l_targets)
+    l_solutions = cache_functions.return_matching_solutions(dataset["key"], l_knobs, l_targets)
+    response_matrix = cache_functions.return_response_matrix(dataset["key"], l_knobs, l_targets)
+    n_twiss = 0
+
+    def return_knob_state(knob_values):
+        return {**dic_knobs, **dict(zip(l_knobs, knob_values.tolist()))}
+
+    def evaluate(knob_values):
+        nonlocal n_twiss
+        n_twiss += 1
+        return evaluate_targets(dataset, return_knob_state(knob_values), l_targets, mode)
+
+    # Start from the current knob state, or from the closest previous solution if it is closer
+    # to the requested values
+    knob_values = np.array(
+        [
+            dic_knobs[knob]
+            if knob in dic_knobs
+            else dataset["knob_catalog"]["default_vector"][
+                dataset["knob_catalog"]["dic_indices"][knob]
+            ]
+            for knob in l_knobs
+        ],
+        dtype=np.float64,
+    )
+    target_values, tw = evaluate(knob_values)
+    solution_knob_values, distance = return_closest_solution(
+        l_solutions, requested_values, tolerances
+    )
+    if distance < np.linalg.norm((target_values - requested_values) / tolerances):
+        knob_values = solution_knob_values.copy()
+        target_values, tw = evaluate(knob_values)
+
+    response_matrix_fresh = False
+    for iteration in range(MAX_MATCHING_ITERATIONS):
+        residual = requested_values - target_values
+        if callback_progress is not None:
+            callback_progress(iteration, np.linalg.norm(residual / tolerances))
+        if np.all(np.abs(residual) <= tolerances):
+            break
+
+        if response_matrix is None:
+            response_matrix = compute_response_matrix(
+                lambda knob_values_step: evaluate(knob_values_step)[0], knob_values, target_values
+            )
+            response_matrix_fresh = True
+
+        # Newton step
+        knob_step = np.linalg.lstsq(response_matrix, residual, rcond=None)[0]
+        if not np.any(knob_step):
+            break
+        new_target_values, new_tw = evaluate(knob_values + knob_step)
+        residual_norm = np.linalg.norm(residual / tolerances)
+        if (
+            not response_matrix_fresh
+            and np.linalg.norm((requested_values - new_target_values) / tolerances)
+            >= residual_norm
+        ):
+            # The (cached) response matrix is too far off: compute it again
+            response_matrix = None
+            continue
+
+        # Even with an up-to-date response matrix, the step may overshoot (the response is not
+        # linear): halve it until it decreases the residual, and stop if it never does
+        n_halvings = 0
+        while (
+            np.linalg.norm((requested_values - new_target_values) / tolerances) >= residual_norm
+            and n_halvings < MAX_STEP_HALVINGS
+        ):
+            knob_step = knob_step / 2
+            new_target_values, new_tw = evaluate(knob_values + knob_step)
+            n_halvings += 1
+        if np.linalg.norm((requested_values - new_target_values) / tolerances) >= residual_norm:
+            break
+
+        response_matrix = return_broyden_update(
+            response_matrix, knob_step, new_target_values - target_values
+        )
+        response_matrix_fresh = False
+        knob_values = knob_values + knob_step
+        target_values, tw = new_target_values, new_tw
+
+    converged = np.all(np.abs(requested_values - target_values) <= tolerances)
+
+    # Keep the response matrix and the solution for the next matchings, and share the twiss of
+    # the matched knob state, which is applied to the session
+    if response_matrix is not None:
+        cache_functions.store_response_matrix(dataset["key"], l_knobs, l_targets, response_matrix)
+    if converged:
+        cache_functions.store_twiss(
+            dataset["key"],
+            registry_functions.return_knob_fingerprint(dataset, return_knob_state(knob_values)),
+            tw,
+            mode=mode,
+        )
+        l_solutions = [(target_values, knob_values)] + l_solutions[: MAX_MATCHING_SOLUTIONS - 1]
+        cache_functions.store_matching_solutions(dataset["key"], l_knobs, l_targets, l_solutions)
+
+    return (
+        dict(zip(l_knobs, knob_values.tolist())),
+        dict(zip(l_targets, target_values.tolist())),
+        n_twiss,
+        bool(converged),
+    )
@@ -4,9 +4,94 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 
+# Import functions
+import rendering_functions
+import precision_functions
+
+
+#################### Constants ####################
+
+# Twiss columns displayed in plot_around_IP, in the order of the figure traces
+L_COLUMNS_AROUND_IP = ["betx", "bety", "x", "y", "dx", "dy"]
+
+# Magnification factor applied to the strength of the multipoles of each order in the survey
+DIC_MULTIPOLE_MAGNIFICATION_FACTOR = {0: 5000, 1: 5000, 2: 5000, 3: 100}
+
+# Plotting parameters of the optics overlays of the survey, in the order of the figure traces
+DIC_OPTICS_OVERLAYS = {
+    "betax": {
+        "tw_name": "betx",
+        "exponent": 0.8,
+        "magnification_factor": 1.0,
+        "color": px.colors.qualitative.Plotly[3],
+        "name_beam_1": r"$\beta_{x1}^{0.8}$",
+        "name_beam_2": r"$\beta_{x2}^{0.8}$",
+    },
+    "bety": {
+        "tw_name": "bety",
+        "exponent": 0.8,
+        "magnification_factor": 1.0,
+        "color": px.colors.qualitative.Plotly[4],
+        "name_beam_1": r"$\beta_{y1}^{0.8}$",
+        "name_beam_2": r"$\beta_{y2}^{0.8}$",
+    },
+    "dx": {
+        "tw_name": "dx",
+        "exponent": 1.0,
+        "magnification_factor": 100,
+        "color": px.colors.qualitative.Plotly[5],
+        "name_beam_1": r"$100D_{x1}$",
+        "name_beam_2": r"$100D_{x2}$",
+    },
+    "dy": {
+        "tw_name": "dy",
+        "exponent": 1.0,
+        "magnification_factor": 100,
+        "color": px.colors.qualitative.Plotly[6],
+        "name_beam_1": r"$100D_{y1}$",
+        "name_beam_2": r"$100D_{y2}$",
+    },
+    "x": {
+        "tw_name": "x",
+        "exponent": 1.0,
+        "magnification_factor": 100000,
+        "color": px.colors.qualitative.Plotly[7],
+        "name_beam_1": r"$10^5x_1$",
+        "name_beam_2": r"$10^5x2$",
+    },
+    "y": {
+        "tw_name": "y",
+        "exponent": 1.0,
+        "magnification_factor": 100000,
+        "color": px.colors.qualitative.Plotly[8],
+        "name_beam_1": r"$10^5y_1$",
+        "name_beam_2": r"$10^5y2$",
+    },
+}
+
+# Twiss columns needed for the optics overlays of the survey
+L_COLUMNS_OPTICS_OVERLAYS = [dic_overlay["tw_name"] for dic_overlay in DIC_OPTICS_OVERLAYS.values()]
+
+# Number of traces (radial background lines and beam pipe) preceding the optics overlays in the
+# survey figure
+N_TRACES_BEFORE_OPTICS_SURVEY = 5
+
+# Number of traces preceding the multipoles and IPs in the survey figure (with the optics overlays
+# of both beams, as displayed by the app)
+N_TRACES_BEFORE_ELEMENTS_SURVEY = N_TRACES_BEFORE_OPTICS_SURVEY + 2 * len(DIC_OPTICS_OVERLAYS)
+
+# Fixed y-range of the subplot in which each twiss column is displayed
+DIC_Y_RANGE_AROUND_IP = {
+    "betx": [0, 10000],
+    "bety": [0, 10000],
+    "x": [-0.05, 0.05],
+    "y": [-0.05, 0.05],
+    "dx": [-1.5, 2.5],
+    "dy": [-1.5, 2.5],
+}
 
 #################### Functions ####################
-def return_radial_background_traces(df_sv):
+def return_radial_background_traces(df_sv, target="browser"):
     # Add 4 radial lines, each parametrized with a different set of x1, x2, y1, y2
     l_traces_background = []
     for x1, x2, y1, y2 in [
@@ -16,7 +101,8 @@ def return_radial_background_traces(df_sv):
         [-10000 + np.mean(df_sv["X"]), 10000 + np.mean(df_sv["X"]), 10000, -10000],
     ]:
         l_traces_background.append(
-            go.Scattergl(
+            rendering_functions.return_overlay_scatter_trace(
+                target=target,
                 x=[x1, x2],
                 y=[y1, y2],
                 mode="lines",
@@ -32,27 +118,29 @@ def return_radial_background_traces(df_sv):
     return l_traces_background
 
 
-def return_beam_pipe_trace(df_sv):
+def return_beam_pipe_trace(df_sv, target="browser"):
     # Return a Plotly trace containing the beam pipe
-    return go.Scattergl(
-        x=df_sv["X"],
-        y=df_sv["Z"],
+    return rendering_functions.return_overlay_scatter_trace(
+        target=target,
+        x=precision_functions.return_plotting_array(df_sv["X"].to_numpy()),
+        y=precision_functions.return_plotting_array(df_sv["Z"].to_numpy()),
         mode="lines",
         name="Drift space",
         line_color="darkgrey",
         line_width=3,
         hoverinfo="skip",
         showlegend=False,
+        meta="rasterizable",
     )
 
 
 def return_multipole_trace(
-    df_elements,
-    df_sv,
+    dic_store,
     order,
     strength_magnification_factor=5000,
     add_ghost_trace=True,
-    l_indices_to_keep=None,
+    l_sectors_to_keep=None,
+    target="browser",
 ):
     # Get corresponding colors and name for the multipoles
     if order == 0:
@@ -68,22 +156,18 @@ def return_multipole_trace(
         color = px.colors.qualitative.Plotly[2]
         name = "Octupoles"
 
-    # Get strength of all multipoles of the requested order
-    s_knl = df_elements[df_elements.order == order]["knl"].apply(lambda x: x[order])
-
-    # Remove zero-strength dipoles and magnify
-    s_knl = s_knl[s_knl != 0] * strength_magnification_factor
-
-    # Filter out indices outside of the range if needed
-    if l_indices_to_keep is not None:
-        s_knl = s_knl[s_knl.index.isin(l_indices_to_keep)]
-
-    # Get corresponding lengths
-    s_lengths = df_elements.loc[s_knl.index].length
+    # Get the segments representing the multipoles
+    dic_segments = return_multipole_segments(
+        dic_store,
+        order,
+        strength_magnification_factor=strength_magnification_factor,
+        l_sectors_to_keep=l_sectors_to_keep,
+    )
 
     # Ghost trace for legend if requested
     if add_ghost_trace:
-        ghost_trace = go.Scattergl(
+        ghost_trace = rendering_functions.return_overlay_scatter_trace(
+            target=target,
             x=[200000, 200001],
             y=[0, 0],
             mode="lines",
@@ -94,87 +178,164 @@ def return_multipole_trace(
             # visible="legendonly",
         )
 
-    # # Add all multipoles individually (# ? Maybe one could use a scattergl with a list of x and y coordinates instead of a loop to gain time?)
-    # l_traces = []
-    # for i, row in df_sv.loc[s_knl.index].iterrows():
-    #     theta = np.pi + row["theta"]
+    # Add all multipoles at once, merge them by line width. Each point only carries the (int32)
+    # index of its multipole, whose name is looked up server-side when clicked.
+    l_traces = []
+    for width in np.unique(dic_segments["width"]):
+        mask = dic_segments["width"] == width
+        x = np.column_stack(
+            [dic_segments["x0"][mask], dic_segments["x1"][mask], np.full(np.sum(mask), np.nan)]
+        ).ravel()
+        y = np.column_stack(
+            [dic_segments["z0"][mask], dic_segments["z1"][mask], np.full(np.sum(mask), np.nan)]
+        ).ravel()
+        customdata = np.repeat(dic_segments["idx"][mask], 3)
+        l_traces.append(
+            rendering_functions.return_overlay_scatter_trace(
+                target=target,
+                x=precision_functions.return_plotting_array(x),
+                y=precision_functions.return_plotting_array(y),
+                mode="lines",
+                line=dict(
+                    color=color,
+                    width=width,
+                ),
+                showlegend=False,
+                name=name,
+                legendgroup=name,
+                customdata=customdata,
+                hovertemplate=name[:-1] + "<extra></extra>",
+                meta="rasterizable",
+            )
+        )
 
-    #     # Correct for dipoles with zero height
-    #     if abs(s_knl[i]) <= 0.5:
-    #         s_knl[i] = np.sign(s_knl[i]) * 1.0
+    # Return result in a list readable by plotly.add_traces()
+    return [ghost_trace] + l_traces if add_ghost_trace else l_traces
 
-    #     # Add traces
-    #     l_traces.append(
-    #         go.Scattergl(
-    #             x=[
-    #                 # row["X"] - s_knl[i] / 2 * np.cos(theta),
-    #                 row["X"],
-    #                 # row["X"] + s_knl[i] / 2 * np.cos(theta),
-    #                 row["X"] + s_knl[i] * np.cos(theta),
-    #             ],
-    #             y=[
-    #                 row["Z"],
-    #                 # row["Z"] + s_knl[i] / 2 * np.sin(theta),
-    #                 row["Z"] + s_knl[i] * np.sin(theta),
-    #             ],
-    #             customdata=[row["name"], row["name"]],
-    #             mode="lines",
-    #             line=dict(
-    #                 color=color,
-    #                 width=np.ceil(s_lengths[i])
-    #                 if not np.isnan(s_lengths[i]) or np.ceil(s_lengths[i]) == 0
-    #                 else 1,
-    #             ),
-    #             showlegend=False,
-    #             name=row["name"],
-    #             legendgroup=name,
-    #         )
-    #     )
 
-    # Add all multipoles at once, merge them by line width
-    dic_trace = {}
-    for i, row in df_sv.loc[s_knl.index].iterrows():
-        width = (
-            np.ceil(s_lengths[i]) if not np.isnan(s_lengths[i]) or np.ceil(s_lengths[i]) == 0 else 1
-        )
+def return_multipole_segments(
+    dic_store,
+    order,
+    strength_magnification_factor=5000,
+    l_sectors_to_keep=None,
+):
+    """Return the names, indices (in return_multipole_names()), endpoints and widths of the
+    segments drawn for the multipoles of a given order, from the plotting store of the dataset."""
+    df_multipoles = dic_store["multipoles"][order]
+
+    # Remove zero-strength multipoles, and sectors that are not displayed
+    mask = df_multipoles["strength"].to_numpy() != 0
+    if l_sectors_to_keep is not None:
+        mask &= df_multipoles["sector"].isin(l_sectors_to_keep).to_numpy()
+
+    # Magnify strength
+    strength = df_multipoles["strength"].to_numpy()[mask] * strength_magnification_factor
+    lengths = df_multipoles["length"].to_numpy()[mask]
+    theta = df_multipoles["theta"].to_numpy()[mask]
+    x0 = df_multipoles["X"].to_numpy()[mask]
+    z0 = df_multipoles["Z"].to_numpy()[mask]
+
+    return {
+        "name": df_multipoles["name"].to_numpy()[mask],
+        "idx": (return_multipole_index_offset(dic_store, order) + np.flatnonzero(mask)).astype(
+            np.int32
+        ),
+        "x0": x0,
+        "z0": z0,
+        "x1": x0 + strength * np.cos(theta),
+        "z1": z0 + strength * np.sin(theta),
+        "width": np.where(np.isnan(lengths), 1, np.ceil(lengths)),
+    }
+
+
+def return_multipole_names(dic_store):
+    """Return the names of the multipoles of the plotting store of the dataset, all orders merged,
+    in the order of the indices attached to the survey segments."""
+    return np.concatenate(
+        [df_multipoles["name"].to_numpy() for df_multipoles in dic_store["multipoles"].values()]
+    )
 
-        if width in dic_trace:
-            dic_trace[width]["x"].extend(
-                [row["X"], row["X"] + s_knl[i] * np.cos(row["theta"]), None]
+
+def return_multipole_index_offset(dic_store, order):
+    """Return the index of the first multipole of a given order in return_multipole_names()."""
+    offset = 0
+    for order_store, df_multipoles in dic_store["multipoles"].items():
+        if order_store == order:
+            break
+        offset += len(df_multipoles)
+    return offset
+
+
+def return_survey_tile_layers(dic_store, df_sv, l_sectors):
+    """Return the layers (beam pipe, and multipoles of each sector) of the survey to rasterize, in
+    the format expected by raster_functions.return_tile_layers()."""
+    # Beam pipe, drawn as consecutive segments
+    X = df_sv["X"].to_numpy(dtype=np.float64)
+    Z = df_sv["Z"].to_numpy(dtype=np.float64)
+    l_layers = [("ring", [(X[:-1], Z[:-1], X[1:], Z[1:], "#A9A9A9", 3)])]
+
+    # Multipoles, one layer per sector so that sectors can be displayed independently
+    for sector in l_sectors:
+        l_segments = []
+        for order, color in zip(
+            DIC_MULTIPOLE_MAGNIFICATION_FACTOR,
+            [
+                px.colors.qualitative.Plotly[0],
+                px.colors.qualitative.Plotly[1],
+                px.colors.qualitative.Plotly[-1],
+                px.colors.qualitative.Plotly[2],
+            ],
+        ):
+            dic_segments = return_multipole_segments(
+                dic_store,
+                order,
+                strength_magnification_factor=DIC_MULTIPOLE_MAGNIFICATION_FACTOR[order],
+                l_sectors_to_keep=[sector],
             )
-            dic_trace[width]["y"].extend(
-                [row["Z"], row["Z"] + s_knl[i] * np.sin(row["theta"]), None]
+            l_segments.append(
+                (
+                    dic_segments["x0"],
+                    dic_segments["z0"],
+                    dic_segments["x1"],
+                    dic_segments["z1"],
+                    color,
+                    dic_segments["width"],
+                )
             )
-            dic_trace[width]["customdata"].extend([row["name"], row["name"], None])
-        else:
-            dic_trace[width] = {
-                "x": [row["X"], row["X"] + s_knl[i] * np.cos(row["theta"]), None],
-                "y": [row["Z"], row["Z"] + s_knl[i] * np.sin(row["theta"]), None],
-                "customdata": [row["name"], row["name"], None],
-                "mode": "lines",
-                "line": dict(
-                    color=color,
-                    width=width,
-                ),
-                "showlegend": False,
-                "name": row["name"],
-                "legendgroup": name,
-                "hovertemplate": "Magnet: %{customdata}" + "<extra></extra>",
-            }
+        l_layers.append((sector, l_segments))
 
-    l_traces = [go.Scattergl(**dic_trace[width]) for width in dic_trace]
+    return l_layers
 
-    # Return result in a list readable by plotly.add_traces()
-    return [ghost_trace] + l_traces if add_ghost_trace else l_traces
+
+def return_indices_rasterizable_traces(fig):
+    """Return the indices of the traces of the survey that are replaced by tiles when zoomed out."""
+    return [idx for idx, trace in enumerate(fig.data) if trace.meta == "rasterizable"]
+
+
+def return_all_multipole_segments(dic_store):
+    """Return the segments of all the multipoles drawn in the survey, merged across orders."""
+    l_dic_segments = [
+        return_multipole_segments(
+            dic_store,
+            order,
+            strength_magnification_factor=DIC_MULTIPOLE_MAGNIFICATION_FACTOR[order],
+        )
+        for order in DIC_MULTIPOLE_MAGNIFICATION_FACTOR
+    ]
+    return {
+        key: np.concatenate([dic_segments[key] for dic_segments in l_dic_segments])
+        for key in l_dic_segments[0]
+    }
 
 
-def return_IP_trace(df_sv, add_ghost_trace=True):
+def return_IP_trace(dic_store, add_ghost_trace=True, target="browser"):
     # Get dataframe containing only IP elements
-    df_ip = df_sv[df_sv["name"].str.startswith("ip")]
+    df_ip = dic_store["ip"]
 
     # Ghost trace for legend if requested
     if add_ghost_trace:
-        ghost_trace = go.Scattergl(
+        ghost_trace = rendering_functions.return_overlay_scatter_trace(
+            target=target,
             x=[200000, 200000],
             y=[0, 0],
             mode="markers",
@@ -212,7 +373,8 @@ def return_IP_trace(df_sv, add_ghost_trace=True):
 
     # Add all IP at once
     l_traces = [
-        go.Scattergl(
+        rendering_functions.return_overlay_scatter_trace(
+            target=target,
             mode="markers",
             x=df_ip["X"],
             y=df_ip["Z"],
@@ -233,98 +395,142 @@ def return_IP_trace(df_sv, add_ghost_trace=True):
     return [ghost_trace] + l_traces if add_ghost_trace else l_traces
 
 
-def return_optic_trace(df_sv, df_tw, type_trace, hide_optics_traces_initially=True, beam_2=False):
-    # Get the right twiss dataframe and plotting parameters
-    match type_trace:
-        case "betax":
-            magnification_factor = 1.0
-            tw_name = "betx"
-            name = r"$\beta_{x2}^{0.8}$" if beam_2 else r"$\beta_{x1}^{0.8}$"
-            color = px.colors.qualitative.Plotly[3]
-            dash = "dash" if beam_2 else None
-            exponent = 0.8
-
-        case "bety":
-            magnification_factor = 1.0
-            tw_name = "bety"
-            name = r"$\beta_{y2}^{0.8}$" if beam_2 else r"$\beta_{y1}^{0.8}$"
-            color = px.colors.qualitative.Plotly[4]
-            dash = "dash" if beam_2 else None
-            exponent = 0.8
-
-        case "dx":
-            magnification_factor = 100
-            tw_name = "dx"
-            name = r"$100D_{x2}$" if beam_2 else r"$100D_{x1}$"
-            color = px.colors.qualitative.Plotly[5]
-            dash = "dash" if beam_2 else None
-            exponent = 1.0
-
-        case "dy":
-            magnification_factor = 100
-            tw_name = "dy"
-            name = r"$100D_{y2}$" if beam_2 else r"$100D_{y1}$"
-            color = px.colors.qualitative.Plotly[6]
-            dash = "dash" if beam_2 else None
-            exponent = 1.0
-
-        case "x":
-            magnification_factor = 100000
-            tw_name = "x"
-            name = r"$10^5x2$" if beam_2 else r"$10^5x_1$"
-            color = px.colors.qualitative.Plotly[7]
-            dash = "dash" if beam_2 else None
-            exponent = 1.0
-
-        case "y":
-            magnification_factor = 100000
-            tw_name = "y"
-            name = r"$10^5y2$" if beam_2 else r"$10^5y_1$"
-            color = px.colors.qualitative.Plotly[8]
-            dash = "dash" if beam_2 else None
-            exponent = 1.0
-
-        case _:
-            print("The type of trace is not recognized.")
-
+def return_projection_basis(df_sv, beam_2=False):
+    """Return the survey coordinates and unit normal vectors on which the optics overlays are
+    projected. The returned dictionnary also caches the last projection of each overlay."""
     # Correct for circular projection depending if x-coordinate has been reversed or not
-    if beam_2:
-        correction = -1
+    correction = -1 if beam_2 else 1
+    theta = df_sv["theta"].to_numpy(dtype=np.float64)
+    return {
+        "X": df_sv["X"].to_numpy(dtype=np.float64),
+        "Z": df_sv["Z"].to_numpy(dtype=np.float64),
+        "normal_x": correction * np.cos(theta),
+        "normal_z": np.sin(theta),
+        "beam_2": beam_2,
+        "tw_matrix": None,
+        "X_projected": None,
+        "Z_projected": None,
+    }
+
+
+def project_optics(projection_basis, df_tw):
+    """Project all the optics overlays on the survey at once, as a (n_points x n_observables)
+    matrix operation. Only the overlays whose twiss column changed since the previous call are
+    recomputed. Return the list of re-projected overlays."""
+    l_types_trace = list(DIC_OPTICS_OVERLAYS.keys())
+    tw_matrix = np.column_stack(
+        [
+            np.asarray(df_tw[DIC_OPTICS_OVERLAYS[type_trace]["tw_name"]], dtype=np.float64)
+            for type_trace in l_types_trace
+        ]
+    )
+
+    # Get the columns that changed (NaN are considered equal to themselves)
+    previous_tw_matrix = projection_basis["tw_matrix"]
+    if previous_tw_matrix is None or previous_tw_matrix.shape != tw_matrix.shape:
+        changed = np.ones(len(l_types_trace), dtype=bool)
+        projection_basis["X_projected"] = np.empty_like(tw_matrix)
+        projection_basis["Z_projected"] = np.empty_like(tw_matrix)
     else:
-        correction = 1
+        changed = np.any(
+            (tw_matrix != previous_tw_matrix)
+            & ~(np.isnan(tw_matrix) & np.isnan(previous_tw_matrix)),
+            axis=0,
+        )
+    l_idx_changed = np.flatnonzero(changed)
+
+    # Re-project the changed columns only
+    if len(l_idx_changed) > 0:
+        exponents = np.array([DIC_OPTICS_OVERLAYS[t]["exponent"] for t in l_types_trace])
+        factors = np.array([DIC_OPTICS_OVERLAYS[t]["magnification_factor"] for t in l_types_trace])
+        offsets = (
+            np.power(tw_matrix[:, l_idx_changed], exponents[l_idx_changed])
+            * factors[l_idx_changed]
+        )
+        projection_basis["X_projected"][:, l_idx_changed] = (
+            projection_basis["X"][:, None] - offsets * projection_basis["normal_x"][:, None]
+        )
+        projection_basis["Z_projected"][:, l_idx_changed] = (
+            projection_basis["Z"][:, None] - offsets * projection_basis["normal_z"][:, None]
+        )
+
+    projection_basis["tw_matrix"] = tw_matrix
+    return [l_types_trace[idx] for idx in l_idx_changed]
+
+
+def return_optic_trace(
+    df_sv,
+    df_tw,
+    type_trace,
+    hide_optics_traces_initially=True,
+    beam_2=False,
+    projection_basis=None,
+    target="browser",
+):
+    # Get the plotting parameters
+    if type_trace not in DIC_OPTICS_OVERLAYS:
+        print("The type of trace is not recognized.")
+    dic_overlay = DIC_OPTICS_OVERLAYS[type_trace]
+
+    # Project the optics on the survey, if not already done
+    if projection_basis is None:
+        projection_basis = return_projection_basis(df_sv, beam_2=beam_2)
+        project_optics(projection_basis, df_tw)
+    idx_trace = list(DIC_OPTICS_OVERLAYS.keys()).index(type_trace)
 
     # Return the trace
-    return go.Scattergl(
-        x=df_sv["X"]
-        - df_tw[tw_name] ** exponent * correction * magnification_factor * np.cos(df_sv["theta"]),
-        y=df_sv["Z"] - df_tw[tw_name] ** exponent * magnification_factor * np.sin(df_sv["theta"]),
+    return rendering_functions.return_overlay_scatter_trace(
+        target=target,
+        x=precision_functions.return_plotting_array(projection_basis["X_projected"][:, idx_trace]),
+        y=precision_functions.return_plotting_array(projection_basis["Z_projected"][:, idx_trace]),
         mode="lines",
-        line=dict(color=color, width=2, dash=dash),
+        line=dict(color=dic_overlay["color"], width=2, dash="dash" if beam_2 else None),
         showlegend=True,
-        name=name,
+        name=dic_overlay["name_beam_2"] if beam_2 else dic_overlay["name_beam_1"],
         visible="legendonly" if hide_optics_traces_initially else True,
+        # Optics traces are drawn below the magnets, but listed after them in the legend
+        legendrank=2000,
+    )
+
+
+def return_survey_optics_updates(projection_basis, l_types_trace):
+    """Return the new coordinates of the given optics overlays, indexed by their trace number in
+    the figure built by return_plot_lattice_with_tracking (with all overlays displayed)."""
+    l_all_types_trace = list(DIC_OPTICS_OVERLAYS.keys())
+    offset = N_TRACES_BEFORE_OPTICS_SURVEY + (
+        len(l_all_types_trace) if projection_basis["beam_2"] else 0
     )
+    dic_updates = {}
+    for type_trace in l_types_trace:
+        idx_column = l_all_types_trace.index(type_trace)
+        x = projection_basis["X_projected"][:, idx_column]
+        y = projection_basis["Z_projected"][:, idx_column]
+        dic_updates[offset + idx_column] = (
+            precision_functions.return_plotting_array(x),
+            precision_functions.return_plotting_array(y),
+        )
+    return dic_updates
 
 
 def add_multipoles_to_fig(
     fig,
-    df_elements,
-    df_sv,
-    l_indices_to_keep,
+    dic_store,
+    l_sectors_to_keep,
     add_dipoles,
     add_quadrupoles,
     add_sextupoles,
     add_octupoles,
+    target="browser",
 ):
     # Add dipoles if requested
     if add_dipoles:
         fig.add_traces(
             return_multipole_trace(
-                df_elements,
-                df_sv,
+                dic_store,
                 order=0,
-                strength_magnification_factor=5000,
-                l_indices_to_keep=l_indices_to_keep,
+                strength_magnification_factor=DIC_MULTIPOLE_MAGNIFICATION_FACTOR[0],
+                l_sectors_to_keep=l_sectors_to_keep,
+                target=target,
             )
         )
 
@@ -332,11 +538,11 @@ def add_multipoles_to_fig(
     if add_quadrupoles:
         fig.add_traces(
             return_multipole_trace(
-                df_elements,
-                df_sv,
+                dic_store,
                 order=1,
-                strength_magnification_factor=5000,
-                l_indices_to_keep=l_indices_to_keep,
+                strength_magnification_factor=DIC_MULTIPOLE_MAGNIFICATION_FACTOR[1],
+                l_sectors_to_keep=l_sectors_to_keep,
+                target=target,
             )
         )
 
@@ -344,11 +550,11 @@ def add_multipoles_to_fig(
     if add_sextupoles:
         fig.add_traces(
             return_multipole_trace(
-                df_elements,
-                df_sv,
+                dic_store,
                 order=2,
-                strength_magnification_factor=5000,
-                l_indices_to_keep=l_indices_to_keep,
+                strength_magnification_factor=DIC_MULTIPOLE_MAGNIFICATION_FACTOR[2],
+                l_sectors_to_keep=l_sectors_to_keep,
+                target=target,
             )
         )
 
@@ -356,11 +562,11 @@ def add_multipoles_to_fig(
     if add_octupoles:
         fig.add_traces(
             return_multipole_trace(
-                df_elements,
-                df_sv,
+                dic_store,
                 order=3,
-                strength_magnification_factor=100,
-                l_indices_to_keep=l_indices_to_keep,
+                strength_magnification_factor=DIC_MULTIPOLE_MAGNIFICATION_FACTOR[3],
+                l_sectors_to_keep=l_sectors_to_keep,
+                target=target,
             )
         )
 
@@ -378,37 +584,44 @@ def add_optics_to_fig(
     df_sv,
     df_tw,
     beam_2=False,
+    projection_basis=None,
+    target="browser",
 ):
-    # Add horizontal betatron if requested
-    if plot_horizontal_betatron:
-        fig.add_trace(return_optic_trace(df_sv, df_tw, type_trace="betax", beam_2=beam_2))
-
-    # Add vertical betatron if requested
-    if plot_vertical_betatron:
-        fig.add_trace(return_optic_trace(df_sv, df_tw, type_trace="bety", beam_2=beam_2))
-
-    # Add horizontal dispersion if requested
-    if plot_horizontal_dispersion:
-        fig.add_trace(return_optic_trace(df_sv, df_tw, type_trace="dx", beam_2=beam_2))
-
-    # Add vertical dispersion if requested
-    if plot_vertical_dispersion:
-        fig.add_trace(return_optic_trace(df_sv, df_tw, type_trace="dy", beam_2=beam_2))
-
-    # Add horizontal position if requested
-    if plot_horizontal_position:
-        fig.add_trace(return_optic_trace(df_sv, df_tw, type_trace="x", beam_2=beam_2))
-
-    # Add vertical position if requested
-    if plot_vertical_position:
-        fig.add_trace(return_optic_trace(df_sv, df_tw, type_trace="y", beam_2=beam_2))
+    # Project all optics at once if no up-to-date projection is provided
+    if projection_basis is None:
+        projection_basis = return_projection_basis(df_sv, beam_2=beam_2)
+        project_optics(projection_basis, df_tw)
+
+    # Add the requested traces
+    for type_trace, plot_trace in zip(
+        DIC_OPTICS_OVERLAYS.keys(),
+        [
+            plot_horizontal_betatron,
+            plot_vertical_betatron,
+            plot_horizontal_dispersion,
+            plot_vertical_dispersion,
+            plot_horizontal_position,
+            plot_vertical_position,
+        ],
+    ):
+        if plot_trace:
+            fig.add_trace(
+                return_optic_trace(
+                    df_sv,
+                    df_tw,
+                    type_trace=type_trace,
+                    beam_2=beam_2,
+                    projection_basis=projection_basis,
+                    target=target,
+                )
+            )
 
     return fig
 
 
 def return_plot_lattice_with_tracking(
     df_sv,
-    df_elements,
+    dic_store,
     df_tw,
     df_sv_4=None,
     df_tw_4=None,
@@ -417,7 +630,7 @@ def return_plot_lattice_with_tracking(
     add_sextupoles=True,
     add_octupoles=True,
     add_IP=True,
-    l_indices_to_keep=None,
+    l_sectors_to_keep=None,
     plot_horizontal_betatron=True,
     plot_vertical_betatron=True,
     plot_horizontal_dispersion=True,
@@ -428,6 +641,9 @@ def return_plot_lattice_with_tracking(
     plot_vertical_momentum=True,
     hide_optics_traces_initially=True,
     add_optics_beam_2=True,
+    projection_basis=None,
+    projection_basis_4=None,
+    target="browser",
 ):
     # Center X coordinate (otherwise conversion to polar coordinates is not possible)
     X_centered = df_sv["X"] - np.mean(df_sv["X"])
@@ -439,28 +655,13 @@ def return_plot_lattice_with_tracking(
     fig = go.Figure()
 
     # Add lines to the bakckground delimit octants
-    fig.add_traces(return_radial_background_traces(df_sv))
+    fig.add_traces(return_radial_background_traces(df_sv, target=target))
 
     # Add beam pipe
-    fig.add_trace(return_beam_pipe_trace(df_sv))
+    fig.add_trace(return_beam_pipe_trace(df_sv, target=target))
 
-    # Add multipoles
-    fig = add_multipoles_to_fig(
-        fig,
-        df_elements,
-        df_sv,
-        l_indices_to_keep,
-        add_dipoles,
-        add_quadrupoles,
-        add_sextupoles,
-        add_octupoles,
-    )
-
-    # Add IP if requested
-    if add_IP:
-        fig.add_traces(return_IP_trace(df_sv))
-
-    # Add optics traces for beam_1
+    # Add optics traces for beam_1 (before the multipoles, so that the index of the optics traces
+    # does not depend on the number of multipoles displayed)
     fig = add_optics_to_fig(
         fig,
         plot_horizontal_betatron,
@@ -472,6 +673,8 @@ def return_plot_lattice_with_tracking(
         df_sv,
         df_tw,
         beam_2=False,
+        projection_basis=projection_basis,
+        target=target,
     )
 
     # Add optics traces for beam_2 if requested
@@ -490,8 +693,26 @@ def return_plot_lattice_with_tracking(
                 df_sv_4,
                 df_tw_4,
                 beam_2=True,
+                projection_basis=projection_basis_4,
+                target=target,
             )
 
+    # Add multipoles
+    fig = add_multipoles_to_fig(
+        fig,
+        dic_store,
+        l_sectors_to_keep,
+        add_dipoles,
+        add_quadrupoles,
+        add_sextupoles,
+        add_octupoles,
+        target=target,
+    )
+
+    # Add IP if requested
+    if add_IP:
+        fig.add_traces(return_IP_trace(dic_store, target=target))
+
     # Set general layout for figure
     fig.update_layout(
         title_text="LHC layout and beam dynamics",
@@ -515,13 +736,46 @@ def return_plot_lattice_with_tracking(
     return fig
 
 
-def plot_around_IP(tw_part):
+def return_title_around_IP(tw_part):
+    """Return the LaTeX title (tunes, chromaticities, transition energy) of the optics figure. The
+    quantities missing from the twiss (e.g. computed without chromatic properties) are displayed as
+    dots, until a full twiss is available."""
+
+    def return_formatted_scalar(scalar, format_spec, function=lambda x: x):
+        if scalar not in tw_part or tw_part[scalar] is None:
+            return r"\dots"
+        return format(function(tw_part[scalar]), format_spec)
+
+    return (
+        r"$q_x = "
+        + return_formatted_scalar("qx", ".5f")
+        + r"\hspace{0.5cm}"
+        + r" q_y = "
+        + return_formatted_scalar("qy", ".5f")
+        + r"\hspace{0.5cm}"
+        + r"Q'_x = "
+        + return_formatted_scalar("dqx", ".2f")
+        + r"\hspace{0.5cm}"
+        + r" Q'_y = "
+        + return_formatted_scalar("dqy", ".2f")
+        + r"\hspace{0.5cm}"
+        + r" \gamma_{tr} = "
+        + return_formatted_scalar("momentum_compaction_factor", ".2f", lambda x: 1 / np.sqrt(x))
+        + r"$"
+    )
+
+
+def plot_around_IP(tw_part, target="browser"):
+    # Get the longitudinal coordinate, common to all traces
+    s_plot = precision_functions.return_plotting_array(tw_part["s"])
+
     # Build figure
     fig = make_subplots(rows=3, cols=1, shared_xaxes=True)
     fig.append_trace(
-        go.Scatter(
-            x=tw_part["s"],
-            y=tw_part["betx"],
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=s_plot,
+            y=precision_functions.return_plotting_array(tw_part["betx"]),
             mode="lines",
             showlegend=True,
             name=r"$\beta_x$",
@@ -532,9 +786,10 @@ def plot_around_IP(tw_part):
     )
 
     fig.append_trace(
-        go.Scatter(
-            x=tw_part["s"],
-            y=tw_part["bety"],
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=s_plot,
+            y=precision_functions.return_plotting_array(tw_part["bety"]),
             mode="lines",
             showlegend=True,
             name=r"$\beta_y$",
@@ -545,9 +800,10 @@ def plot_around_IP(tw_part):
     )
 
     fig.append_trace(
-        go.Scatter(
-            x=tw_part["s"],
-            y=tw_part["x"],
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=s_plot,
+            y=precision_functions.return_plotting_array(tw_part["x"]),
             mode="lines",
             showlegend=True,
             name=r"$x$",
@@ -560,9 +816,10 @@ def plot_around_IP(tw_part):
     )
 
     fig.append_trace(
-        go.Scatter(
-            x=tw_part["s"],
-            y=tw_part["y"],
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=s_plot,
+            y=precision_functions.return_plotting_array(tw_part["y"]),
             mode="lines",
             showlegend=True,
             name=r"$y$",
@@ -575,9 +832,10 @@ def plot_around_IP(tw_part):
     )
 
     fig.append_trace(
-        go.Scatter(
-            x=tw_part["s"],
-            y=tw_part["dx"],
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=s_plot,
+            y=precision_functions.return_plotting_array(tw_part["dx"]),
             mode="lines",
             showlegend=True,
             name=r"$D_x$",
@@ -590,9 +848,10 @@ def plot_around_IP(tw_part):
     )
 
     fig.append_trace(
-        go.Scatter(
-            x=tw_part["s"],
-            y=tw_part["dy"],
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=s_plot,
+            y=precision_functions.return_plotting_array(tw_part["dy"]),
             mode="lines",
             showlegend=True,
             name=r"$D_y$",
@@ -606,14 +865,8 @@ def plot_around_IP(tw_part):
 
     # Update overall layout
     fig.update_layout(
-        title_text=r"$q_x = " + f'{tw_part["qx"]:.5f}' + r"\hspace{0.5cm}" + r" q_y = "
-        f'{tw_part["qy"]:.5f}' + r"\hspace{0.5cm}" + r"Q'_x = "
-        f'{tw_part["dqx"]:.2f}' + r"\hspace{0.5cm}" + r" Q'_y = "
-        f'{tw_part["dqy"]:.2f}'
-        + r"\hspace{0.5cm}"
-        + r" \gamma_{tr} = "
-        + f'{1/np.sqrt(tw_part["momentum_compaction_factor"]):.2f}'
-        + r"$",  # "Transverse dynamics evolution with crossing angle",
+        # "Transverse dynamics evolution with crossing angle",
+        title_text=return_title_around_IP(tw_part),
         title_x=0.5,
         showlegend=True,
         xaxis_showgrid=True,
@@ -629,9 +882,13 @@ def plot_around_IP(tw_part):
     )
 
     # Update yaxis properties
-    fig.update_yaxes(title_text=r"$\beta_{x,y}$ [m]", range=[0, 10000], row=1, col=1)
-    fig.update_yaxes(title_text=r"(Closed orbit)$_{x,y}$ [m]", range=[-0.05, 0.05], row=2, col=1)
-    fig.update_yaxes(title_text=r"$D_{x,y}$ [m]", range=[-1.5, 2.5], row=3, col=1)
+    fig.update_yaxes(
+        title_text=r"$\beta_{x,y}$ [m]", range=DIC_Y_RANGE_AROUND_IP["betx"], row=1, col=1
+    )
+    fig.update_yaxes(
+        title_text=r"(Closed orbit)$_{x,y}$ [m]", range=DIC_Y_RANGE_AROUND_IP["x"], row=2, col=1
+    )
+    fig.update_yaxes(title_text=r"$D_{x,y}$ [m]", range=DIC_Y_RANGE_AROUND_IP["dx"], row=3, col=1)
     fig.update_xaxes(title_text=r"$s$", row=3, col=1)
     fig.update_yaxes(fixedrange=True)
 
@@ -645,3 +902,212 @@ def plot_around_IP(tw_part):
     # )
 
     return fig
+
+
+def return_columns_around_IP(tw_part):
+    """Return a copy of the twiss columns displayed in plot_around_IP."""
+    return {column: np.array(tw_part[column], dtype=np.float64) for column in L_COLUMNS_AROUND_IP}
+
+
+def return_updated_columns_around_IP(tw_part, dic_previous_columns, tolerance=1e-6):
+    """Return the traces of plot_around_IP whose y-values changed since the previous twiss.
+
+    A column is considered unchanged if its largest variation is below tolerance times the span
+    of the y-axis it is displayed on (i.e. the difference would not be visible). The function
+    returns a dictionnary mapping trace indices to new y-values, and the new columns, to be used
+    as reference for the next update.
+    """
+    dic_columns = return_columns_around_IP(tw_part)
+    dic_updated_traces = {}
+    for idx_trace, column in enumerate(L_COLUMNS_AROUND_IP):
+        # Skip columns that did not change beyond tolerance
+        previous_column = dic_previous_columns.get(column)
+        if previous_column is not None and previous_column.shape == dic_columns[column].shape:
+            y_min, y_max = DIC_Y_RANGE_AROUND_IP[column]
+            if np.max(np.abs(dic_columns[column] - previous_column)) <= tolerance * (y_max - y_min):
+                # Keep the previous reference so that slow drifts are eventually displayed
+                dic_columns[column] = previous_column
+                continue
+
+        dic_updated_traces[idx_trace] = precision_functions.return_plotting_array(
+            dic_columns[column]
+        )
+
+    return dic_updated_traces, dic_columns
+
+
+def plot_tracking(dic_phase_space, dic_turn_by_turn, turn, n_turns, target="browser"):
+    """Return the figure of a tracking: the phase space of the displayed particles over the last
+    chunk of turns, and the turn-by-turn centroid and rms size of the displayed particles, and
+    number of particles alive."""
+    fig = make_subplots(
+        rows=2,
+        cols=2,
+        subplot_titles=(
+            "Horizontal phase space",
+            "Vertical phase space",
+            "Centroid and rms size (displayed particles)",
+            "Particles alive",
+        ),
+    )
+    for col, (coordinate, momentum) in enumerate([("x", "px"), ("y", "py")], start=1):
+        fig.append_trace(
+            rendering_functions.return_scatter_trace(
+                target=target,
+                x=precision_functions.return_plotting_array(dic_phase_space[coordinate]),
+                y=precision_functions.return_plotting_array(dic_phase_space[momentum]),
+                mode="markers",
+                marker_size=2,
+                showlegend=False,
+                name=f"{coordinate}-{momentum}",
+            ),
+            row=1,
+            col=col,
+        )
+        fig.update_xaxes(title_text=f"{coordinate} [m]", row=1, col=col)
+        fig.update_yaxes(title_text=f"{momentum}", row=1, col=col)
+
+    turns = dic_turn_by_turn["turn"]
+    for column, name in [
+        ("mean_x", r"$\langle x \rangle$"),
+        ("mean_y", r"$\langle y \rangle$"),
+        ("rms_x", r"$\sigma_x$"),
+        ("rms_y", r"$\sigma_y$"),
+    ]:
+        fig.append_trace(
+            rendering_functions.return_scatter_trace(
+                target=target,
+                x=turns,
+                y=precision_functions.return_plotting_array(dic_turn_by_turn[column]),
+                mode="lines",
+                name=name,
+            ),
+            row=2,
+            col=1,
+        )
+    fig.append_trace(
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=turns,
+            y=dic_turn_by_turn["n_alive"],
+            mode="lines",
+            showlegend=False,
+            name="Particles alive",
+        ),
+        row=2,
+        col=2,
+    )
+    fig.update_xaxes(title_text="Turn", range=[0, n_turns], row=2, col=1)
+    fig.update_xaxes(title_text="Turn", range=[0, n_turns], row=2, col=2)
+    fig.update_yaxes(title_text="[m]", row=2, col=1)
+
+    fig.update_layout(
+        title_text=f"Turn {turn}/{n_turns}",
+        title_x=0.5,
+        width=1000,
+        height=800,
+        template="plotly_white",
+        uirevision="Don't change",
+    )
+    return fig
+
+
+def plot_footprint(footprint, n_r, n_theta, target="browser"):
+    """Return the figure of a tune footprint (colored by the initial amplitude), and of the
+    amplitude detuning along the grid lines closest to the horizontal and vertical planes."""
+    amplitude = np.sqrt(footprint["x_norm"] ** 2 + footprint["y_norm"] ** 2)
+    fig = make_subplots(rows=1, cols=2, subplot_titles=("Tune footprint", "Amplitude detuning"))
+    fig.append_trace(
+        rendering_functions.return_scatter_trace(
+            target=target,
+            x=footprint["qx"],
+            y=footprint["qy"],
+            mode="markers",
+            marker=dict(
+                size=5, color=amplitude, colorscale="Viridis", colorbar=dict(title="r [σ]", x=0.45)
+            ),
+            showlegend=False,
+            name="Footprint",
+        ),
+        row=1,
+        col=1,
+    )
+
+    # The grid is ordered by angle then amplitude
+    r = amplitude.reshape(n_theta, n_r)
+    qx = footprint["qx"].reshape(n_theta, n_r)
+    qy = footprint["qy"].reshape(n_theta, n_r)
+    for idx_theta, plane in [(0, "x"), (-1, "y")]:
+        for q, name_q in [(qx, "qx"), (qy, "qy")]:
+            fig.append_trace(
+                rendering_functions.return_scatter_trace(
+                    target=target,
+                    x=r[idx_theta],
+                    y=q[idx_theta],
+                    mode="lines+markers",
+                    name=f"{name_q} (amplitude in {plane})",
+                ),
+                row=1,
+                col=2,
+            )
+
+    fig.update_xaxes(title_text=r"$q_x$", row=1, col=1)
+    fig.update_yaxes(title_text=r"$q_y$", row=1, col=1)
+    fig.update_xaxes(title_text=r"Initial amplitude [$\sigma$]", row=1, col=2)
+    fig.update_yaxes(title_text="Tune", row=1, col=2)
+    fig.update_layout(
+        title_x=0.5,
+        width=1200,
+        height=600,
+        template="plotly_white",
+        uirevision="Don't change",
+    )
+    return fig
+
+
+def plot_comparison(dic_comparison, target="browser"):
+    """Return the figure of the beta-beating, orbit and dispersion differences of a dataset with
+    respect to a reference one, along the longitudinal coordinate."""
+    s_plot = precision_functions.return_plotting_array(dic_comparison["s"])
+    fig = make_subplots(rows=3, cols=1, shared_xaxes=True)
+    for row, l_columns in enumerate(
+        [
+            [
+                ("beating_betx", r"$\Delta\beta_x/\beta_x$"),
+                ("beating_bety", r"$\Delta\beta_y/\beta_y$"),
+            ],
+            [("delta_x", r"$\Delta x$"), ("delta_y", r"$\Delta y$")],
+            [("delta_dx", r"$\Delta D_x$"), ("delta_dy", r"$\Delta D_y$")],
+        ],
+        start=1,
+    ):
+        for column, name in l_columns:
+            fig.append_trace(
+                rendering_functions.return_scatter_trace(
+                    target=target,
+                    x=s_plot,
+                    y=precision_functions.return_plotting_array(dic_comparison[column]),
+                    mode="lines",
+                    showlegend=True,
+                    name=name,
+                    legendgroup=str(row),
+                ),
+                row=row,
+                col=1,
+            )
+
+    fig.update_layout(
+        title_x=0.5,
+        showlegend=True,
+        width=1000,
+        height=1000,
+        legend_tracegroupgap=190,
+        dragmode="pan",
+        template="plotly_white",
+        uirevision="Don't change",
+    )
+    fig.update_yaxes(title_text=r"$\Delta\beta/\beta$", row=1, col=1)
+    fig.update_yaxes(title_text=r"$\Delta$(Closed orbit) [m]", row=2, col=1)
+    fig.update_yaxes(title_text=r"$\Delta D$ [m]", row=3, col=1)
+    fig.update_xaxes(title_text=r"$s$", row=3, col=1)
+    return fig
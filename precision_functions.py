@@ -0,0 +1,54 @@
+#################### Imports ####################
+import numpy as np
+import os
+import warnings
+
+#################### Constants ####################
+
+# Opt-in storage (and serialization) of the plotting data as float32 instead of float64, which
+# halves memory and payload. The survey is drawn at meter resolution over ~27 km, and the optics
+# plots do not need more than float32 precision.
+USE_FLOAT32 = os.environ.get("LHC_DASH_FLOAT32", "0") == "1"
+
+# Largest visual error allowed when converting to float32, relative to the span of each array
+FLOAT32_MAX_RELATIVE_ERROR = float(os.environ.get("LHC_DASH_FLOAT32_MAX_ERROR", "1e-5"))
+
+#################### Functions ####################
+
+
+def return_float32_error(array):
+    """Return the largest error made when converting an array to float32, relative to its span."""
+    array = np.asarray(array, dtype=np.float64)
+    if array.size == 0 or np.all(np.isnan(array)):
+        return 0.0
+    span = np.nanmax(array) - np.nanmin(array)
+    error = np.nanmax(np.abs(array.astype(np.float32).astype(np.float64) - array))
+    if span == 0:
+        return 0.0 if error == 0 else np.inf
+    return error / span
+
+
+def return_plotting_array(array, use_float32=None, max_relative_error=None):
+    """Return a numerical array in the precision used for plotting: float32 if requested and if the
+    visual error stays below the bound, float64 otherwise."""
+    use_float32 = USE_FLOAT32 if use_float32 is None else use_float32
+    max_relative_error = (
+        FLOAT32_MAX_RELATIVE_ERROR if max_relative_error is None else max_relative_error
+    )
+    array = np.asarray(array)
+    if not np.issubdtype(array.dtype, np.floating):
+        return array
+    if not use_float32:
+        return array.astype(np.float64, copy=False)
+
+    # Validate that the conversion does not introduce a visible error
+    error = return_float32_error(array)
+    if error > max_relative_error:
+        warnings.warn(
+            f"float32 conversion would introduce a relative error of {error:.2e} (bound is"
+            f" {max_relative_error:.2e}), float64 is kept for this array.",
+            RuntimeWarning,
+        )
+        return array.astype(np.float64, copy=False)
+
+    return array.astype(np.float32)
@@ -0,0 +1,224 @@
+#################### Imports ####################
+import numpy as np
+import base64
+import struct
+import threading
+import zlib
+
+#################### Constants ####################
+
+# Size (in pixels) of a tile, and number of zoom levels of the pyramid. At level n, the whole
+# ring is rendered on 2^n x 2^n tiles.
+TILE_SIZE = 512
+N_ZOOM_LEVELS = 3
+
+# Visible span (in meters) below which the vector traces are displayed instead of the tiles
+VECTOR_SPAN_THRESHOLD = 2500.0
+
+# Tile pyramids already generated, per dataset, and lock to access them from several threads
+dic_tile_pyramids = {}
+lock_tile_pyramids = threading.Lock()
+
+#################### Functions ####################
+
+
+def encode_png(rgba):
+    """Encode a (height x width x 4) uint8 array as a PNG file, using only the standard library."""
+    height, width = rgba.shape[:2]
+
+    # Each row of the image is preceded by a filter byte (0 = no filter)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def return_chunk(tag, data):
+        return (
+            struct.pack(">I", len(data))
+            + tag
+            + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+        )
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + return_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + return_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + return_chunk(b"IEND", b"")
+    )
+
+
+def return_rgba_from_hex(color):
+    """Convert a plotly hex color (e.g. '#636EFA') to an opaque RGBA array."""
+    color = color.lstrip("#")
+    return np.array([int(color[i : i + 2], 16) for i in (0, 2, 4)] + [255], dtype=np.uint8)
+
+
+def rasterize_segments(image, x0, z0, x1, z1, color, l_widths_px, bounds):
+    """Draw segments given in survey coordinates on an RGBA image, in place."""
+    height, width = image.shape[:2]
+    x_min, x_max, z_min, z_max = bounds
+
+    # Convert to pixel coordinates (rows go downward)
+    px0 = (np.asarray(x0) - x_min) * width / (x_max - x_min)
+    px1 = (np.asarray(x1) - x_min) * width / (x_max - x_min)
+    pz0 = (z_max - np.asarray(z0)) * height / (z_max - z_min)
+    pz1 = (z_max - np.asarray(z1)) * height / (z_max - z_min)
+    l_radius = np.maximum(np.asarray(l_widths_px) // 2, 0).astype(np.int64)
+    l_radius = np.broadcast_to(l_radius, px0.shape)
+
+    # Sample each segment with (at least) one point per pixel
+    n_samples = np.ceil(np.hypot(px1 - px0, pz1 - pz0)).astype(np.int64) + 1
+    idx_segment = np.repeat(np.arange(len(px0)), n_samples)
+    idx_sample = np.arange(np.sum(n_samples)) - np.repeat(
+        np.cumsum(n_samples) - n_samples, n_samples
+    )
+    t = idx_sample / np.maximum(n_samples[idx_segment] - 1, 1)
+    px = px0[idx_segment] + t * (px1 - px0)[idx_segment]
+    pz = pz0[idx_segment] + t * (pz1 - pz0)[idx_segment]
+    radius = l_radius[idx_segment]
+
+    # Stamp a square of the width of the line around each sample
+    max_radius = int(np.max(radius)) if len(radius) > 0 else 0
+    for dx in range(-max_radius, max_radius + 1):
+        for dz in range(-max_radius, max_radius + 1):
+            mask = radius >= max(abs(dx), abs(dz))
+            col = np.round(px[mask]).astype(np.int64) + dx
+            row = np.round(pz[mask]).astype(np.int64) + dz
+            inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+            image[row[inside], col[inside]] = color
+
+
+def return_square_bounds(df_sv, margin=300):
+    """Return square bounds (x_min, x_max, z_min, z_max) around the survey."""
+    x_center = (df_sv["X"].min() + df_sv["X"].max()) / 2
+    z_center = (df_sv["Z"].min() + df_sv["Z"].max()) / 2
+    half_span = (
+        max(df_sv["X"].max() - df_sv["X"].min(), df_sv["Z"].max() - df_sv["Z"].min()) / 2 + margin
+    )
+    return (
+        x_center - half_span,
+        x_center + half_span,
+        z_center - half_span,
+        z_center + half_span,
+    )
+
+
+def return_tile_layers(l_layers, bounds):
+    """Rasterize layers of segments at every zoom level, and cut them into PNG tiles.
+
+    Each layer is a tuple (name, list of (x0, z0, x1, z1, color, widths)). The function returns a
+    dictionnary mapping (layer name, level, column, row) to a base64 PNG data URI. Empty tiles
+    are skipped.
+    """
+    dic_tiles = {}
+    for name_layer, l_segments in l_layers:
+        for level in range(N_ZOOM_LEVELS):
+            n_tiles = 2**level
+            image = np.zeros((TILE_SIZE * n_tiles, TILE_SIZE * n_tiles, 4), dtype=np.uint8)
+            for x0, z0, x1, z1, color, l_widths_px in l_segments:
+                rasterize_segments(
+                    image, x0, z0, x1, z1, return_rgba_from_hex(color), l_widths_px, bounds
+                )
+
+            # Cut the image into tiles
+            for column in range(n_tiles):
+                for row in range(n_tiles):
+                    tile = image[
+                        row * TILE_SIZE : (row + 1) * TILE_SIZE,
+                        column * TILE_SIZE : (column + 1) * TILE_SIZE,
+                    ]
+                    if not np.any(tile[:, :, 3]):
+                        continue
+                    dic_tiles[(name_layer, level, column, row)] = (
+                        "data:image/png;base64,"
+                        + base64.b64encode(encode_png(np.ascontiguousarray(tile))).decode("ascii")
+                    )
+
+    return dic_tiles
+
+
+def generate_tile_pyramid(dataset_key, l_layers, bounds):
+    """Generate the tile pyramid of a dataset and make it available."""
+    dic_tiles = return_tile_layers(l_layers, bounds)
+    with lock_tile_pyramids:
+        # Only keep the pyramid if the dataset has not been invalidated in the meantime
+        if dataset_key in dic_tile_pyramids:
+            dic_tile_pyramids[dataset_key] = {"tiles": dic_tiles, "bounds": bounds}
+
+
+def start_tile_pyramid_generation(dataset_key, l_layers, bounds):
+    """Generate the tile pyramid of a dataset in a background thread."""
+    with lock_tile_pyramids:
+        if dataset_key in dic_tile_pyramids:
+            return
+
+        # None means that the generation is in progress
+        dic_tile_pyramids[dataset_key] = None
+
+    threading.Thread(
+        target=generate_tile_pyramid, args=(dataset_key, l_layers, bounds), daemon=True
+    ).start()
+
+
+def store_tile_pyramid(dataset_key, tile_pyramid):
+    """Make an already generated tile pyramid (e.g. by an upload job) available."""
+    with lock_tile_pyramids:
+        dic_tile_pyramids[dataset_key] = tile_pyramid
+
+
+def invalidate_tile_pyramid(dataset_key):
+    """Drop the tile pyramid of a dataset (also cancelling a generation in progress)."""
+    with lock_tile_pyramids:
+        dic_tile_pyramids.pop(dataset_key, None)
+
+
+def return_tile_pyramid(dataset_key):
+    """Return the tile pyramid of a dataset, or None if it is not (yet) available."""
+    with lock_tile_pyramids:
+        return dic_tile_pyramids.get(dataset_key)
+
+
+def return_zoom_level(bounds, x_range):
+    """Return the level of the pyramid matching the visible range of the figure."""
+    full_span = bounds[1] - bounds[0]
+    visible_span = max(abs(x_range[1] - x_range[0]), 1e-9)
+    return int(np.clip(np.ceil(np.log2(full_span / visible_span)) + 1, 0, N_ZOOM_LEVELS - 1))
+
+
+def return_layout_images(tile_pyramid, l_layers_to_display, x_range, y_range):
+    """Return the layout images of the tiles of the requested layers intersecting the visible
+    range."""
+    x_min, x_max, z_min, z_max = tile_pyramid["bounds"]
+    level = return_zoom_level(tile_pyramid["bounds"], x_range)
+    n_tiles = 2**level
+    tile_span_x = (x_max - x_min) / n_tiles
+    tile_span_z = (z_max - z_min) / n_tiles
+
+    # Get the tiles intersecting the visible range
+    column_min = int(np.clip(np.floor((min(x_range) - x_min) / tile_span_x), 0, n_tiles - 1))
+    column_max = int(np.clip(np.floor((max(x_range) - x_min) / tile_span_x), 0, n_tiles - 1))
+    row_min = int(np.clip(np.floor((z_max - max(y_range)) / tile_span_z), 0, n_tiles - 1))
+    row_max = int(np.clip(np.floor((z_max - min(y_range)) / tile_span_z), 0, n_tiles - 1))
+
+    l_images = []
+    for name_layer in l_layers_to_display:
+        for column in range(column_min, column_max + 1):
+            for row in range(row_min, row_max + 1):
+                source = tile_pyramid["tiles"].get((name_layer, level, column, row))
+                if source is None:
+                    continue
+                l_images.append(
+                    dict(
+                        source=source,
+                        xref="x",
+                        yref="y",
+                        x=x_min + column * tile_span_x,
+                        y=z_max - row * tile_span_z,
+                        sizex=tile_span_x,
+                        sizey=tile_span_z,
+                        xanchor="left",
+                        yanchor="top",
+                        sizing="stretch",
+                        layer="below",
+                    )
+                )
+    return l_images
@@ -0,0 +1,613 @@
+#################### Imports ####################
+import gc
+import hashlib
+import logging
+import multiprocess
+import numpy as np
+import os
+import pandas as pd
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+# Import functions
+import cache_functions
+import loading_functions
+import plotting_functions
+import raster_functions
+import snapshot_functions
+import spatial_index_functions
+import tracker_pool_functions
+import tracker_server_functions
+
+#################### Constants ####################
+
+# Estimated memory (in MB) of the datasets in memory above which the least recently used ones are
+# evicted
+MEMORY_BUDGET_MB = int(os.environ.get("LHC_DASH_MEMORY_BUDGET_MB", "4096"))
+
+# Keys of the datasets (hash of the line file and beam), the only ones accepted from the sessions
+DATASET_KEY_PATTERN = re.compile(r"^[0-9a-f]{40}_b[14]$")
+
+# Folder in which uploaded lines and their dataframes are saved, so that evicted datasets can be
+# reloaded and shared across sessions and workers
+UPLOAD_FOLDER = "temp/uploads"
+
+# Datasets currently in memory (in least recently used order), files needed to rebuild each
+# registered dataset, and datasets that can never be evicted
+dic_datasets = OrderedDict()
+dic_dataset_files = {}
+set_pinned_keys = set()
+
+# Version of the files holding the survey structures and tiles of an uploaded dataset, prepared by
+# the upload job. Files of another version are ignored, and the structures rebuilt.
+PREPARED_FORMAT_VERSION = 1
+
+# Number of knob states for which the survey structures are kept, per dataset
+MAX_SURVEY_STATES = 16
+
+# Lock protecting the registry, and one lock per dataset so that a dataset is only built once
+lock_registry = threading.RLock()
+dic_locks_datasets = {}
+
+logger = logging.getLogger(__name__)
+
+#################### Functions ####################
+
+
+def return_content_hash(content):
+    """Return the hash of the content (bytes) of a line file."""
+    return hashlib.sha1(content).hexdigest()
+
+
+def return_dataset_key(content_hash, beam_2=False):
+    """Return the key of the dataset built from a given line content, for a given beam (the x-axis
+    is only reversed for beam 1)."""
+    return content_hash + ("_b4" if beam_2 else "_b1")
+
+
+def return_estimated_size_bytes(obj, set_ids_seen=None):
+    """Return the estimated size (in bytes) of the arrays and dataframes held by an object,
+    looking into dictionnaries, lists and tuples. Objects shared between several containers are
+    only counted once."""
+    set_ids_seen = set() if set_ids_seen is None else set_ids_seen
+    if id(obj) in set_ids_seen:
+        return 0
+    set_ids_seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, bytes):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(return_estimated_size_bytes(value, set_ids_seen) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(return_estimated_size_bytes(value, set_ids_seen) for value in obj)
+    if isinstance(obj, loading_functions.TwissColumnTable):
+        return return_estimated_size_bytes([obj._columns, obj._packed_columns], set_ids_seen)
+    return 0
+
+
+def return_dataset_size_mb(dataset):
+    """Return the estimated memory (in MB) of a dataset: its arrays and dataframes (including the
+    survey structures of the knob states kept), and its line and tracker, estimated by the size of
+    the line file."""
+    try:
+        line_size = os.path.getsize(dataset["line_path"])
+    except OSError:
+        line_size = 0
+    return (return_estimated_size_bytes(dataset) + line_size) / 1024**2
+
+
+def register_dataset_file(dataset_key, line_path, save_path, beam_2=False, pinned=False):
+    """Register the files from which a dataset can be (re)built."""
+    with lock_registry:
+        dic_dataset_files[dataset_key] = {
+            "line_path": line_path,
+            "save_path": save_path,
+            "beam_2": beam_2,
+        }
+        if pinned:
+            set_pinned_keys.add(dataset_key)
+
+
+def register_uploaded_content(content, beam_2=False):
+    """Save an uploaded line (if not already known) and register the corresponding dataset.
+    Identical uploads share the same dataset."""
+    content_hash = return_content_hash(content)
+    dataset_key = return_dataset_key(content_hash, beam_2=beam_2)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    line_path = os.path.join(UPLOAD_FOLDER, content_hash + ".json")
+    if not os.path.exists(line_path):
+        # Write to a temporary file first, so that other workers never read a partial file
+        with open(line_path + ".tmp", "wb") as fid:
+            fid.write(content)
+        os.replace(line_path + ".tmp", line_path)
+
+    register_dataset_file(
+        dataset_key,
+        line_path,
+        os.path.join(UPLOAD_FOLDER, dataset_key + "_dfs.pickle"),
+        beam_2=beam_2,
+    )
+    return dataset_key
+
+
+def validate_dataset_key(dataset_key):
+    """Raise a ValueError if a dataset key (e.g. read from a session store) is not a valid key,
+    before it is used to build any path."""
+    if not isinstance(dataset_key, str) or DATASET_KEY_PATTERN.fullmatch(dataset_key) is None:
+        raise ValueError(f"Invalid dataset key {dataset_key!r}")
+
+
+def register_dataset_from_upload_folder(dataset_key):
+    """Register a dataset uploaded through another worker, from the files it saved. Return True if
+    the dataset could be found."""
+    validate_dataset_key(dataset_key)
+    content_hash, _, beam = dataset_key.rpartition("_")
+    line_path = os.path.join(UPLOAD_FOLDER, content_hash + ".json")
+    if not os.path.exists(line_path):
+        return False
+    register_dataset_file(
+        dataset_key,
+        line_path,
+        os.path.join(UPLOAD_FOLDER, dataset_key + "_dfs.pickle"),
+        beam_2=beam == "b4",
+    )
+    return True
+
+
+def return_prepared_path(save_path):
+    """Return the path of the file holding the prepared survey structures and tiles of a dataset,
+    next to its dataframes."""
+    return os.path.splitext(save_path)[0] + "_prepared.pickle"
+
+
+def return_survey_structures(df_elements_corrected, df_sv, df_tw):
+    """Return the structures used to draw the survey of a (beam 1) dataset and resolve the clicks
+    on it."""
+    # Keep only the elements drawn in the survey, with their coordinates
+    dic_store = loading_functions.return_plotting_store(df_elements_corrected, df_sv, df_tw)
+
+    # Names of the multipoles, indexed by the customdata of the survey segments, and index used to
+    # resolve the clicks on points without customdata (built once, from the default strengths,
+    # and shared by all knob states)
+    return {
+        "dic_store": dic_store,
+        "multipole_names": plotting_functions.return_multipole_names(dic_store),
+        "spatial_index": spatial_index_functions.return_survey_spatial_index(
+            plotting_functions.return_all_multipole_segments(dic_store), dic_store
+        ),
+    }
+
+
+def return_survey_tile_layers(dic_store, df_sv):
+    """Return the layers of the survey to rasterize, and their bounds."""
+    return (
+        plotting_functions.return_survey_tile_layers(dic_store, df_sv, loading_functions.L_SECTORS),
+        raster_functions.return_square_bounds(df_sv),
+    )
+
+
+def load_prepared_structures(save_path):
+    """Return the survey structures and tiles prepared by an upload job, or None if there are no
+    such (readable) structures of the current format."""
+    prepared_path = return_prepared_path(save_path)
+    if not os.path.exists(prepared_path):
+        return None
+    try:
+        with open(prepared_path, "rb") as handle:
+            dic_prepared = pickle.load(handle)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        logger.warning("Could not read %s, the survey structures are rebuilt: %s", prepared_path, e)
+        return None
+    if not isinstance(dic_prepared, dict) or dic_prepared.get("version") != PREPARED_FORMAT_VERSION:
+        return None
+    return dic_prepared
+
+
+def prepare_uploaded_dataset(dataset_key, set_progress=None):
+    """Compute and save the dataframes, survey structures and tiles of a registered dataset,
+    without keeping it in memory (e.g. from a background job, the dataset being then loaded from
+    the saved files by the workers, which only have to rebuild its tracker)."""
+    if set_progress is None:
+        set_progress = lambda progress: None
+    with lock_registry:
+        if dataset_key not in dic_dataset_files and not register_dataset_from_upload_folder(
+            dataset_key
+        ):
+            raise KeyError(f"Dataset {dataset_key} has not been registered")
+        dic_files = dic_dataset_files[dataset_key]
+
+    (
+        _,
+        _,
+        _,
+        df_sv,
+        df_tw,
+        df_elements_corrected,
+    ) = loading_functions.return_all_loaded_variables(
+        line_path=dic_files["line_path"],
+        save_path=dic_files["save_path"],
+        force_load=False,
+        correct_x_axis=not dic_files["beam_2"],
+    )
+
+    # The survey is only displayed for beam 1
+    if dic_files["beam_2"]:
+        return
+
+    set_progress((60, "Preparing survey"))
+    dic_prepared = return_survey_structures(df_elements_corrected, df_sv, df_tw)
+    set_progress((80, "Rendering survey tiles"))
+    l_layers, bounds = return_survey_tile_layers(dic_prepared["dic_store"], df_sv)
+    dic_prepared["tile_pyramid"] = {
+        "tiles": raster_functions.return_tile_layers(l_layers, bounds),
+        "bounds": bounds,
+    }
+    dic_prepared["version"] = PREPARED_FORMAT_VERSION
+
+    # Write to a temporary file first, so that workers never read a partial file
+    prepared_path = return_prepared_path(dic_files["save_path"])
+    with open(prepared_path + ".tmp", "wb") as handle:
+        pickle.dump(dic_prepared, handle)
+    os.replace(prepared_path + ".tmp", prepared_path)
+
+
+def is_job_process():
+    """Return whether the process is a background job, forked from a worker by the background
+    callback manager (which uses the multiprocess package)."""
+    return multiprocess.parent_process() is not None
+
+
+def build_dataset(dataset_key, line_path, save_path, beam_2=False):
+    """Build the tracker, dataframes and plotting structures of a dataset."""
+    (
+        line,
+        tracker,
+        df_elements,
+        df_sv,
+        df_tw,
+        df_elements_corrected,
+    ) = loading_functions.return_all_loaded_variables(
+        line_path=line_path,
+        save_path=save_path,
+        force_load=False,
+        correct_x_axis=not beam_2,
+    )
+    dataset = {
+        "key": dataset_key,
+        "beam_2": beam_2,
+        "line_path": line_path,
+        "line": line,
+        # The tracker is never modified: knobs are set on the trackers of the tracker server
+        "tracker": tracker,
+        "df_elements": df_elements,
+        "df_sv": df_sv,
+        "df_tw": df_tw,
+        "df_elements_corrected": df_elements_corrected,
+        # Order and default values of the knobs, used to store knob states as compact vectors
+        "knob_catalog": snapshot_functions.return_knob_catalog(tracker),
+    }
+
+    # Project the optics on the survey
+    dataset["projection_basis"] = plotting_functions.return_projection_basis(df_sv, beam_2=beam_2)
+    plotting_functions.project_optics(dataset["projection_basis"], df_tw)
+
+    # The survey is only displayed for beam 1
+    if not beam_2:
+        # Use the survey structures and tiles prepared by the upload job, if any
+        dic_prepared = load_prepared_structures(save_path)
+        if dic_prepared is None:
+            dic_prepared = return_survey_structures(df_elements_corrected, df_sv, df_tw)
+        dataset["dic_store"] = dic_prepared["dic_store"]
+        dataset["multipole_names"] = dic_prepared["multipole_names"]
+        dataset["spatial_index"] = dic_prepared["spatial_index"]
+
+        # Survey structures for the knob states of the sessions (in least recently used order)
+        dataset["survey_states"] = OrderedDict()
+
+        if "tile_pyramid" in dic_prepared:
+            raster_functions.store_tile_pyramid(dataset_key, dic_prepared["tile_pyramid"])
+
+        # Background jobs are short-lived: they leave the tiles to the workers
+        elif not is_job_process():
+            # Rasterize the survey in the background for fast display of the whole ring
+            raster_functions.start_tile_pyramid_generation(
+                dataset_key, *return_survey_tile_layers(dataset["dic_store"], df_sv)
+            )
+
+    return dataset
+
+
+def evict_cold_datasets(dataset_key_in_use=None):
+    """Evict the least recently used datasets (except pinned ones and the one in use) until the
+    estimated memory of the datasets in memory is within budget."""
+    l_line_paths = []
+    with lock_registry:
+        dic_sizes_mb = {
+            key: return_dataset_size_mb(dataset) for key, dataset in dic_datasets.items()
+        }
+        total_size_mb = sum(dic_sizes_mb.values())
+        l_evictable_keys = [
+            key for key in dic_datasets if key not in set_pinned_keys and key != dataset_key_in_use
+        ]
+        for key in l_evictable_keys:
+            if total_size_mb <= MEMORY_BUDGET_MB:
+                break
+
+            # Evict the coldest dataset, along with its tiles, process pool and trackers, and its
+            # lock unless a thread holds it (return_dataset takes the lock again if it was
+            # dropped while it waited for it)
+            l_line_paths.append(dic_datasets.pop(key)["line_path"])
+            lock_dataset = dic_locks_datasets.get(key)
+            if lock_dataset is not None and not lock_dataset.locked():
+                del dic_locks_datasets[key]
+            tracker_pool_functions.shutdown_process_pool(l_line_paths[-1])
+            raster_functions.invalidate_tile_pyramid(key)
+            total_size_mb -= dic_sizes_mb[key]
+    if len(l_line_paths) == 0:
+        return
+    for line_path in l_line_paths:
+        tracker_server_functions.release_trackers(line_path)
+    gc.collect()
+
+
+def return_dataset(dataset_key):
+    """Return a dataset from memory, (re)building it from its files if needed."""
+    while True:
+        with lock_registry:
+            if dataset_key in dic_datasets:
+                dic_datasets.move_to_end(dataset_key)
+                return dic_datasets[dataset_key]
+            if dataset_key not in dic_dataset_files and not register_dataset_from_upload_folder(
+                dataset_key
+            ):
+                raise KeyError(f"Dataset {dataset_key} has not been registered")
+            lock_dataset = dic_locks_datasets.setdefault(dataset_key, threading.Lock())
+
+        # Build the dataset outside of the registry lock, so that other datasets remain available
+        with lock_dataset:
+            with lock_registry:
+                if dataset_key in dic_datasets:
+                    return dic_datasets[dataset_key]
+                if dic_locks_datasets.get(dataset_key) is not lock_dataset:
+                    # The lock was dropped by an eviction before it was taken: use the new one
+                    continue
+            dataset = build_dataset(dataset_key, **dic_dataset_files[dataset_key])
+            with lock_registry:
+                dic_datasets[dataset_key] = dataset
+            break
+
+    evict_cold_datasets(dataset_key_in_use=dataset_key)
+    return dataset
+
+
+def reload_dataset(dataset_key):
+    """Drop a dataset from memory, so that it is rebuilt from its files on next access."""
+    with lock_registry:
+        dataset = dic_datasets.pop(dataset_key, None)
+    raster_functions.invalidate_tile_pyramid(dataset_key)
+    if dataset is not None:
+        tracker_pool_functions.shutdown_process_pool(dataset["line_path"])
+        tracker_server_functions.release_trackers(dataset["line_path"])
+    return return_dataset(dataset_key)
+
+
+def validate_knob_state(dataset, dic_knobs):
+    """Raise a ValueError if a knob state contains knobs that are not in the dataset, or invalid
+    values."""
+    snapshot_functions.validate_knob_state(dataset["knob_catalog"], dic_knobs or {})
+
+
+def return_knob_fingerprint(dataset, dic_knobs):
+    """Return the fingerprint of a knob state of a dataset (the one of its snapshot), used as key
+    of the cached results."""
+    return snapshot_functions.return_knob_fingerprint(dataset["knob_catalog"], dic_knobs)
+
+
+def return_survey_state_from_twiss(dataset, dic_knobs, tw, previous_survey_state=None):
+    """Return the plotting store and optics projection of the survey for a knob state and its
+    twiss, along with the optics overlays that changed with respect to the previous state (all of
+    them if it is not known). The multipole strengths are read from a tracker of the tracker
+    server."""
+    # Refresh the multipole strengths on a copy of the store, shared by all knob states
+    dic_store = {
+        "multipoles": {
+            order: df_multipoles.copy()
+            for order, df_multipoles in dataset["dic_store"]["multipoles"].items()
+        },
+        "ip": dataset["dic_store"]["ip"],
+    }
+    loading_functions.refresh_plotting_store_strengths(
+        dic_store,
+        tracker_server_functions.return_multipole_strengths(dataset["line_path"], dic_knobs),
+    )
+
+    # Re-project, on a copy of the previous projection, the optics overlays that changed
+    projection_basis = dict(
+        dataset["projection_basis"]
+        if previous_survey_state is None
+        else previous_survey_state["projection_basis"]
+    )
+    projection_basis["X_projected"] = projection_basis["X_projected"].copy()
+    projection_basis["Z_projected"] = projection_basis["Z_projected"].copy()
+    l_types_trace_changed = plotting_functions.project_optics(
+        projection_basis,
+        loading_functions.return_corrected_twiss_columns(
+            tw, plotting_functions.L_COLUMNS_OPTICS_OVERLAYS, correct_x_axis=not dataset["beam_2"]
+        ),
+    )
+    if previous_survey_state is None:
+        l_types_trace_changed = list(plotting_functions.DIC_OPTICS_OVERLAYS.keys())
+
+    survey_state = {
+        "dic_store": dic_store,
+        "projection_basis": projection_basis,
+    }
+    return survey_state, l_types_trace_changed
+
+
+def return_changed_strengths(dataset, survey_state):
+    """Return the multipole strengths (per order) of a survey state that differ from the ones of
+    the dataset."""
+    dic_strengths = {}
+    if survey_state["dic_store"] is dataset["dic_store"]:
+        return dic_strengths
+    for order, df_multipoles in survey_state["dic_store"]["multipoles"].items():
+        strength = df_multipoles["strength"].to_numpy()
+        if not np.array_equal(
+            strength,
+            dataset["dic_store"]["multipoles"][order]["strength"].to_numpy(),
+            equal_nan=True,
+        ):
+            dic_strengths[order] = strength
+    return dic_strengths
+
+
+def return_survey_state_changes(dataset, survey_state):
+    """Return the multipole strengths (per order) and the twiss columns of the optics overlays
+    (per overlay index) of a survey state that differ from the ones of the dataset."""
+    dic_strengths = return_changed_strengths(dataset, survey_state)
+
+    tw_matrix = survey_state["projection_basis"]["tw_matrix"]
+    default_tw_matrix = dataset["projection_basis"]["tw_matrix"]
+    dic_tw_columns = {
+        idx: tw_matrix[:, idx]
+        for idx in range(tw_matrix.shape[1])
+        if tw_matrix.shape != default_tw_matrix.shape
+        or not np.array_equal(tw_matrix[:, idx], default_tw_matrix[:, idx], equal_nan=True)
+    }
+    return dic_strengths, dic_tw_columns
+
+
+def return_survey_state_from_changes(dataset, dic_strengths, dic_tw_columns):
+    """Rebuild a survey state from the multipole strengths and the twiss columns of the optics
+    overlays that differ from the ones of the dataset (the optics are projected locally)."""
+    dic_store = {
+        "multipoles": {
+            order: df_multipoles.copy() if order in dic_strengths else df_multipoles
+            for order, df_multipoles in dataset["dic_store"]["multipoles"].items()
+        },
+        "ip": dataset["dic_store"]["ip"],
+    }
+    for order, strength in dic_strengths.items():
+        dic_store["multipoles"][order]["strength"] = strength
+
+    # Re-project, on a copy of the projection of the dataset, the optics overlays that differ
+    tw_matrix = dataset["projection_basis"]["tw_matrix"].copy()
+    for idx, tw_column in dic_tw_columns.items():
+        tw_matrix[:, idx] = tw_column
+    projection_basis = dict(dataset["projection_basis"])
+    projection_basis["X_projected"] = projection_basis["X_projected"].copy()
+    projection_basis["Z_projected"] = projection_basis["Z_projected"].copy()
+    plotting_functions.project_optics(
+        projection_basis,
+        {
+            dic_overlay["tw_name"]: tw_matrix[:, idx]
+            for idx, dic_overlay in enumerate(plotting_functions.DIC_OPTICS_OVERLAYS.values())
+        },
+    )
+
+    return {
+        "dic_store": dic_store,
+        "projection_basis": projection_basis,
+    }
+
+
+def store_survey_state(dataset, dic_knobs, survey_state, share=True):
+    """Keep the survey structures of a knob state, evicting the least recently used ones, and
+    share them with the other processes if requested."""
+    fingerprint = return_knob_fingerprint(dataset, dic_knobs)
+    with lock_registry:
+        dataset["survey_states"][fingerprint] = survey_state
+        dataset["survey_states"].move_to_end(fingerprint)
+        if len(dataset["survey_states"]) > MAX_SURVEY_STATES:
+            dataset["survey_states"].popitem(last=False)
+    if share:
+        cache_functions.store_survey_state(
+            dataset["key"], fingerprint, *return_survey_state_changes(dataset, survey_state)
+        )
+
+
+def return_cached_survey_state(dataset, dic_knobs):
+    """Return the survey structures of a knob state if they are known, None otherwise."""
+    fingerprint = return_knob_fingerprint(dataset, dic_knobs)
+    if fingerprint == dataset["knob_catalog"]["default_fingerprint"]:
+        return {
+            "dic_store": dataset["dic_store"],
+            "projection_basis": dataset["projection_basis"],
+        }
+    with lock_registry:
+        if fingerprint in dataset["survey_states"]:
+            dataset["survey_states"].move_to_end(fingerprint)
+            return dataset["survey_states"][fingerprint]
+
+    # The knob state may have been computed by another process
+    survey_state_changes = cache_functions.return_survey_state(dataset["key"], fingerprint)
+    if survey_state_changes is None:
+        return None
+    survey_state = return_survey_state_from_changes(dataset, *survey_state_changes)
+    store_survey_state(dataset, dic_knobs, survey_state, share=False)
+    return survey_state
+
+
+def return_survey_tile_pyramid(dataset, survey_state):
+    """Return the tile pyramid of the survey of a dataset if it can be displayed for a survey
+    state, None otherwise (or if it is not available yet). The tiles are rendered from the default
+    multipole strengths: knob states changing them are displayed with the vector traces."""
+    if len(return_changed_strengths(dataset, survey_state)) > 0:
+        return None
+    return raster_functions.return_tile_pyramid(dataset["key"])
+
+
+def return_changed_optics_overlays(survey_state, previous_survey_state):
+    """Return the optics overlays that differ between two survey states (all of them if the
+    previous state is not known)."""
+    l_types_trace = list(plotting_functions.DIC_OPTICS_OVERLAYS.keys())
+    if previous_survey_state is None:
+        return l_types_trace
+    tw_matrix = survey_state["projection_basis"]["tw_matrix"]
+    previous_tw_matrix = previous_survey_state["projection_basis"]["tw_matrix"]
+    if tw_matrix.shape != previous_tw_matrix.shape:
+        return l_types_trace
+    changed = np.any(
+        (tw_matrix != previous_tw_matrix) & ~(np.isnan(tw_matrix) & np.isnan(previous_tw_matrix)),
+        axis=0,
+    )
+    return [l_types_trace[idx] for idx in np.flatnonzero(changed)]
+
+
+def return_twiss(dataset, dic_knobs, mode="full", share=True):
+    """Return the plotted twiss of a knob state in a given mode ("fast" or "full"), from the shared
+    cache if it has already been computed by any process, and computed on a tracker of the tracker
+    server otherwise (and shared through the cache, if requested). The time taken by the
+    computation and the number of threads of the tracker are also returned (None if the twiss was
+    cached)."""
+    fingerprint = return_knob_fingerprint(dataset, dic_knobs)
+    tw = cache_functions.return_twiss(dataset["key"], fingerprint, mode=mode)
+    if tw is not None:
+        return tw, None, None
+
+    tw, latency, omp_num_threads = tracker_server_functions.compute_twiss(
+        dataset["line_path"], dic_knobs, mode=mode
+    )
+    if share:
+        cache_functions.store_twiss(dataset["key"], fingerprint, tw, mode=mode)
+    return tw, latency, omp_num_threads
+
+
+def return_survey_state(dataset, dic_knobs):
+    """Return the survey structures of a knob state, computing them on the tracker server if
+    needed."""
+    survey_state = return_cached_survey_state(dataset, dic_knobs)
+    if survey_state is None:
+        survey_state, _ = return_survey_state_from_twiss(
+            dataset, dic_knobs, return_twiss(dataset, dic_knobs, mode="fast")[0]
+        )
+        store_survey_state(dataset, dic_knobs, survey_state)
+    return survey_state
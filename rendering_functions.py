@@ -0,0 +1,53 @@
+#################### Imports ####################
+import plotly.graph_objects as go
+
+#################### Constants ####################
+
+# Number of points above which a trace is rendered with WebGL instead of SVG, for each target.
+# In notebooks, many figures share the same page, so WebGL (whose number of contexts is limited
+# by the browser) is kept for the largest traces only. Static exports are always rendered as SVG.
+DIC_WEBGL_POINTS_THRESHOLD = {
+    "browser": 1000,
+    "notebook": 5000,
+    "static": None,
+}
+
+#################### Functions ####################
+
+
+def validate_target(target):
+    """Raise a ValueError if the rendering target is unknown."""
+    if target not in DIC_WEBGL_POINTS_THRESHOLD:
+        raise ValueError(
+            f"Unknown rendering target {target}, must be one of"
+            f" {list(DIC_WEBGL_POINTS_THRESHOLD.keys())}"
+        )
+
+
+def return_scatter_class(n_points, target="browser"):
+    """Return the plotly scatter class (WebGL or SVG) to use for a trace of n_points points."""
+    validate_target(target)
+    threshold = DIC_WEBGL_POINTS_THRESHOLD[target]
+    if threshold is not None and n_points > threshold:
+        return go.Scattergl
+    return go.Scatter
+
+
+def return_scatter_trace(target="browser", **kwargs):
+    """Return a scatter trace, rendered with WebGL or SVG depending on its number of points and on
+    the rendering target ("browser", "notebook" or "static")."""
+    x = kwargs.get("x")
+    y = kwargs.get("y")
+    n_points = len(x) if x is not None else len(y) if y is not None else 0
+    return return_scatter_class(n_points, target=target)(**kwargs)
+
+
+def return_overlay_scatter_trace(target="browser", **kwargs):
+    """Return a scatter trace of a figure whose traces overlap (e.g. the survey), rendered like the
+    largest traces of such figures: with WebGL, except for static exports. WebGL traces are always
+    drawn below SVG ones, so the traces of these figures share the same renderer to keep their
+    order."""
+    validate_target(target)
+    if DIC_WEBGL_POINTS_THRESHOLD[target] is None:
+        return go.Scatter(**kwargs)
+    return go.Scattergl(**kwargs)
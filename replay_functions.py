@@ -0,0 +1,188 @@
+#################### Imports ####################
+import numpy as np
+import pandas as pd
+import time
+import uuid
+from collections import OrderedDict
+
+# Import functions
+import cache_functions
+import context_functions
+import registry_functions
+import tracker_pool_functions
+
+#################### Constants ####################
+
+# Number of steps computed ahead of the one being displayed, per process
+REPLAY_PIPELINE_DEPTH = 2
+
+# Playback duration (in seconds) of each step of a time series without time column, at speed 1
+DEFAULT_STEP_DURATION = 1.0
+
+# Steps of the replays played by the worker (read once from the cache, in least recently used
+# order), along with the twiss computations submitted by the worker, per knob state fingerprint
+dic_replays = OrderedDict()
+
+# Number of replays whose steps are kept by the worker (replays left by closed browsers are
+# eventually dropped)
+MAX_REPLAYS = 16
+
+#################### Functions ####################
+
+
+def compute_replay_step(dataset_key, fingerprint, dic_knobs):
+    """Share the plotted (fast) twiss of a step of a replay, computed on the tracker of the
+    process (only the knobs that differ from the previous step computed by the process are set),
+    unless any process already computed this knob state."""
+    if cache_functions.return_twiss(dataset_key, fingerprint, mode="fast") is not None:
+        return
+    pooled_tracker = tracker_pool_functions.process_pooled_tracker
+    tracker_pool_functions.apply_knob_state(pooled_tracker, dic_knobs)
+    tw, _ = context_functions.compute_twiss(pooled_tracker["tracker"], mode="fast")
+    tw = cache_functions.return_plotted_twiss(tw, mode="fast")
+    cache_functions.store_twiss(dataset_key, fingerprint, tw, mode="fast")
+
+
+def return_step_knobs(dic_knobs, df_knobs):
+    """Return the knob state of each step of a time series, set on top of a given knob state."""
+    l_knobs = list(df_knobs.columns)
+    return [
+        {**dic_knobs, **{knob: float(value) for knob, value in zip(l_knobs, row)}}
+        for row in df_knobs.itertuples(index=False)
+    ]
+
+
+def start_replay(dataset, dic_knobs, dic_series, speed):
+    """Prepare the replay of a knob time series on top of a knob state, at a given playback speed,
+    and return its state, to be advanced with advance_replay. The steps are shared through the
+    cache, so that any worker can advance the replay."""
+    df_knobs = pd.DataFrame(dic_series["values"], columns=dic_series["knobs"])
+    n_steps = len(df_knobs)
+    times = (
+        np.arange(n_steps) * DEFAULT_STEP_DURATION
+        if dic_series["times"] is None
+        else np.array(dic_series["times"])
+    ) / (1.0 if not speed else float(speed))
+    l_dic_knobs = return_step_knobs(dic_knobs, df_knobs)
+    l_fingerprints = [
+        registry_functions.return_knob_fingerprint(dataset, dic_knobs_step)
+        for dic_knobs_step in l_dic_knobs
+    ]
+
+    replay = {
+        "key": uuid.uuid4().hex,
+        "dataset_key": dataset["key"],
+        "n_steps": n_steps,
+        # Time at which the playback started (once the first step is available), last step
+        # displayed, and number of steps skipped to keep up with the playback
+        "start": None,
+        "idx_step": -1,
+        "n_skipped": 0,
+    }
+    cache_functions.store_replay(replay["key"], times, l_dic_knobs, l_fingerprints)
+    submit_replay_steps(dataset, replay["key"], 0)
+    return replay
+
+
+def return_replay_steps(replay_key):
+    """Return the steps of a replay, read from the cache on first use by the worker, or None if
+    they are not known (anymore, e.g. once expired from the cache)."""
+    if replay_key in dic_replays:
+        dic_replays.move_to_end(replay_key)
+        return dic_replays[replay_key]
+
+    cached_replay = cache_functions.return_replay(replay_key)
+    if cached_replay is None:
+        return None
+    times, l_dic_knobs, l_fingerprints = cached_replay
+    dic_replays[replay_key] = {
+        "times": times,
+        "l_dic_knobs": l_dic_knobs,
+        "l_fingerprints": l_fingerprints,
+        "futures": {},
+    }
+    while len(dic_replays) > MAX_REPLAYS:
+        stop_replay({"key": next(iter(dic_replays))})
+    return dic_replays[replay_key]
+
+
+def submit_replay_steps(dataset, replay_key, idx_step):
+    """Submit the twiss of a step of a replay and of the following ones to the process pool of the
+    dataset, so that they are computed while the current step is displayed. A knob state repeated
+    by several steps is only submitted once."""
+    steps = return_replay_steps(replay_key)
+    dic_futures = steps["futures"]
+    n_ahead = context_functions.return_n_processes() * REPLAY_PIPELINE_DEPTH
+    l_fingerprints_ahead = steps["l_fingerprints"][idx_step : idx_step + 1 + n_ahead]
+
+    # Forget the steps that are not needed anymore
+    for fingerprint in set(dic_futures) - set(l_fingerprints_ahead):
+        del dic_futures[fingerprint]
+
+    executor = tracker_pool_functions.return_process_pool(dataset["line_path"])
+    for idx, fingerprint in enumerate(l_fingerprints_ahead, start=idx_step):
+        if fingerprint not in dic_futures:
+            dic_futures[fingerprint] = executor.submit(
+                compute_replay_step, dataset["key"], fingerprint, steps["l_dic_knobs"][idx]
+            )
+
+
+def advance_replay(dataset, replay):
+    """Advance a replay to the current playback time, and return its new state along with the
+    twiss of the step to display (None if the next step is not due or not available yet). Each
+    step is displayed at its time, as soon as its twiss is computed, and late steps are skipped if
+    the next one is already available, so that the playback keeps up with the data."""
+    steps = return_replay_steps(replay["key"])
+    times = steps["times"]
+    idx_step = replay["idx_step"] + 1
+    submit_replay_steps(dataset, replay["key"], idx_step)
+
+    def return_step_twiss(idx):
+        return cache_functions.return_twiss(
+            dataset["key"], steps["l_fingerprints"][idx], mode="fast"
+        )
+
+    # The playback starts once the first step is available
+    tw = return_step_twiss(idx_step)
+    if replay["start"] is None:
+        if tw is None:
+            return replay, None
+        replay = dict(replay, start=time.time() - times[idx_step])
+    elapsed = time.time() - replay["start"]
+    if times[idx_step] > elapsed:
+        return replay, None
+
+    n_skipped = replay["n_skipped"]
+    while idx_step + 1 < replay["n_steps"] and times[idx_step + 1] <= elapsed:
+        tw_next = return_step_twiss(idx_step + 1)
+        if tw_next is None:
+            break
+        idx_step += 1
+        n_skipped += 1
+        tw = tw_next
+    if tw is None:
+        return replay, None
+    return dict(replay, idx_step=idx_step, n_skipped=n_skipped), tw
+
+
+def return_replay_error(replay):
+    """Return the error of a twiss computation of a replay submitted by the worker, or the reason
+    why its steps are not known, or None if the replay can go on. A failed step is never
+    computed, so the replay must be stopped."""
+    steps = return_replay_steps(replay["key"])
+    if steps is None:
+        return "the steps of the replay have expired, please play it again"
+    for future in steps["futures"].values():
+        if future.done() and not future.cancelled() and future.exception() is not None:
+            error = future.exception()
+            return f"{type(error).__name__}: {error}"
+    return None
+
+
+def stop_replay(replay):
+    """Stop a replay, cancelling the twiss computations submitted by the worker and not started
+    yet."""
+    steps = dic_replays.pop(replay["key"], None)
+    if steps is not None:
+        for future in steps["futures"].values():
+            future.cancel()
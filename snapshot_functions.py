@@ -0,0 +1,112 @@
+#################### Imports ####################
+import hashlib
+import numbers
+import numpy as np
+
+#################### Constants ####################
+
+# Maximum number of differing knobs displayed when comparing two snapshots
+MAX_DISPLAYED_DIFFERENCES = 50
+
+#################### Functions ####################
+
+
+def return_knob_catalog(tracker):
+    """Return the catalog of the (numerical) knobs of a tracker: their names, in a fixed order, the
+    index of each of them, and their default values as an array in the same order. Only the
+    independent knobs are in the catalog: a knob given by an expression follows the knobs it
+    depends on, and setting it would overwrite its expression."""
+    l_knobs = [
+        knob
+        for knob, value in tracker.vars._owner.items()
+        if isinstance(value, numbers.Real)
+        and not isinstance(value, bool)
+        and tracker.vars[knob]._expr is None
+    ]
+    default_vector = np.array([tracker.vars._owner[knob] for knob in l_knobs], dtype=np.float64)
+    default_vector.flags.writeable = False
+    return {
+        "l_knobs": l_knobs,
+        "dic_indices": {knob: idx for idx, knob in enumerate(l_knobs)},
+        "default_vector": default_vector,
+        "default_fingerprint": return_vector_fingerprint(default_vector),
+    }
+
+
+def return_vector_fingerprint(vector):
+    """Return the fingerprint of a knob vector, used as key of the snapshots and of the cached
+    results (twiss, figures, survey structures) of the corresponding knob state."""
+    return hashlib.sha1(np.ascontiguousarray(vector, dtype=np.float64).tobytes()).hexdigest()
+
+
+def validate_knob_state(knob_catalog, dic_knobs):
+    """Raise a ValueError if a knob state (e.g. read from a session store) contains knobs that are
+    not in the catalog, or values that are not finite numbers."""
+    l_unknown_knobs = [knob for knob in dic_knobs if knob not in knob_catalog["dic_indices"]]
+    if l_unknown_knobs:
+        raise ValueError(f"Unknown knob(s): {', '.join(map(str, l_unknown_knobs))}")
+    l_invalid_knobs = [
+        knob
+        for knob, value in dic_knobs.items()
+        if not isinstance(value, numbers.Real) or isinstance(value, bool) or not np.isfinite(value)
+    ]
+    if l_invalid_knobs:
+        raise ValueError(f"Invalid value for knob(s): {', '.join(l_invalid_knobs)}")
+
+
+def return_knob_vector(knob_catalog, dic_knobs):
+    """Return the full knob vector (in catalog order) of a knob state given as the knobs that
+    differ from the default."""
+    if not dic_knobs:
+        return knob_catalog["default_vector"]
+    validate_knob_state(knob_catalog, dic_knobs)
+    vector = knob_catalog["default_vector"].copy()
+    for knob, value in dic_knobs.items():
+        vector[knob_catalog["dic_indices"][knob]] = value
+    return vector
+
+
+def return_knobs_from_vector(knob_catalog, vector):
+    """Return the knobs of a knob vector that differ from the default, as a dictionnary."""
+    l_indices = np.flatnonzero(vector != knob_catalog["default_vector"])
+    return {knob_catalog["l_knobs"][idx]: float(vector[idx]) for idx in l_indices}
+
+
+def return_knob_fingerprint(knob_catalog, dic_knobs):
+    """Return the fingerprint of a knob state. Setting a knob to its default value gives the same
+    fingerprint as not setting it, which is the same optics as the catalog only holds independent
+    knobs."""
+    if not dic_knobs:
+        return knob_catalog["default_fingerprint"]
+    return return_vector_fingerprint(return_knob_vector(knob_catalog, dic_knobs))
+
+
+def return_snapshot(knob_catalog, dic_knobs):
+    """Return the snapshot of a knob state, to be kept by the session: its fingerprint, and the
+    knobs that differ from the default (a compact form of its knob vector)."""
+    vector = return_knob_vector(knob_catalog, dic_knobs)
+    return {
+        "fingerprint": return_vector_fingerprint(vector),
+        "knobs": return_knobs_from_vector(knob_catalog, vector),
+    }
+
+
+def return_snapshot_vector(knob_catalog, snapshot):
+    """Return the knob vector of a snapshot kept by a session, or None if it is not a valid
+    snapshot of the catalog."""
+    if not isinstance(snapshot, dict) or not isinstance(snapshot.get("knobs"), dict):
+        return None
+    try:
+        return return_knob_vector(knob_catalog, snapshot["knobs"])
+    except ValueError:
+        return None
+
+
+def return_snapshot_diff(knob_catalog, vector_1, vector_2):
+    """Return the knobs that differ between two knob vectors, along with their value in each of
+    them."""
+    l_indices = np.flatnonzero(vector_1 != vector_2)
+    return {
+        knob_catalog["l_knobs"][idx]: (float(vector_1[idx]), float(vector_2[idx]))
+        for idx in l_indices
+    }
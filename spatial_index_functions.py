@@ -0,0 +1,113 @@
+#################### Imports ####################
+import numpy as np
+
+#################### Functions ####################
+
+
+def return_spatial_index(x, z, l_names, cell_size=10.0):
+    """Return a uniform grid index over a set of named points in the (X, Z) survey plane."""
+    x = np.asarray(x, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    names = np.asarray(l_names, dtype=object)
+
+    # Drop undefined points (e.g. gaps between segments)
+    mask = ~(np.isnan(x) | np.isnan(z))
+    x, z, names = x[mask], z[mask], names[mask]
+
+    # Get the cell of each point
+    x_min, z_min = np.min(x), np.min(z)
+    n_z = int(np.floor((np.max(z) - z_min) / cell_size)) + 1
+    cell_keys = (
+        np.floor((x - x_min) / cell_size).astype(np.int64) * n_z
+        + np.floor((z - z_min) / cell_size).astype(np.int64)
+    )
+
+    # Sort points by cell, so that each cell is a contiguous slice of the arrays
+    order = np.argsort(cell_keys, kind="stable")
+    cell_keys = cell_keys[order]
+    unique_keys, cell_starts, cell_counts = np.unique(
+        cell_keys, return_index=True, return_counts=True
+    )
+
+    return {
+        "x": x[order],
+        "z": z[order],
+        "names": names[order],
+        # Position of each point in the input, to break ties between co-located points
+        "positions": np.flatnonzero(mask)[order],
+        "cell_keys": unique_keys,
+        "cell_starts": cell_starts,
+        "cell_ends": cell_starts + cell_counts,
+        "x_min": x_min,
+        "z_min": z_min,
+        "n_z": n_z,
+        "cell_size": cell_size,
+    }
+
+
+def return_nearest_name(spatial_index, x, z, max_distance=1.0):
+    """Return the name of the indexed point closest to (x, z), or None if no point lies within
+    max_distance. Ties (e.g. co-located thin multipoles) go to the point indexed first."""
+    cell_size = spatial_index["cell_size"]
+    ix = int(np.floor((x - spatial_index["x_min"]) / cell_size))
+    iz = int(np.floor((z - spatial_index["z_min"]) / cell_size))
+
+    # Look into all the cells that may contain a point within max_distance
+    n_cells_around = int(np.ceil(max_distance / cell_size))
+    best_name, best_distance, best_position = None, max_distance, None
+    for jx in range(ix - n_cells_around, ix + n_cells_around + 1):
+        for jz in range(iz - n_cells_around, iz + n_cells_around + 1):
+            if jz < 0 or jz >= spatial_index["n_z"]:
+                continue
+            key = jx * spatial_index["n_z"] + jz
+            idx_cell = np.searchsorted(spatial_index["cell_keys"], key)
+            if (
+                idx_cell == len(spatial_index["cell_keys"])
+                or spatial_index["cell_keys"][idx_cell] != key
+            ):
+                continue
+
+            # Compare with all the points of the cell
+            start = spatial_index["cell_starts"][idx_cell]
+            end = spatial_index["cell_ends"][idx_cell]
+            distances = np.hypot(
+                spatial_index["x"][start:end] - x, spatial_index["z"][start:end] - z
+            )
+            idx_min = np.argmin(distances)
+            position = spatial_index["positions"][start + idx_min]
+            if distances[idx_min] < best_distance or (
+                distances[idx_min] == best_distance
+                and (best_position is None or position < best_position)
+            ):
+                best_name = spatial_index["names"][start + idx_min]
+                best_distance = distances[idx_min]
+                best_position = position
+
+    return best_name
+
+
+def return_survey_spatial_index(dic_segments, dic_store, cell_size=10.0):
+    """Return the spatial index of the survey figure, built from both endpoints of the multipole
+    segments and from the IPs."""
+    df_ip = dic_store["ip"]
+    return return_spatial_index(
+        np.concatenate([dic_segments["x0"], dic_segments["x1"], df_ip["X"].to_numpy()]),
+        np.concatenate([dic_segments["z0"], dic_segments["z1"], df_ip["Z"].to_numpy()]),
+        np.concatenate([dic_segments["name"], dic_segments["name"], df_ip["name"].to_numpy()]),
+        cell_size=cell_size,
+    )
+
+
+def return_clicked_name(point, multipole_names, spatial_index, idx_first_element_trace):
+    """Return the name of the element clicked in the survey figure, or None if the click is not
+    on an element (i.e. on a trace before idx_first_element_trace, such as the optics overlays or
+    the beam pipe). Multipole segments carry the index of their multipole in customdata, and IPs
+    their name: the spatial index is only used for element traces without customdata."""
+    if point["curveNumber"] < idx_first_element_trace:
+        return None
+    customdata = point.get("customdata")
+    if isinstance(customdata, str):
+        return customdata
+    if customdata is not None:
+        return multipole_names[int(customdata)]
+    return return_nearest_name(spatial_index, point["x"], point["y"])
@@ -0,0 +1,142 @@
+#################### Imports ####################
+import numpy as np
+import numbers
+
+# Import functions
+import loading_functions
+
+#################### Constants ####################
+
+# Tables that can be explored, with their label
+DIC_TABLES = {"elements": "Elements", "twiss": "Twiss"}
+
+# Operators of the filter queries of the tables, in the order they must be parsed
+L_FILTER_OPERATORS = [
+    ("ge ", ">="),
+    ("le ", "<="),
+    ("lt ", "<"),
+    ("gt ", ">"),
+    ("ne ", "!="),
+    ("eq ", "="),
+    ("contains ",),
+    ("datestartswith ",),
+]
+
+#################### Functions ####################
+
+
+def return_table_columns(dataset, table):
+    """Return the columns of a table of a dataset as a dictionnary of arrays, built once per
+    dataset."""
+    dic_tables = dataset.setdefault("dic_tables", {})
+    if table not in dic_tables:
+        if table == "elements":
+            df = dataset["df_elements_corrected"]
+            dic_tables[table] = {str(column): df[column].to_numpy() for column in df.columns}
+        else:
+            dic_tables[table] = {
+                column: np.asarray(dataset["df_tw"][column])
+                for column in loading_functions.L_PLOTTED_TWISS_COLUMNS
+            }
+    return dic_tables[table]
+
+
+def split_filter_part(filter_part):
+    """Return the column, operator and value of a part of a filter query (e.g. "{betx} > 100")."""
+    for operator_type in L_FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+                value_part = value_part.strip()
+                if value_part and value_part[0] == value_part[-1] and value_part[0] in "'\"`":
+                    value = value_part[1:-1].replace("\\" + value_part[0], value_part[0])
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # Word operators need spaces after them in the filter string, but we don't want
+                # these later
+                return name, operator_type[0].strip(), value
+    return None, None, None
+
+
+def return_filter_mask(dic_columns, filter_query):
+    """Return the mask of the rows of a table matching a filter query."""
+    mask = np.ones(len(next(iter(dic_columns.values()))), dtype=bool)
+    if not filter_query:
+        return mask
+    for filter_part in filter_query.split(" && "):
+        column, operator, value = split_filter_part(filter_part)
+        if column not in dic_columns:
+            continue
+        array = dic_columns[column]
+        if operator in ["contains", "datestartswith"] or not np.issubdtype(
+            array.dtype, np.number
+        ):
+            array = array.astype(str)
+            value = str(value)
+            if operator == "contains":
+                mask &= np.char.find(array, value) >= 0
+                continue
+            if operator == "datestartswith":
+                mask &= np.char.startswith(array, value)
+                continue
+        elif not isinstance(value, numbers.Real):
+            # A non-numerical value never matches a numerical column
+            mask &= operator == "ne"
+            continue
+        mask &= {
+            "ge": np.greater_equal,
+            "le": np.less_equal,
+            "lt": np.less,
+            "gt": np.greater,
+            "ne": np.not_equal,
+            "eq": np.equal,
+        }[operator](array, value)
+    return mask
+
+
+def return_sort_keys(array):
+    """Return integer keys sorting a column (numerical or not) in ascending order."""
+    if not np.issubdtype(array.dtype, np.number):
+        array = array.astype(str)
+    return np.unique(array, return_inverse=True)[1]
+
+
+def return_sorted_indices(dic_columns, indices, sort_by):
+    """Return the indices of the rows of a table sorted by one or several columns (the first one
+    has precedence), with a stable sort."""
+    for sort in reversed(sort_by or []):
+        if sort["column_id"] not in dic_columns:
+            continue
+        keys = return_sort_keys(dic_columns[sort["column_id"]][indices])
+        if sort["direction"] == "desc":
+            keys = -keys
+        indices = indices[np.argsort(keys, kind="stable")]
+    return indices
+
+
+def return_displayed_value(value):
+    """Return a value of a table that can be sent to the browser."""
+    if isinstance(value, (str, bool, numbers.Real)) or value is None:
+        return value.item() if isinstance(value, np.generic) else value
+    return str(value.tolist() if isinstance(value, np.ndarray) else value)
+
+
+def return_table_page(dic_columns, page_current, page_size, sort_by, filter_query):
+    """Return the rows of a page of a filtered and sorted table (only the page is converted to
+    records), along with the number of pages."""
+    indices = np.flatnonzero(return_filter_mask(dic_columns, filter_query))
+    indices = return_sorted_indices(dic_columns, indices, sort_by)
+    page_count = max(int(np.ceil(len(indices) / page_size)), 1)
+    indices = indices[page_current * page_size : (page_current + 1) * page_size]
+
+    dic_page = {column: array[indices] for column, array in dic_columns.items()}
+    records = [
+        {column: return_displayed_value(dic_page[column][idx]) for column in dic_page}
+        for idx in range(len(indices))
+    ]
+    return records, page_count
@@ -0,0 +1,80 @@
+#################### Imports ####################
+import diskcache
+import pytest
+
+# Import functions
+import coalescing_functions
+
+#################### Tests ####################
+
+
+@pytest.fixture
+def cache_state(monkeypatch, tmp_path):
+    """Share the knob requests through an empty cache."""
+    cache = diskcache.Cache(str(tmp_path), eviction_policy="none")
+    monkeypatch.setattr(coalescing_functions.cache_functions, "cache_state", cache)
+    yield cache
+    cache.close()
+
+
+def test_is_latest_knob_request(cache_state):
+    # A request that is not recorded anymore (e.g. expired) is never the latest
+    assert not coalescing_functions.is_latest_knob_request("session", 1)
+
+    request_id_first, _ = coalescing_functions.register_knob_request("session", {}, {"a": 1.0})
+    assert coalescing_functions.is_latest_knob_request("session", request_id_first)
+
+    request_id, _ = coalescing_functions.register_knob_request("session", {}, {"b": 2.0})
+    assert not coalescing_functions.is_latest_knob_request("session", request_id_first)
+    assert coalescing_functions.is_latest_knob_request("session", request_id)
+
+    # The requests of other sessions are independent
+    request_id_other, _ = coalescing_functions.register_knob_request("other_session", {}, {})
+    assert coalescing_functions.is_latest_knob_request("other_session", request_id_other)
+    assert coalescing_functions.is_latest_knob_request("session", request_id)
+
+
+def test_register_knob_request_coalesces_changes(cache_state):
+    # The knob changes are applied on top of the latest requested state, not on the state
+    # displayed by the browser (which lags behind superseded requests)
+    coalescing_functions.register_knob_request("session", {"a": 0.0}, {"a": 1.0})
+    _, dic_knobs = coalescing_functions.register_knob_request("session", {"a": 0.0}, {"b": 2.0})
+    assert dic_knobs == {"a": 1.0, "b": 2.0}
+
+    _, dic_knobs = coalescing_functions.register_knob_request(
+        "session", {}, {"c": 3.0}, replace=True
+    )
+    assert dic_knobs == {"c": 3.0}
+
+
+def test_reset_knob_requests(cache_state):
+    request_id, _ = coalescing_functions.register_knob_request("session", {}, {"a": 1.0})
+    coalescing_functions.reset_knob_requests("session")
+    assert not coalescing_functions.is_latest_knob_request("session", request_id)
+
+    # The next request starts from the state displayed by the browser again
+    _, dic_knobs = coalescing_functions.register_knob_request("session", {"b": 0.0}, {"b": 2.0})
+    assert dic_knobs == {"b": 2.0}
+
+
+def test_wait_for_newer_knob_request(cache_state, monkeypatch):
+    l_sleeps = []
+    monkeypatch.setattr(coalescing_functions.time, "sleep", l_sleeps.append)
+
+    # The first request of a session is not debounced
+    request_id_first, _ = coalescing_functions.register_knob_request("session", {}, {"a": 1.0})
+    assert not coalescing_functions.wait_for_newer_knob_request("session", request_id_first)
+    assert l_sleeps == []
+
+    # A request made while the previous one is being computed is debounced, and dropped if
+    # superseded
+    request_id, _ = coalescing_functions.register_knob_request("session", {}, {"a": 2.0})
+    coalescing_functions.register_knob_request("session", {}, {"a": 3.0})
+    assert coalescing_functions.wait_for_newer_knob_request("session", request_id)
+    assert len(l_sleeps) == 1
+
+    # Once the previous requests are over, a new request is not debounced anymore
+    coalescing_functions.finish_knob_request("session", request_id + 1)
+    request_id, _ = coalescing_functions.register_knob_request("session", {}, {"a": 4.0})
+    assert not coalescing_functions.wait_for_newer_knob_request("session", request_id)
+    assert len(l_sleeps) == 1
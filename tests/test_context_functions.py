@@ -0,0 +1,54 @@
+#################### Imports ####################
+# Import functions
+import context_functions
+
+#################### Tests ####################
+
+
+def test_return_omp_num_threads_shares_cores_between_workers(monkeypatch):
+    monkeypatch.setattr(context_functions, "return_n_cores", lambda: 16)
+    monkeypatch.setattr(context_functions, "N_WORKERS", 2)
+    monkeypatch.setattr(context_functions, "OMP_NUM_THREADS", "auto")
+    monkeypatch.setattr(context_functions, "threads_allowed", True)
+    monkeypatch.setattr(context_functions, "N_PROCESSES", "auto")
+    # Each worker gets 8 cores, half of which are left to the process pools
+    assert context_functions.return_omp_num_threads() == 4
+    monkeypatch.setattr(context_functions, "N_WORKERS", 32)
+    assert context_functions.return_omp_num_threads() == 1
+
+    # The number of threads can be set explicitly
+    monkeypatch.setattr(context_functions, "OMP_NUM_THREADS", "3")
+    assert context_functions.return_omp_num_threads() == 3
+
+    # Processes that fork never use threads
+    monkeypatch.setattr(context_functions, "threads_allowed", False)
+    assert context_functions.return_omp_num_threads() == 1
+
+
+def test_pools_stay_within_the_cores_of_a_worker(monkeypatch):
+    monkeypatch.setattr(context_functions, "return_n_cores", lambda: 16)
+    monkeypatch.setattr(context_functions, "N_WORKERS", 2)
+    monkeypatch.setattr(context_functions, "threads_allowed", True)
+    monkeypatch.setattr(context_functions, "OMP_NUM_THREADS", "auto")
+    monkeypatch.setattr(context_functions, "N_PROCESSES", "auto")
+
+    def return_n_cores_used():
+        # Running trackers of the tracker server, and single-threaded processes of a process pool
+        return (
+            context_functions.return_n_running_trackers()
+            * context_functions.return_omp_num_threads()
+            + context_functions.return_n_processes()
+        )
+
+    assert return_n_cores_used() == 8
+
+    # With fewer threads per tracker, more trackers run at once
+    monkeypatch.setattr(context_functions, "OMP_NUM_THREADS", "2")
+    assert context_functions.return_n_running_trackers() == 2
+    assert return_n_cores_used() == 8
+
+    # A single core per worker cannot be split, but is not oversubscribed beyond a process
+    monkeypatch.setattr(context_functions, "OMP_NUM_THREADS", "auto")
+    monkeypatch.setattr(context_functions, "N_WORKERS", 16)
+    assert context_functions.return_n_running_trackers() == 1
+    assert return_n_cores_used() == 2
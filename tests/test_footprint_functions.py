@@ -0,0 +1,60 @@
+#################### Imports ####################
+import concurrent.futures
+import functools
+import numpy as np
+import uuid
+
+# Import functions
+import footprint_functions
+
+#################### Tests ####################
+
+
+def test_return_tunes():
+    # One signal per row, with tunes between the FFT bins and different phases and amplitudes
+    tunes = np.array([0.31, 0.3123, 0.2777, 0.0612])
+    turns = np.arange(1024)
+    signals = (
+        np.array([[1.0], [2e-3], [0.5], [3.0]])
+        * np.cos(2 * np.pi * tunes[:, None] * turns + np.array([[0.0], [1.0], [2.0], [3.0]]))
+        + 0.1
+    )
+    assert np.allclose(footprint_functions.return_tunes(signals), tunes, atol=1e-4)
+
+
+def test_return_tunes_on_bin():
+    # A tune on a bin of the FFT is not shifted by the interpolation towards a neighbouring bin
+    turns = np.arange(512)
+    signals = np.sin(2 * np.pi * (100 / 512) * turns)[None, :]
+    assert np.allclose(footprint_functions.return_tunes(signals), [100 / 512], atol=1e-5)
+
+
+def test_return_amplitude_grid():
+    x_norm, y_norm = footprint_functions.return_amplitude_grid(1.0, 5.0, 5, 3)
+    assert x_norm.shape == y_norm.shape == (15,)
+    assert np.all(x_norm > 0) and np.all(y_norm > 0)
+    assert np.allclose(np.hypot(x_norm, y_norm)[:5], np.linspace(1.0, 5.0, 5))
+
+
+def test_return_grid_chunks():
+    x_norm, _, l_chunks = footprint_functions.return_grid_chunks(
+        footprint_functions.DIC_DEFAULT_FOOTPRINT_PARAMETERS, 7
+    )
+    assert len(l_chunks) == 7
+    assert np.array_equal(np.concatenate(l_chunks), np.arange(len(x_norm)))
+
+
+def test_record_chunk_error():
+    # The first chunk that fails marks the job as failed, cancelled or successful chunks do not
+    job = {"key": f"test_{uuid.uuid4().hex}"}
+    l_futures = [concurrent.futures.Future() for _ in range(4)]
+    l_futures[0].set_result(None)
+    l_futures[1].cancel()
+    for future in l_futures:
+        future.add_done_callback(
+            functools.partial(footprint_functions.record_chunk_error, job["key"])
+        )
+    assert footprint_functions.return_footprint_error(job) is None
+    l_futures[2].set_exception(RuntimeError("tracking failed"))
+    l_futures[3].set_exception(ValueError("other failure"))
+    assert footprint_functions.return_footprint_error(job) == "RuntimeError: tracking failed"
@@ -0,0 +1,34 @@
+#################### Imports ####################
+from types import SimpleNamespace
+
+# Import functions
+import knob_functions
+
+#################### Tests ####################
+
+
+class Vars(dict):
+    """Knobs of a dummy tracker, with their value and expression (None for independent knobs)."""
+
+    @property
+    def _owner(self):
+        return {knob: var._value for knob, var in self.items()}
+
+
+def test_validate_knob_changes():
+    tracker = SimpleNamespace(
+        vars=Vars(
+            on_x1=SimpleNamespace(_value=160.0, _expr=None),
+            on_x5=SimpleNamespace(_value=0.0, _expr=None),
+            kqf=SimpleNamespace(_value=2.0, _expr="2 * on_x5"),
+        )
+    )
+    dic_valid_changes, l_errors = knob_functions.validate_knob_changes(
+        tracker, {"on_x1": "150", "on_x5": "nan", "kqf": 1.0, "unknown": 1.0}
+    )
+    assert dic_valid_changes == {"on_x1": 150.0}
+    assert l_errors == [
+        "Invalid value nan for knob on_x5",
+        "Knob kqf is given by an expression and cannot be set",
+        "Unknown knob unknown",
+    ]
@@ -0,0 +1,108 @@
+#################### Imports ####################
+import numpy as np
+import pickle
+import pytest
+import xobjects as xo
+import xtrack as xt
+from types import SimpleNamespace
+
+# Import functions
+import loading_functions
+
+#################### Tests ####################
+
+
+def return_twiss_table(n_elements):
+    """Return a twiss table with the plotted columns and scalars, and a column that is not
+    plotted."""
+    dic_data = {
+        column: np.arange(n_elements, dtype=np.float64)
+        for column in loading_functions.L_PLOTTED_TWISS_COLUMNS
+    }
+    dic_data["name"] = np.array([f"e{idx}" for idx in range(n_elements)], dtype=object)
+    dic_data["mux"] = np.linspace(0.0, 1.0, n_elements)
+    l_columns = list(dic_data)
+    dic_data.update({scalar: 0.31 for scalar in loading_functions.L_PLOTTED_TWISS_SCALARS})
+    return xt.TwissTable(data=dic_data, col_names=l_columns)
+
+
+def test_twiss_column_table_copies_plotted_columns():
+    n_elements = 5
+    tw = return_twiss_table(n_elements)
+    df_tw = loading_functions.TwissColumnTable(tw, correct_x_axis=True)
+
+    # The columns are copies (the x-axis reversed), so that the twiss result can be released
+    tw["betx"][:] = -1.0
+    assert np.array_equal(df_tw["betx"], np.arange(n_elements))
+    assert np.array_equal(df_tw["x"], -np.arange(n_elements))
+    assert len(df_tw) == n_elements and df_tw["qx"] == 0.31
+
+    # The other columns are only materialized on access, in full precision
+    assert "mux" in df_tw and "mux" not in df_tw._columns
+    assert np.array_equal(df_tw["mux"], np.linspace(0.0, 1.0, n_elements))
+    assert "mux" in df_tw._columns and "mux" not in df_tw._packed_columns
+    with pytest.raises(KeyError):
+        df_tw["unknown"]
+
+
+def test_return_all_loaded_variables_regenerates_other_formats(monkeypatch, tmp_path):
+    save_path = str(tmp_path / "dfs.pickle")
+    monkeypatch.setattr(loading_functions.context_functions, "build_tracker", lambda line: None)
+    monkeypatch.setattr(
+        loading_functions, "return_dataframe_elements_from_line", lambda line: "df_elements"
+    )
+    monkeypatch.setattr(
+        loading_functions,
+        "return_survey_and_twiss_dataframes_from_tracker",
+        lambda tracker, correct_x_axis: ("df_sv", "df_tw"),
+    )
+    monkeypatch.setattr(
+        loading_functions,
+        "return_dataframe_corrected_for_thin_lens_approx",
+        lambda df_elements, df_tw: "df_elements_corrected",
+    )
+
+    # Pickle of an earlier version, holding a list of dataframes
+    with open(save_path, "wb") as handle:
+        pickle.dump(["old_df_elements", "old_df_sv", "old_df_tw", "old_df_corrected"], handle)
+    variables = loading_functions.return_all_loaded_variables(save_path=save_path, line="line")
+    assert variables[2:] == ("df_elements", "df_sv", "df_tw", "df_elements_corrected")
+
+    # The regenerated pickle is read back
+    assert loading_functions.load_saved_variables(save_path) == [
+        "df_elements",
+        "df_sv",
+        "df_tw",
+        "df_elements_corrected",
+    ]
+
+
+@pytest.mark.parametrize("shared_buffer", [True, False])
+def test_return_multipole_strength_map(shared_buffer):
+    # A quadrupole sliced in two, a sextupole and a drift
+    buffer = xo.context_default.new_buffer() if shared_buffer else None
+    dic_elements = {
+        "mq": xt.Marker(_buffer=buffer),
+        "mq..1": xt.Multipole(knl=[0.0, 1.0], _buffer=buffer),
+        "mq..2": xt.Multipole(knl=[0.0, 2.0], _buffer=buffer),
+        "drift": xt.Drift(length=1.0, _buffer=buffer),
+        "ms": xt.Multipole(knl=[0.0, 0.0, 3.0], _buffer=buffer),
+    }
+    line = xt.Line(elements=list(dic_elements.values()), element_names=list(dic_elements))
+    strength_map = loading_functions.return_multipole_strength_map(SimpleNamespace(line=line))
+
+    # The single gather is only used when the elements share a buffer
+    assert (strength_map["buffer"] is not None) == shared_buffer
+    strength_map_plain = dict(strength_map, buffer=None, offsets=None)
+
+    # The strengths set after the map is built are read, the same way as with the plain read
+    dic_elements["mq..2"].knl[1] = 5.0
+    for strength_map_read in [strength_map, strength_map_plain]:
+        s_quadrupoles = loading_functions.return_multipole_strengths_from_buffers(
+            strength_map_read, 1
+        )
+        assert s_quadrupoles.to_dict() == {0: 6.0, 4: 0.0}
+        s_sextupoles = loading_functions.return_multipole_strengths_from_buffers(
+            strength_map_read, 2
+        )
+        assert s_sextupoles.to_dict() == {4: 3.0}
@@ -0,0 +1,102 @@
+#################### Imports ####################
+import numpy as np
+
+# Import functions
+import matching_functions
+
+#################### Tests ####################
+
+
+def test_return_broyden_update_secant_condition():
+    rng = np.random.default_rng(0)
+    response_matrix = rng.normal(size=(2, 3))
+    knob_step = rng.normal(size=3)
+    delta_target_values = rng.normal(size=2)
+    updated_matrix = matching_functions.return_broyden_update(
+        response_matrix, knob_step, delta_target_values
+    )
+
+    # The updated matrix reproduces the observed change along the step...
+    assert np.allclose(updated_matrix @ knob_step, delta_target_values)
+
+    # ...and is unchanged in the directions orthogonal to it
+    orthogonal_step = np.cross(knob_step, rng.normal(size=3))
+    assert np.allclose(updated_matrix @ orthogonal_step, response_matrix @ orthogonal_step)
+
+
+def test_return_broyden_update_linear_response():
+    # For a linear response, the update keeps the exact response matrix unchanged
+    response_matrix = np.array([[1.0, 0.5], [-0.2, 2.0]])
+    knob_step = np.array([1e-3, -2e-3])
+    updated_matrix = matching_functions.return_broyden_update(
+        response_matrix, knob_step, response_matrix @ knob_step
+    )
+    assert np.allclose(updated_matrix, response_matrix)
+
+
+def test_return_closest_solution():
+    l_solutions = [
+        (np.array([0.31, 0.32]), np.array([1.0, 2.0])),
+        (np.array([0.28, 0.31]), np.array([3.0, 4.0])),
+    ]
+    tolerances = np.array([1e-6, 1e-6])
+    knob_values, distance = matching_functions.return_closest_solution(
+        l_solutions, np.array([0.28, 0.31]), tolerances
+    )
+    assert np.array_equal(knob_values, [3.0, 4.0])
+    assert distance == 0.0
+    assert matching_functions.return_closest_solution([], np.array([0.28]), tolerances[:1]) == (
+        None,
+        np.inf,
+    )
+
+
+def test_match_knobs_halves_overshooting_steps(monkeypatch):
+    # Newton steps on an arctangent response overshoot (and diverge) far from the solution
+    monkeypatch.setattr(
+        matching_functions.registry_functions, "validate_knob_state", lambda *args: None
+    )
+    monkeypatch.setattr(
+        matching_functions,
+        "evaluate_targets",
+        lambda dataset, dic_knobs, l_targets, mode: (
+            np.array([np.arctan(dic_knobs["k"])]),
+            {"k": dic_knobs["k"]},
+        ),
+    )
+    monkeypatch.setattr(
+        matching_functions.cache_functions, "return_matching_solutions", lambda *args: []
+    )
+    monkeypatch.setattr(
+        matching_functions.cache_functions, "return_response_matrix", lambda *args: None
+    )
+    for name in ["store_matching_solutions", "store_response_matrix"]:
+        monkeypatch.setattr(matching_functions.cache_functions, name, lambda *args: None)
+    monkeypatch.setattr(
+        matching_functions.registry_functions,
+        "return_knob_fingerprint",
+        lambda dataset, dic_knobs: dic_knobs["k"],
+    )
+    l_stored_twiss = []
+    monkeypatch.setattr(
+        matching_functions.cache_functions,
+        "store_twiss",
+        lambda dataset_key, fingerprint, tw, mode: l_stored_twiss.append((fingerprint, tw)),
+    )
+
+    l_residuals = []
+    dic_matched_knobs, dic_reached, _, converged = matching_functions.match_knobs(
+        {"key": "dataset"},
+        {"k": 3.0},
+        {"qx": 0.0},
+        ["k"],
+        callback_progress=lambda iteration, residual: l_residuals.append(residual),
+    )
+    assert converged
+    assert abs(dic_reached["qx"]) <= matching_functions.DIC_MATCHING_TOLERANCES["qx"]
+
+    # The residual never increases (it is only repeated when the response matrix is recomputed)
+    assert np.all(np.diff(l_residuals) <= 0)
+
+    # Only the twiss of the matched knob state is shared
+    assert l_stored_twiss == [(dic_matched_knobs["k"], {"k": dic_matched_knobs["k"]})]
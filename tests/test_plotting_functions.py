@@ -0,0 +1,63 @@
+#################### Imports ####################
+import numpy as np
+
+# Import functions
+import plotting_functions
+
+#################### Tests ####################
+
+
+def return_test_twiss(n_points=100):
+    """Return a dummy twiss, with all the columns displayed around the IP."""
+    s = np.linspace(0, 1, n_points)
+    return {
+        "betx": 100 + 50 * np.sin(2 * np.pi * s),
+        "bety": 100 + 50 * np.cos(2 * np.pi * s),
+        "x": 1e-3 * s,
+        "y": -1e-3 * s,
+        "dx": np.sin(np.pi * s),
+        "dy": np.zeros(n_points),
+    }
+
+
+def test_return_updated_columns_around_IP_without_reference():
+    # All the traces are sent if no previous columns are known
+    tw = return_test_twiss()
+    dic_updated_traces, dic_columns = plotting_functions.return_updated_columns_around_IP(tw, {})
+    assert sorted(dic_updated_traces) == list(range(len(plotting_functions.L_COLUMNS_AROUND_IP)))
+    for column in plotting_functions.L_COLUMNS_AROUND_IP:
+        np.testing.assert_array_equal(dic_columns[column], tw[column])
+
+
+def test_return_updated_columns_around_IP_tolerance():
+    tw = return_test_twiss()
+    dic_previous_columns = plotting_functions.return_columns_around_IP(tw)
+
+    # Variations below the tolerance (relative to the y-range of the column) are not sent
+    y_min, y_max = plotting_functions.DIC_Y_RANGE_AROUND_IP["betx"]
+    tw_new = dict(tw, betx=tw["betx"] + 0.5e-6 * (y_max - y_min))
+    dic_updated_traces, dic_columns = plotting_functions.return_updated_columns_around_IP(
+        tw_new, dic_previous_columns, tolerance=1e-6
+    )
+    assert dic_updated_traces == {}
+
+    # The previous reference is kept, so that slow drifts are eventually sent
+    np.testing.assert_array_equal(dic_columns["betx"], dic_previous_columns["betx"])
+    tw_new = dict(tw, betx=tw["betx"] + 1.5e-6 * (y_max - y_min))
+    dic_updated_traces, dic_columns = plotting_functions.return_updated_columns_around_IP(
+        tw_new, dic_columns, tolerance=1e-6
+    )
+    idx_betx = plotting_functions.L_COLUMNS_AROUND_IP.index("betx")
+    assert list(dic_updated_traces) == [idx_betx]
+    np.testing.assert_allclose(dic_updated_traces[idx_betx], tw_new["betx"])
+    np.testing.assert_array_equal(dic_columns["betx"], tw_new["betx"])
+
+
+def test_return_updated_columns_around_IP_shape_change():
+    # A column whose length changed is always sent
+    tw = return_test_twiss()
+    dic_previous_columns = plotting_functions.return_columns_around_IP(return_test_twiss(50))
+    dic_updated_traces, _ = plotting_functions.return_updated_columns_around_IP(
+        tw, dic_previous_columns
+    )
+    assert sorted(dic_updated_traces) == list(range(len(plotting_functions.L_COLUMNS_AROUND_IP)))
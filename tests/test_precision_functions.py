@@ -0,0 +1,68 @@
+#################### Imports ####################
+import numpy as np
+import pytest
+import warnings
+
+# Import functions
+import precision_functions
+
+#################### Tests ####################
+
+
+def test_return_float32_error():
+    # Values exactly representable in float32 are converted without error
+    assert precision_functions.return_float32_error(np.array([0.0, 0.5, 1.0, 2.0])) == 0.0
+
+    # Otherwise the error is relative to the span of the array, and stays below float32 resolution
+    array = np.linspace(0.0, 27000.0, 1001) + 0.1
+    error = precision_functions.return_float32_error(array)
+    assert 0.0 < error <= np.finfo(np.float32).eps
+    assert error == pytest.approx(
+        np.max(np.abs(array.astype(np.float32).astype(np.float64) - array)) / 27000.0
+    )
+
+    # NaN are ignored, and empty or all-NaN arrays have no error
+    assert precision_functions.return_float32_error(np.array([0.5, np.nan, 1.0])) == 0.0
+    assert precision_functions.return_float32_error(np.array([])) == 0.0
+    assert precision_functions.return_float32_error(np.array([np.nan, np.nan])) == 0.0
+
+    # A constant array can not be represented with a relative error if it is not exact
+    assert precision_functions.return_float32_error(np.array([0.1, 0.1])) == np.inf
+
+
+def test_return_plotting_array_converts_within_bound():
+    array = np.linspace(0.0, 27000.0, 1001)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        plotting_array = precision_functions.return_plotting_array(
+            array, use_float32=True, max_relative_error=1e-5
+        )
+    assert plotting_array.dtype == np.float32
+    assert np.allclose(plotting_array, array, rtol=0.0, atol=27000.0 * 1e-5)
+
+    # Without float32, arrays are kept in float64
+    assert precision_functions.return_plotting_array(array, use_float32=False).dtype == np.float64
+
+
+def test_return_plotting_array_falls_back_to_float64():
+    # Large offsets with small variations can not be represented in float32
+    array = 1e8 + np.linspace(0.0, 1.0, 11)
+    with pytest.warns(RuntimeWarning, match="float64 is kept"):
+        plotting_array = precision_functions.return_plotting_array(
+            array, use_float32=True, max_relative_error=1e-5
+        )
+    assert plotting_array.dtype == np.float64
+    assert np.array_equal(plotting_array, array)
+
+
+def test_return_plotting_array_passes_non_float_arrays_through():
+    for array in [
+        np.arange(5),
+        np.array([True, False]),
+        np.array(["ip1", "ip5"], dtype=object),
+        np.array(["mq.1", "mq.2"]),
+    ]:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            plotting_array = precision_functions.return_plotting_array(array, use_float32=True)
+        assert plotting_array is array
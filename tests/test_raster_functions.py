@@ -0,0 +1,45 @@
+#################### Imports ####################
+import numpy as np
+import struct
+import zlib
+
+# Import functions
+import raster_functions
+
+#################### Tests ####################
+
+
+def return_png_chunks(png):
+    """Return the (tag, data) chunks of a PNG file, checking their CRC."""
+    l_chunks = []
+    position = 8
+    while position < len(png):
+        (length,) = struct.unpack(">I", png[position : position + 4])
+        tag = png[position + 4 : position + 8]
+        data = png[position + 8 : position + 8 + length]
+        (crc,) = struct.unpack(">I", png[position + 8 + length : position + 12 + length])
+        assert crc == zlib.crc32(tag + data) & 0xFFFFFFFF
+        l_chunks.append((tag, data))
+        position += 12 + length
+    return l_chunks
+
+
+def test_encode_png():
+    rgba = np.random.default_rng(0).integers(0, 256, size=(3, 5, 4), dtype=np.uint8)
+    png = raster_functions.encode_png(rgba)
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+
+    l_chunks = return_png_chunks(png)
+    assert [tag for tag, _ in l_chunks] == [b"IHDR", b"IDAT", b"IEND"]
+    assert struct.unpack(">IIBBBBB", l_chunks[0][1]) == (5, 3, 8, 6, 0, 0, 0)
+
+    # Each row starts with the filter byte 0, followed by the RGBA pixels
+    raw = np.frombuffer(zlib.decompress(l_chunks[1][1]), dtype=np.uint8).reshape(3, 5 * 4 + 1)
+    assert np.all(raw[:, 0] == 0)
+    assert np.array_equal(raw[:, 1:].reshape(3, 5, 4), rgba)
+
+
+def test_encode_png_single_pixel():
+    rgba = np.array([[[255, 0, 128, 255]]], dtype=np.uint8)
+    l_chunks = return_png_chunks(raster_functions.encode_png(rgba))
+    assert zlib.decompress(l_chunks[1][1]) == bytes([0, 255, 0, 128, 255])
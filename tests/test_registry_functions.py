@@ -0,0 +1,151 @@
+#################### Imports ####################
+import numpy as np
+import pandas as pd
+import pickle
+import pytest
+import threading
+from collections import OrderedDict
+
+# Import functions
+import registry_functions
+
+#################### Tests ####################
+
+
+def set_registry(monkeypatch, dic_sizes_mb, set_pinned_keys):
+    """Fill the registry with dummy datasets (holding an array of the given size in MB), and
+    return the line files whose process pool is shut down."""
+    monkeypatch.setattr(
+        registry_functions,
+        "dic_datasets",
+        OrderedDict(
+            (key, {"line_path": key + ".json", "array": np.zeros(int(size_mb * 1024**2), np.int8)})
+            for key, size_mb in dic_sizes_mb.items()
+        ),
+    )
+    monkeypatch.setattr(registry_functions, "set_pinned_keys", set_pinned_keys)
+    monkeypatch.setattr(registry_functions, "MEMORY_BUDGET_MB", 10)
+    monkeypatch.setattr(
+        registry_functions.raster_functions, "invalidate_tile_pyramid", lambda key: None
+    )
+    l_shutdown_line_paths = []
+    monkeypatch.setattr(
+        registry_functions.tracker_pool_functions,
+        "shutdown_process_pool",
+        l_shutdown_line_paths.append,
+    )
+    monkeypatch.setattr(
+        registry_functions.tracker_server_functions, "release_trackers", lambda line_path: None
+    )
+    return l_shutdown_line_paths
+
+
+def test_evict_cold_datasets_evicts_until_within_budget(monkeypatch):
+    # The coldest datasets are evicted until the estimated memory is within budget
+    l_shutdown_line_paths = set_registry(
+        monkeypatch, {"default": 4, "cold": 3, "cool": 3, "warm": 3, "in_use": 3}, {"default"}
+    )
+    registry_functions.evict_cold_datasets(dataset_key_in_use="in_use")
+    assert list(registry_functions.dic_datasets) == ["default", "warm", "in_use"]
+    assert l_shutdown_line_paths == ["cold.json", "cool.json"]
+
+
+def test_evict_cold_datasets_keeps_pinned_and_in_use_datasets(monkeypatch):
+    l_shutdown_line_paths = set_registry(monkeypatch, {"default": 8, "in_use": 8}, {"default"})
+    registry_functions.evict_cold_datasets(dataset_key_in_use="in_use")
+    assert list(registry_functions.dic_datasets) == ["default", "in_use"]
+    assert l_shutdown_line_paths == []
+
+
+def test_evict_cold_datasets_below_budget(monkeypatch):
+    l_shutdown_line_paths = set_registry(monkeypatch, {"default": 4, "cold": 4}, {"default"})
+    registry_functions.evict_cold_datasets()
+    assert list(registry_functions.dic_datasets) == ["default", "cold"]
+    assert l_shutdown_line_paths == []
+
+
+def test_return_estimated_size_bytes_counts_shared_objects_once():
+    array = np.zeros(1000)
+    df = pd.DataFrame({"a": np.zeros(100)})
+    size = registry_functions.return_estimated_size_bytes(
+        {"array": array, "states": [{"array": array, "df": df}], "other": "text"}
+    )
+    assert size == array.nbytes + df.memory_usage(deep=True).sum()
+
+
+def test_register_dataset_from_upload_folder_rejects_invalid_keys(monkeypatch, tmp_path):
+    monkeypatch.setattr(registry_functions, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    (tmp_path / "foo.json").write_text("{}")
+    for dataset_key in ["../foo_b1", "0" * 40 + "_b2", "0" * 40 + "_b1/..", None]:
+        with pytest.raises(ValueError):
+            registry_functions.register_dataset_from_upload_folder(dataset_key)
+
+    # A valid key whose line has not been uploaded is simply not found
+    assert not registry_functions.register_dataset_from_upload_folder("0" * 40 + "_b1")
+
+
+def test_validate_knob_state():
+    dataset = {
+        "knob_catalog": {"dic_indices": {"on_x1": 0, "on_x5": 1}},
+    }
+    registry_functions.validate_knob_state(dataset, {"on_x1": 160.0, "on_x5": 0})
+    registry_functions.validate_knob_state(dataset, None)
+    with pytest.raises(ValueError, match="Unknown knob"):
+        registry_functions.validate_knob_state(dataset, {"on_x1": 160.0, "unknown": 1.0})
+    with pytest.raises(ValueError, match="Invalid value"):
+        registry_functions.validate_knob_state(dataset, {"on_x1": "160"})
+
+
+def test_load_prepared_structures_ignores_other_versions(monkeypatch, tmp_path):
+    save_path = str(tmp_path / "dataset_dfs.pickle")
+    prepared_path = registry_functions.return_prepared_path(save_path)
+    assert registry_functions.load_prepared_structures(save_path) is None
+
+    with open(prepared_path, "wb") as handle:
+        pickle.dump(
+            {"version": registry_functions.PREPARED_FORMAT_VERSION, "dic_store": {}}, handle
+        )
+    assert registry_functions.load_prepared_structures(save_path)["dic_store"] == {}
+
+    # Files of another format, or truncated, are ignored so that the structures are rebuilt
+    monkeypatch.setattr(registry_functions, "PREPARED_FORMAT_VERSION", 2)
+    assert registry_functions.load_prepared_structures(save_path) is None
+    with open(prepared_path, "wb") as handle:
+        handle.write(b"\x80")
+    assert registry_functions.load_prepared_structures(save_path) is None
+
+
+def test_return_survey_tile_pyramid_only_for_default_strengths(monkeypatch):
+    monkeypatch.setattr(
+        registry_functions.raster_functions, "return_tile_pyramid", lambda key: {"key": key}
+    )
+    dic_store = {"multipoles": {1: pd.DataFrame({"strength": [1.0, np.nan]})}}
+    dataset = {"key": "dataset", "dic_store": dic_store}
+    assert registry_functions.return_survey_tile_pyramid(dataset, {"dic_store": dic_store}) == {
+        "key": "dataset"
+    }
+
+    # Knob states keeping the default strengths can use the tiles, the other ones can not
+    dic_store_same = {"multipoles": {1: pd.DataFrame({"strength": [1.0, np.nan]})}}
+    assert registry_functions.return_survey_tile_pyramid(dataset, {"dic_store": dic_store_same})
+    dic_store_changed = {"multipoles": {1: pd.DataFrame({"strength": [2.0, np.nan]})}}
+    assert (
+        registry_functions.return_survey_tile_pyramid(dataset, {"dic_store": dic_store_changed})
+        is None
+    )
+
+
+def test_evict_cold_datasets_drops_unheld_locks(monkeypatch):
+    set_registry(monkeypatch, {"cold": 6, "cool": 6, "warm": 6}, set())
+    lock_held = threading.Lock()
+    lock_held.acquire()
+    monkeypatch.setattr(
+        registry_functions,
+        "dic_locks_datasets",
+        {"cold": threading.Lock(), "cool": lock_held, "warm": threading.Lock()},
+    )
+    registry_functions.evict_cold_datasets(dataset_key_in_use="warm")
+
+    # The lock of a dataset being rebuilt by another thread is kept
+    assert list(registry_functions.dic_datasets) == ["warm"]
+    assert set(registry_functions.dic_locks_datasets) == {"cool", "warm"}
@@ -0,0 +1,34 @@
+#################### Imports ####################
+import plotly.graph_objects as go
+import pytest
+
+# Import functions
+import rendering_functions
+
+#################### Tests ####################
+
+
+def test_return_scatter_trace_per_target():
+    x = list(range(2000))
+    assert isinstance(rendering_functions.return_scatter_trace(x=x, y=x), go.Scattergl)
+    assert isinstance(
+        rendering_functions.return_scatter_trace(target="notebook", x=x, y=x), go.Scatter
+    )
+    assert isinstance(
+        rendering_functions.return_scatter_trace(target="static", x=x * 10, y=x * 10), go.Scatter
+    )
+    with pytest.raises(ValueError):
+        rendering_functions.return_scatter_trace(target="pdf", x=x, y=x)
+
+
+def test_return_overlay_scatter_trace_keeps_one_renderer():
+    # Small overlay traces use the renderer of the largest traces of their figure
+    for target in ["browser", "notebook"]:
+        assert isinstance(
+            rendering_functions.return_overlay_scatter_trace(target=target, x=[0, 1], y=[0, 1]),
+            go.Scattergl,
+        )
+    assert isinstance(
+        rendering_functions.return_overlay_scatter_trace(target="static", x=[0, 1], y=[0, 1]),
+        go.Scatter,
+    )
@@ -0,0 +1,30 @@
+#################### Imports ####################
+import concurrent.futures
+
+# Import functions
+import replay_functions
+
+#################### Tests ####################
+
+
+def test_return_replay_error(monkeypatch):
+    # Pending, cancelled and successful steps are not errors, a failed step is
+    l_futures = [concurrent.futures.Future() for _ in range(4)]
+    l_futures[1].cancel()
+    l_futures[2].set_result(None)
+    monkeypatch.setitem(
+        replay_functions.dic_replays,
+        "test",
+        {"futures": {f"step_{idx}": future for idx, future in enumerate(l_futures)}},
+    )
+    assert replay_functions.return_replay_error({"key": "test"}) is None
+    l_futures[3].set_exception(RuntimeError("twiss failed"))
+    assert replay_functions.return_replay_error({"key": "test"}) == "RuntimeError: twiss failed"
+
+
+def test_return_replay_error_for_expired_replay(monkeypatch):
+    # The steps of a replay that expired from the cache can not be read anymore
+    monkeypatch.setattr(replay_functions.cache_functions, "return_replay", lambda replay_key: None)
+    assert replay_functions.return_replay_steps("expired") is None
+    assert "expired" in replay_functions.return_replay_error({"key": "expired"})
+    assert "expired" not in replay_functions.dic_replays
@@ -0,0 +1,77 @@
+#################### Imports ####################
+import numpy as np
+
+# Import functions
+import snapshot_functions
+
+#################### Tests ####################
+
+
+class Var:
+    """Knob of a dummy tracker, with its value and expression (None for independent knobs)."""
+
+    def __init__(self, value, expr=None):
+        self._value = value
+        self._expr = expr
+
+
+class Vars(dict):
+    """Knobs of a dummy tracker."""
+
+    @property
+    def _owner(self):
+        return {knob: var._value for knob, var in self.items()}
+
+
+class Tracker:
+    def __init__(self, vars):
+        self.vars = vars
+
+
+def return_test_tracker():
+    return Tracker(
+        Vars(
+            on_x1=Var(160.0),
+            on_x5=Var(0.0),
+            kqf=Var(2.0, expr="2 * on_x5"),
+            on_disp=Var(True),
+            name=Var("lhcb1"),
+        )
+    )
+
+
+def test_return_knob_catalog_keeps_independent_knobs():
+    # Knobs given by an expression would lose it if set: they are not in the catalog
+    knob_catalog = snapshot_functions.return_knob_catalog(return_test_tracker())
+    assert knob_catalog["l_knobs"] == ["on_x1", "on_x5"]
+    assert np.array_equal(knob_catalog["default_vector"], [160.0, 0.0])
+
+
+def test_return_knob_fingerprint():
+    knob_catalog = snapshot_functions.return_knob_catalog(return_test_tracker())
+
+    # Setting an independent knob to its default value does not change the optics
+    assert (
+        snapshot_functions.return_knob_fingerprint(knob_catalog, {"on_x1": 160.0})
+        == knob_catalog["default_fingerprint"]
+    )
+    assert (
+        snapshot_functions.return_knob_fingerprint(knob_catalog, {"on_x1": 160.0, "on_x5": 1.0})
+        == snapshot_functions.return_knob_fingerprint(knob_catalog, {"on_x5": 1.0})
+        != knob_catalog["default_fingerprint"]
+    )
+
+
+def test_return_snapshot_vector():
+    knob_catalog = snapshot_functions.return_knob_catalog(return_test_tracker())
+
+    # The snapshot only keeps the knobs that differ from the default, and gives the same vector
+    snapshot = snapshot_functions.return_snapshot(knob_catalog, {"on_x1": 160.0, "on_x5": 1.5})
+    assert snapshot["knobs"] == {"on_x5": 1.5}
+    vector = snapshot_functions.return_snapshot_vector(knob_catalog, snapshot)
+    assert np.array_equal(vector, [160.0, 1.5])
+    assert snapshot_functions.return_vector_fingerprint(vector) == snapshot["fingerprint"]
+
+    # Invalid snapshots (e.g. from an older session) are not restored
+    assert snapshot_functions.return_snapshot_vector(knob_catalog, {"fingerprint": "0"}) is None
+    assert snapshot_functions.return_snapshot_vector(knob_catalog, {"knobs": {"kqf": 1.0}}) is None
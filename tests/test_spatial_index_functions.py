@@ -0,0 +1,78 @@
+#################### Imports ####################
+import numpy as np
+
+# Import functions
+import spatial_index_functions
+
+#################### Tests ####################
+
+
+def return_test_spatial_index():
+    """Return the spatial index of a few points, two of them co-located (thin multipoles)."""
+    return spatial_index_functions.return_spatial_index(
+        [0.0, 5.0, 5.0, 25.0, np.nan],
+        [0.0, 5.0, 5.0, 0.0, 0.0],
+        ["mq.1", "mcs.2", "mco.2", "mb.3", "gap"],
+    )
+
+
+def test_return_nearest_name():
+    spatial_index = return_test_spatial_index()
+    assert spatial_index_functions.return_nearest_name(spatial_index, 0.2, -0.3) == "mq.1"
+    assert spatial_index_functions.return_nearest_name(spatial_index, 24.5, 0.5) == "mb.3"
+
+
+def test_return_nearest_name_across_cells():
+    # The closest point lies in a neighbouring cell of the grid
+    spatial_index = return_test_spatial_index()
+    assert spatial_index_functions.return_nearest_name(spatial_index, 9.8, 5.0, 5.0) == "mcs.2"
+
+
+def test_return_nearest_name_out_of_range():
+    spatial_index = return_test_spatial_index()
+    assert spatial_index_functions.return_nearest_name(spatial_index, 15.0, 0.0) is None
+    assert spatial_index_functions.return_nearest_name(spatial_index, 1.0, 0.0) == "mq.1"
+
+
+def test_return_nearest_name_ties():
+    # Co-located points resolve to the one indexed first
+    spatial_index = return_test_spatial_index()
+    assert spatial_index_functions.return_nearest_name(spatial_index, 5.0, 5.0) == "mcs.2"
+    assert spatial_index_functions.return_nearest_name(spatial_index, 5.5, 5.0) == "mcs.2"
+
+    # Equidistant points of different cells resolve to the one indexed first as well
+    spatial_index = spatial_index_functions.return_spatial_index(
+        [9.0, 21.0], [0.0, 0.0], ["mq.1", "mq.2"]
+    )
+    assert spatial_index_functions.return_nearest_name(spatial_index, 15.0, 0.0, 6.5) == "mq.1"
+
+
+def test_return_clicked_name():
+    spatial_index = return_test_spatial_index()
+    multipole_names = np.array(["mq.1", "mcs.2", "mco.2", "mb.3"], dtype=object)
+
+    # Multipole segments carry the index of their multipole, IPs their name
+    point = {"curveNumber": 20, "x": 5.0, "y": 5.0, "customdata": 2}
+    assert (
+        spatial_index_functions.return_clicked_name(point, multipole_names, spatial_index, 17)
+        == "mco.2"
+    )
+    point = {"curveNumber": 30, "x": 0.0, "y": 0.0, "customdata": "ip1"}
+    assert (
+        spatial_index_functions.return_clicked_name(point, multipole_names, spatial_index, 17)
+        == "ip1"
+    )
+
+    # Clicks on the traces preceding the elements (e.g. optics overlays) are ignored
+    point = {"curveNumber": 5, "x": 0.0, "y": 0.0}
+    assert (
+        spatial_index_functions.return_clicked_name(point, multipole_names, spatial_index, 17)
+        is None
+    )
+
+    # The spatial index is used for element traces without customdata
+    point = {"curveNumber": 20, "x": 24.8, "y": 0.1}
+    assert (
+        spatial_index_functions.return_clicked_name(point, multipole_names, spatial_index, 17)
+        == "mb.3"
+    )
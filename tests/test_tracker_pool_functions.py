@@ -0,0 +1,53 @@
+#################### Imports ####################
+# Standard imports
+import threading
+import time
+
+# Import functions
+import context_functions
+import tracker_pool_functions
+
+#################### Tests ####################
+
+
+def test_checkout_tracker_limits_running_trackers_over_all_pools(monkeypatch):
+    monkeypatch.setattr(context_functions, "return_n_running_trackers", lambda: 2)
+    monkeypatch.setattr(tracker_pool_functions, "semaphore_running_trackers", None)
+    monkeypatch.setattr(
+        tracker_pool_functions,
+        "build_pooled_tracker",
+        lambda line_path: {
+            "tracker": None,
+            "dic_applied_knobs": {},
+            "dic_original_knobs": {},
+            "strength_map": None,
+            "omp_num_threads": 1,
+        },
+    )
+
+    # Two line files, whose pools could build 4 trackers each
+    l_tracker_pools = [
+        tracker_pool_functions.return_tracker_pool(line_path, pool_size=4)
+        for line_path in ["b1.json", "b2.json"]
+    ]
+    lock = threading.Lock()
+    dic_running = {"current": 0, "max": 0}
+
+    def track(tracker_pool):
+        with tracker_pool_functions.checkout_tracker(tracker_pool):
+            with lock:
+                dic_running["current"] += 1
+                dic_running["max"] = max(dic_running["max"], dic_running["current"])
+            time.sleep(0.02)
+            with lock:
+                dic_running["current"] -= 1
+
+    l_threads = [
+        threading.Thread(target=track, args=(l_tracker_pools[i % 2],)) for i in range(8)
+    ]
+    for thread in l_threads:
+        thread.start()
+    for thread in l_threads:
+        thread.join()
+
+    assert dic_running["max"] == 2
@@ -0,0 +1,39 @@
+#################### Imports ####################
+import os
+import pytest
+
+# Import functions
+import tracker_server_functions
+
+#################### Tests ####################
+
+
+@pytest.fixture(scope="module")
+def tracker_server():
+    """Start the tracker server once for all the tests."""
+    tracker_server_functions.start_tracker_server()
+
+
+def test_tracker_server_is_reached_from_forked_processes(tracker_server):
+    # The parent opens its connection before forking, as the worker does
+    tracker_server_functions.release_trackers("line.json")
+    pid = os.fork()
+    if pid == 0:
+        try:
+            tracker_server_functions.release_trackers("line.json")
+        except BaseException:
+            os._exit(1)
+        os._exit(0)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    # The connection of the parent is not disturbed by the child
+    tracker_server_functions.release_trackers("line.json")
+
+
+def test_tracker_server_raises_errors_of_the_server(tracker_server, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        tracker_server_functions.compute_twiss(str(tmp_path / "missing.json"), {}, mode="fast")
+
+    # The server keeps serving requests afterwards
+    tracker_server_functions.release_trackers(str(tmp_path / "missing.json"))
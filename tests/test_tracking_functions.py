@@ -0,0 +1,60 @@
+#################### Imports ####################
+import numpy as np
+from types import SimpleNamespace
+
+# Import functions
+import tracking_functions
+
+#################### Tests ####################
+
+
+def test_record_chunk():
+    # Chunk of 4 turns starting at turn 10, 3 particles of which 2 are displayed. Particle 1 is
+    # lost during turn 11, particle 2 (not displayed) during turn 12.
+    n_turns = 4
+    buffers = tracking_functions.return_tracking_buffers(3, 100, n_turns)
+    buffers["dic_phase_space"] = {
+        coordinate: array[:, :2] for coordinate, array in buffers["dic_phase_space"].items()
+    }
+    x = np.array([[1.0, 2.0, 3.0, 4.0], [3.0, 4.0, 0.0, 0.0]])
+    monitor = SimpleNamespace(
+        state=np.array([[1, 1, 1, 1], [1, 1, 0, 0]]),
+        x=x,
+        px=-x,
+        y=2 * x,
+        py=-2 * x,
+    )
+    particles = SimpleNamespace(state=np.array([1, 0, 0]), at_turn=np.array([14, 11, 12]))
+    tracking_functions.record_chunk(monitor, particles, buffers, 10, n_turns)
+
+    dic_phase_space, dic_turn_by_turn = tracking_functions.return_tracking_frame(buffers)
+    assert np.array_equal(
+        dic_phase_space["x"], [1.0, 3.0, 2.0, 4.0, 3.0, np.nan, 4.0, np.nan], equal_nan=True
+    )
+    assert np.array_equal(dic_turn_by_turn["turn"], [10, 11, 12, 13])
+    assert np.array_equal(dic_turn_by_turn["n_alive"], [3, 3, 2, 1])
+    assert np.allclose(dic_turn_by_turn["mean_x"], [2.0, 3.0, 3.0, 4.0])
+    assert np.allclose(dic_turn_by_turn["rms_y"], [2.0, 2.0, 0.0, 0.0])
+
+
+def test_iterate_tracking_gathers_the_chunks():
+    # Each chunk sends its phase space and the turn-by-turn points recorded during the chunk only
+    l_n_turns_chunks = []
+
+    def track_chunk(n_turns):
+        turn = sum(l_n_turns_chunks)
+        l_n_turns_chunks.append(n_turns)
+        dic_chunk_turn_by_turn = {
+            column: np.arange(turn, turn + n_turns, dtype=np.float64)
+            for column in ["turn", "mean_x", "mean_y", "rms_x", "rms_y", "n_alive"]
+        }
+        return {"x": np.zeros(n_turns)}, dic_chunk_turn_by_turn, turn + n_turns < 8
+
+    l_frames = list(tracking_functions.iterate_tracking(track_chunk, 10, 3))
+
+    # The tracking stops once all the particles are lost
+    assert l_n_turns_chunks == [3, 3, 3]
+    assert [turn for turn, _ in l_frames] == [3, 6, 9]
+    dic_phase_space, dic_turn_by_turn = l_frames[-1][1]
+    assert np.array_equal(dic_turn_by_turn["turn"], np.arange(9))
+    assert len(dic_phase_space["x"]) == 3
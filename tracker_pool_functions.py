@@ -0,0 +1,178 @@
+#################### Imports ####################
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import queue
+import threading
+
+# Import functions
+import context_functions
+import loading_functions
+
+#################### Constants ####################
+
+# Maximum number of trackers built by the tracker server for each line file. Requests beyond that
+# wait for a tracker to be given back to the pool. Trackers are kept warm in different knob
+# states, but only context_functions.return_n_running_trackers() of them run at once.
+TRACKER_POOL_SIZE = int(os.environ.get("LHC_DASH_TRACKER_POOL_SIZE", "4"))
+
+# Semaphore limiting the number of trackers checked out at once, over all the pools of the
+# process, created on first use
+semaphore_running_trackers = None
+lock_semaphore_running_trackers = threading.Lock()
+
+# Tracker of a process of a process pool, built once by the initializer of the process
+process_pooled_tracker = None
+
+# Process pools of the worker, one per line file, created on first use and kept until the
+# corresponding dataset is evicted
+dic_process_pools = {}
+lock_process_pools = threading.Lock()
+
+#################### Functions ####################
+
+
+def forget_process_pools():
+    """Forget the process pools inherited by a forked process (e.g. a background job): they are
+    owned by the parent process, and must neither be used nor shut down by the child."""
+    global dic_process_pools, lock_process_pools
+    dic_process_pools = {}
+    lock_process_pools = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_process_pools)
+
+
+def return_tracker_pool(line_path, pool_size=None):
+    """Return an (initially empty) pool of trackers built from the same line file. Trackers are
+    only built when all the existing ones are in use."""
+    return {
+        "line_path": line_path,
+        "pool_size": TRACKER_POOL_SIZE if pool_size is None else pool_size,
+        "n_trackers": 0,
+        # Last in, first out, so that the most recently used trackers (whose knob state is
+        # probably the closest to the requested one) are reused first
+        "queue": queue.LifoQueue(),
+        "lock": threading.Lock(),
+    }
+
+
+def build_pooled_tracker(line_path):
+    """Build a new tracker for the pool, along with the record of the knobs set on it."""
+    tracker = context_functions.build_tracker(loading_functions.return_line_from_file(line_path))
+    return {
+        "tracker": tracker,
+        # Knobs currently set on the tracker, and their original value (or expression)
+        "dic_applied_knobs": {},
+        "dic_original_knobs": {},
+        # Views over the multipole strengths, built on first use
+        "strength_map": None,
+        # Number of OpenMP threads of the context the tracker is built on
+        "omp_num_threads": context_functions.return_context_omp_num_threads(),
+    }
+
+
+def acquire_pooled_tracker(tracker_pool):
+    """Take a tracker from the pool, building a new one if all are in use and the pool is not
+    full, and waiting for one to be given back otherwise."""
+    try:
+        return tracker_pool["queue"].get_nowait()
+    except queue.Empty:
+        with tracker_pool["lock"]:
+            build_tracker = tracker_pool["n_trackers"] < tracker_pool["pool_size"]
+            if build_tracker:
+                tracker_pool["n_trackers"] += 1
+        if not build_tracker:
+            return tracker_pool["queue"].get()
+
+    try:
+        return build_pooled_tracker(tracker_pool["line_path"])
+    except Exception:
+        with tracker_pool["lock"]:
+            tracker_pool["n_trackers"] -= 1
+        raise
+
+
+def apply_knob_state(pooled_tracker, dic_knobs):
+    """Set a tracker to a given knob state (knobs not in the state keep their original value),
+    only changing the knobs that differ from the ones currently applied."""
+    tracker = pooled_tracker["tracker"]
+    dic_applied_knobs = pooled_tracker["dic_applied_knobs"]
+    dic_original_knobs = pooled_tracker["dic_original_knobs"]
+
+    # Restore the knobs set by a previous request but absent from the new state
+    for knob in [knob for knob in dic_applied_knobs if knob not in dic_knobs]:
+        tracker.vars[knob] = dic_original_knobs[knob]
+        del dic_applied_knobs[knob]
+
+    # Set the knobs that changed
+    for knob, value in dic_knobs.items():
+        if knob in dic_applied_knobs and dic_applied_knobs[knob] == value:
+            continue
+        if knob not in dic_original_knobs:
+            # Keep the expression of the knob, if any, so that it can be restored
+            expr = tracker.vars[knob]._expr
+            dic_original_knobs[knob] = expr if expr is not None else tracker.vars[knob]._value
+        tracker.vars[knob] = value
+        dic_applied_knobs[knob] = value
+
+
+def return_semaphore_running_trackers():
+    """Return the semaphore limiting the number of trackers checked out at once."""
+    global semaphore_running_trackers
+    with lock_semaphore_running_trackers:
+        if semaphore_running_trackers is None:
+            semaphore_running_trackers = threading.BoundedSemaphore(
+                context_functions.return_n_running_trackers()
+            )
+        return semaphore_running_trackers
+
+
+@contextlib.contextmanager
+def checkout_tracker(tracker_pool, dic_knobs=None):
+    """Check out a tracker of the pool set to a given knob state, and give it back to the pool
+    afterwards. The tracker must not be used outside of the context. Checkouts wait while the
+    maximum number of trackers are running, so that their threads do not oversubscribe the
+    cores."""
+    with return_semaphore_running_trackers():
+        pooled_tracker = acquire_pooled_tracker(tracker_pool)
+        try:
+            apply_knob_state(pooled_tracker, {} if dic_knobs is None else dic_knobs)
+            yield pooled_tracker
+        finally:
+            tracker_pool["queue"].put(pooled_tracker)
+
+
+def initialize_process_tracker(line_path):
+    """Build the tracker of a process of a process pool. The work is parallelized over the
+    processes, so each tracker runs on a single thread."""
+    global process_pooled_tracker
+    context_functions.OMP_NUM_THREADS = "1"
+    process_pooled_tracker = build_pooled_tracker(line_path)
+
+
+def return_process_pool(line_path):
+    """Return the pool of processes of a line file, each holding a tracker built from it (use
+    process_pooled_tracker in the functions submitted to the pool). The pool is created on first
+    use, and reused by all the requests until it is shut down."""
+    with lock_process_pools:
+        if line_path not in dic_process_pools:
+            # Spawn the processes rather than forking the server. They run a single-threaded
+            # tracker each, so the pool takes the share of the cores of the worker.
+            dic_process_pools[line_path] = concurrent.futures.ProcessPoolExecutor(
+                max_workers=context_functions.return_n_processes(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initialize_process_tracker,
+                initargs=(line_path,),
+            )
+        return dic_process_pools[line_path]
+
+
+def shutdown_process_pool(line_path):
+    """Shut down the pool of processes of a line file (if any), cancelling the pending work."""
+    with lock_process_pools:
+        executor = dic_process_pools.pop(line_path, None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
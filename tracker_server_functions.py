@@ -0,0 +1,330 @@
+#################### Imports ####################
+import multiprocessing
+import multiprocessing.connection
+import os
+import tempfile
+import numpy as np
+import threading
+import time
+import uuid
+
+# Import functions
+import cache_functions
+import context_functions
+import knob_functions
+import loading_functions
+import tracker_pool_functions
+import tracking_functions
+
+#################### Constants ####################
+
+# Address and authentication key of the tracker server of the worker, set when it is started.
+# The background jobs forked from the worker inherit them, and reach the same server.
+tracker_server_address = None
+tracker_server_authkey = None
+
+# Connection of each thread of the process to the tracker server, opened on first use
+local_connections = threading.local()
+
+# Pools of trackers of the tracker server, one per line file, created on first use
+dic_tracker_pools = {}
+lock_tracker_pools = threading.Lock()
+
+# Trackings in progress in the tracker server, per tracking session id: their particles, monitor
+# and buffers stay in the server between chunks of turns
+dic_tracking_sessions = {}
+lock_tracking_sessions = threading.Lock()
+
+# Time (in seconds) without any chunk of turns after which a tracking session is dropped (e.g.
+# the one of a cancelled background job, which never ends its session)
+TRACKING_SESSION_EXPIRE_TIME = 600
+
+#################### Functions ####################
+
+
+def forget_connections():
+    """Forget the connections to the tracker server inherited by a forked process (e.g. a
+    background job): they are used by the parent process, so the child opens its own."""
+    global local_connections
+    local_connections = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_connections)
+
+
+def start_tracker_server():
+    """Start the tracker server of the worker, if not started yet. This must be done before the
+    worker forks any background job, so that the jobs can reach it."""
+    global tracker_server_address, tracker_server_authkey
+    if tracker_server_address is not None:
+        return
+    address = os.path.join(tempfile.gettempdir(), f"lhc_dash_trackers_{uuid.uuid4().hex}")
+    authkey = os.urandom(32)
+
+    # The server is spawned rather than forked: it never forks itself, so its trackers can use
+    # OpenMP threads, unlike the ones of the worker
+    mp_context = multiprocessing.get_context("spawn")
+    connection_ready, connection_ready_child = mp_context.Pipe(duplex=False)
+    mp_context.Process(
+        target=run_tracker_server,
+        args=(address, authkey, connection_ready_child),
+        daemon=True,
+        name="tracker-server",
+    ).start()
+    connection_ready.recv()
+    tracker_server_address, tracker_server_authkey = address, authkey
+
+
+def run_tracker_server(address, authkey, connection_ready):
+    """Serve the requests of the worker and of its background jobs (one thread per connection),
+    until the worker terminates."""
+    with multiprocessing.connection.Listener(address, authkey=authkey) as listener:
+        connection_ready.send(True)
+        connection_ready.close()
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError):
+                continue
+            threading.Thread(target=serve_connection, args=(connection,), daemon=True).start()
+
+
+def serve_connection(connection):
+    """Run the requests received on a connection to the tracker server, and send back their
+    result (or the exception raised), until the connection is closed."""
+    with connection:
+        while True:
+            try:
+                name, args = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                response = ("result", DIC_SERVER_FUNCTIONS[name](*args))
+            except Exception as e:
+                response = ("error", e)
+            try:
+                connection.send(response)
+            except (OSError, ValueError):
+                # The client is gone (e.g. a cancelled background job)
+                return
+
+
+def call_tracker_server(name, *args):
+    """Run a function of the tracker server (see DIC_SERVER_FUNCTIONS), and return its result.
+    Exceptions raised by the function are raised again."""
+    if tracker_server_address is None:
+        raise RuntimeError("The tracker server has not been started")
+    connection = getattr(local_connections, "connection", None)
+    if connection is None:
+        connection = multiprocessing.connection.Client(
+            tracker_server_address, authkey=tracker_server_authkey
+        )
+        local_connections.connection = connection
+    try:
+        connection.send((name, args))
+        status, value = connection.recv()
+    except BaseException:
+        # The connection may be left with a pending response: never reuse it
+        local_connections.connection = None
+        connection.close()
+        raise
+    if status == "error":
+        raise value
+    return value
+
+
+#################### Functions of the server ####################
+
+
+def return_line_tracker_pool(line_path):
+    """Return the pool of trackers of a line file, created on first use."""
+    with lock_tracker_pools:
+        if line_path not in dic_tracker_pools:
+            dic_tracker_pools[line_path] = tracker_pool_functions.return_tracker_pool(line_path)
+        return dic_tracker_pools[line_path]
+
+
+def server_compute_twiss(line_path, dic_knobs, mode):
+    """Compute the twiss of a knob state on a pooled tracker, and return the plotted twiss, the
+    time the computation took and the number of threads of the tracker."""
+    with tracker_pool_functions.checkout_tracker(
+        return_line_tracker_pool(line_path), dic_knobs
+    ) as pooled_tracker:
+        tw, latency = context_functions.compute_twiss(pooled_tracker["tracker"], mode=mode)
+        return (
+            cache_functions.return_plotted_twiss(tw, mode=mode),
+            latency,
+            pooled_tracker["omp_num_threads"],
+        )
+
+
+def server_return_multipole_strengths(line_path, dic_knobs):
+    """Return the strength of each plotted order of the multipoles for a knob state, read from the
+    buffers of a pooled tracker, as Series indexed by parent element."""
+    with tracker_pool_functions.checkout_tracker(
+        return_line_tracker_pool(line_path), dic_knobs
+    ) as pooled_tracker:
+        if pooled_tracker["strength_map"] is None:
+            pooled_tracker["strength_map"] = loading_functions.return_multipole_strength_map(
+                pooled_tracker["tracker"]
+            )
+        return {
+            order: loading_functions.return_multipole_strengths_from_buffers(
+                pooled_tracker["strength_map"], order
+            )
+            for order in loading_functions.L_PLOTTED_MULTIPOLE_ORDERS
+        }
+
+
+def server_return_element_knobs(line_path, dic_knobs, name):
+    """Return the type of an element and the knobs acting on it, for a knob state."""
+    with tracker_pool_functions.checkout_tracker(
+        return_line_tracker_pool(line_path), dic_knobs
+    ) as pooled_tracker:
+        return knob_functions.return_element_knobs(pooled_tracker["tracker"], name)
+
+
+def server_start_tracking(
+    line_path, dic_knobs, n_particles, amplitude, nemitt, seed, n_turns, chunk_size
+):
+    """Start a tracking session: build the particles of the tracking, matched to the optics of a
+    knob state, along with its monitor and buffers, and return the id of the session. Sessions
+    that expired are dropped."""
+    with tracker_pool_functions.checkout_tracker(
+        return_line_tracker_pool(line_path), dic_knobs
+    ) as pooled_tracker:
+        particles = tracking_functions.build_tracking_particles(
+            pooled_tracker["tracker"], n_particles, amplitude, nemitt, seed
+        )
+    buffers = tracking_functions.return_tracking_buffers(n_particles, n_turns, chunk_size)
+    tracking_session = {
+        "line_path": line_path,
+        "dic_knobs": dic_knobs,
+        "particles": particles,
+        "monitor": tracking_functions.return_tracking_monitor(particles, buffers),
+        "buffers": buffers,
+        "turn": 0,
+        "last_used": time.monotonic(),
+    }
+
+    tracking_session_id = uuid.uuid4().hex
+    with lock_tracking_sessions:
+        for expired_id in [
+            session_id
+            for session_id, session in dic_tracking_sessions.items()
+            if time.monotonic() - session["last_used"] > TRACKING_SESSION_EXPIRE_TIME
+        ]:
+            del dic_tracking_sessions[expired_id]
+        dic_tracking_sessions[tracking_session_id] = tracking_session
+    return tracking_session_id
+
+
+def server_track_chunk(tracking_session_id, n_turns):
+    """Track the particles of a tracking session for a chunk of turns on a pooled tracker, and
+    return the phase space of the chunk, the turn-by-turn data recorded during the chunk, and
+    whether some particles are still alive. The tracker is only checked out during the chunk, so
+    that a tracking that is stopped never keeps it."""
+    with lock_tracking_sessions:
+        tracking_session = dic_tracking_sessions.get(tracking_session_id)
+    if tracking_session is None:
+        raise KeyError(f"Tracking session {tracking_session_id} has ended or expired")
+    tracking_session["last_used"] = time.monotonic()
+
+    buffers = tracking_session["buffers"]
+    idx_first_point = buffers["n_turn_points"]
+    with tracker_pool_functions.checkout_tracker(
+        return_line_tracker_pool(tracking_session["line_path"]), tracking_session["dic_knobs"]
+    ) as pooled_tracker:
+        tracking_functions.track_chunk(
+            pooled_tracker["tracker"],
+            tracking_session["particles"],
+            tracking_session["monitor"],
+            buffers,
+            tracking_session["turn"],
+            n_turns,
+        )
+    tracking_session["turn"] += n_turns
+
+    dic_phase_space, dic_chunk_turn_by_turn = tracking_functions.return_tracking_frame(
+        buffers, idx_first_point
+    )
+    alive = bool(np.any(np.asarray(tracking_session["particles"].state) > 0))
+    return dic_phase_space, dic_chunk_turn_by_turn, alive
+
+
+def server_end_tracking(tracking_session_id):
+    """End a tracking session, dropping its particles, monitor and buffers."""
+    with lock_tracking_sessions:
+        dic_tracking_sessions.pop(tracking_session_id, None)
+
+
+def server_release_trackers(line_path):
+    """Drop the pool of trackers of a line file (e.g. when its dataset is evicted). Trackers
+    checked out at the time are dropped when given back."""
+    with lock_tracker_pools:
+        dic_tracker_pools.pop(line_path, None)
+
+
+# Functions that can be run by the tracker server
+DIC_SERVER_FUNCTIONS = {
+    "compute_twiss": server_compute_twiss,
+    "return_multipole_strengths": server_return_multipole_strengths,
+    "return_element_knobs": server_return_element_knobs,
+    "start_tracking": server_start_tracking,
+    "track_chunk": server_track_chunk,
+    "end_tracking": server_end_tracking,
+    "release_trackers": server_release_trackers,
+}
+
+
+#################### Functions of the clients ####################
+
+
+def compute_twiss(line_path, dic_knobs, mode="full"):
+    """Compute the twiss of a knob state on a (warm) tracker of the tracker server, and return the
+    plotted twiss, the time the computation took and the number of threads of the tracker."""
+    return call_tracker_server("compute_twiss", line_path, dic_knobs, mode)
+
+
+def return_multipole_strengths(line_path, dic_knobs):
+    """Return the strength of each plotted order of the multipoles for a knob state."""
+    return call_tracker_server("return_multipole_strengths", line_path, dic_knobs)
+
+
+def return_element_knobs(line_path, dic_knobs, name):
+    """Return the type of an element and the knobs acting on it, for a knob state."""
+    return call_tracker_server("return_element_knobs", line_path, dic_knobs, name)
+
+
+def start_tracking(line_path, dic_knobs, n_particles, amplitude, nemitt, seed, n_turns, chunk_size):
+    """Start a tracking session in the tracker server, for particles matched to the optics of a
+    knob state, and return its id."""
+    return call_tracker_server(
+        "start_tracking",
+        line_path,
+        dic_knobs,
+        n_particles,
+        amplitude,
+        nemitt,
+        seed,
+        n_turns,
+        chunk_size,
+    )
+
+
+def track_chunk(tracking_session_id, n_turns):
+    """Track the particles of a tracking session for a chunk of turns, and return the phase space
+    of the chunk, the turn-by-turn data recorded during the chunk, and whether some particles are
+    still alive."""
+    return call_tracker_server("track_chunk", tracking_session_id, n_turns)
+
+
+def end_tracking(tracking_session_id):
+    """End a tracking session of the tracker server."""
+    call_tracker_server("end_tracking", tracking_session_id)
+
+
+def release_trackers(line_path):
+    """Drop the trackers of a line file held by the tracker server."""
+    call_tracker_server("release_trackers", line_path)
@@ -0,0 +1,184 @@
+#################### Imports ####################
+import numpy as np
+import xtrack as xt
+
+#################### Constants ####################
+
+# Maximum number of particles and turns of a tracking
+MAX_TRACKED_PARTICLES = 10000
+MAX_TRACKED_TURNS = 1000000
+
+# Default normalized emittance (in m) used to convert the amplitudes of the particles
+DEFAULT_NEMITT = 2.5e-6
+
+# Number of particles displayed in the phase space, and maximum number of phase space points
+# sent per chunk of turns
+N_PHASE_SPACE_PARTICLES = 50
+MAX_PHASE_SPACE_POINTS = 5000
+
+# Maximum number of points of the turn-by-turn data (the turns are decimated beyond that), so that
+# the memory used does not depend on the number of turns
+MAX_TURN_POINTS = 2000
+
+#################### Functions ####################
+
+
+def return_turn_by_turn_arrays(n_turns):
+    """Return the decimation of the turn-by-turn data of a tracking (centroid and rms size of the
+    displayed particles, and number of particles alive), and its preallocated arrays."""
+    decimation = int(np.ceil(n_turns / MAX_TURN_POINTS))
+    n_turn_points = int(np.ceil(n_turns / decimation))
+    return decimation, {
+        column: np.full(n_turn_points, np.nan)
+        for column in ["turn", "mean_x", "mean_y", "rms_x", "rms_y", "n_alive"]
+    }
+
+
+def return_tracking_buffers(n_particles, n_turns, chunk_size):
+    """Return the buffers of a tracking, allocated once: the coordinates of the displayed
+    particles over a chunk of turns, and the decimated turn-by-turn data."""
+    n_phase_space_particles = min(N_PHASE_SPACE_PARTICLES, n_particles)
+    decimation, dic_turn_by_turn = return_turn_by_turn_arrays(n_turns)
+    return {
+        "decimation": decimation,
+        "n_turn_points": 0,
+        "dic_phase_space": {
+            coordinate: np.full((chunk_size, n_phase_space_particles), np.nan)
+            for coordinate in ["x", "px", "y", "py"]
+        },
+        "n_chunk_turns": 0,
+        "dic_turn_by_turn": dic_turn_by_turn,
+    }
+
+
+def return_masked_mean_rms(values):
+    """Return the mean and rms of each row of an array, ignoring NaN values (NaN for the rows
+    without any value)."""
+    valid = ~np.isnan(values)
+    n_valid = np.count_nonzero(valid, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0.0).sum(axis=1) / n_valid
+        rms = np.sqrt(np.where(valid, (values - mean[:, None]) ** 2, 0.0).sum(axis=1) / n_valid)
+    return mean, rms
+
+
+def record_chunk(monitor, particles, buffers, turn, n_turns):
+    """Record the coordinates of the displayed particles over a chunk of turns (read from the
+    monitor of the chunk) and, every few turns, the turn-by-turn data, in the preallocated
+    buffers. The centroid and rms size are the ones of the displayed particles, while the number
+    of particles alive is obtained for all particles from the turn at which they are lost."""
+    # Coordinates of the displayed particles at the start of each turn (NaN once lost)
+    recorded = np.asarray(monitor.state).T[:n_turns] > 0
+    for coordinate, array in buffers["dic_phase_space"].items():
+        array[:n_turns] = np.where(
+            recorded, np.asarray(getattr(monitor, coordinate)).T[:n_turns], np.nan
+        )
+    buffers["n_chunk_turns"] = n_turns
+
+    # Decimated turn-by-turn data
+    turns = np.arange(turn, turn + n_turns)
+    idx_turns = np.flatnonzero(turns % buffers["decimation"] == 0)
+    if len(idx_turns) == 0:
+        return
+    at_turn_lost = np.sort(
+        np.where(np.asarray(particles.state) > 0, turn + n_turns, np.asarray(particles.at_turn))
+    )
+    idx_points = slice(buffers["n_turn_points"], buffers["n_turn_points"] + len(idx_turns))
+    dic_turn_by_turn = buffers["dic_turn_by_turn"]
+    dic_turn_by_turn["turn"][idx_points] = turns[idx_turns]
+    dic_turn_by_turn["n_alive"][idx_points] = len(at_turn_lost) - np.searchsorted(
+        at_turn_lost, turns[idx_turns], side="left"
+    )
+    for plane in ["x", "y"]:
+        (
+            dic_turn_by_turn[f"mean_{plane}"][idx_points],
+            dic_turn_by_turn[f"rms_{plane}"][idx_points],
+        ) = return_masked_mean_rms(buffers["dic_phase_space"][plane][idx_turns])
+    buffers["n_turn_points"] += len(idx_turns)
+
+
+def return_tracking_frame(buffers, idx_first_point=0):
+    """Return the data displayed after a chunk of turns: the phase space of the displayed
+    particles over the chunk (decimated to a maximum number of points), and the turn-by-turn data
+    recorded so far, from a given point (e.g. the first one of the chunk)."""
+    n_chunk_turns = buffers["n_chunk_turns"]
+    n_phase_space_particles = buffers["dic_phase_space"]["x"].shape[1]
+    step = max(int(np.ceil(n_chunk_turns * n_phase_space_particles / MAX_PHASE_SPACE_POINTS)), 1)
+    dic_phase_space = {
+        coordinate: array[:n_chunk_turns:step].ravel()
+        for coordinate, array in buffers["dic_phase_space"].items()
+    }
+    dic_turn_by_turn = {
+        column: array[idx_first_point : buffers["n_turn_points"]]
+        for column, array in buffers["dic_turn_by_turn"].items()
+    }
+    return dic_phase_space, dic_turn_by_turn
+
+
+def build_tracking_particles(tracker, n_particles, amplitude, nemitt=DEFAULT_NEMITT, seed=0):
+    """Return a Gaussian ensemble of particles (with a given rms amplitude, in beam sigmas),
+    matched to the optics of a tracker."""
+    rng = np.random.default_rng(seed)
+    return tracker.build_particles(
+        x_norm=rng.normal(scale=amplitude, size=n_particles),
+        px_norm=rng.normal(scale=amplitude, size=n_particles),
+        y_norm=rng.normal(scale=amplitude, size=n_particles),
+        py_norm=rng.normal(scale=amplitude, size=n_particles),
+        nemitt_x=nemitt,
+        nemitt_y=nemitt,
+    )
+
+
+def return_tracking_monitor(particles, buffers):
+    """Return the turn-by-turn monitor of a tracking, limited to the displayed particles and
+    spanning a chunk of turns. It is built once, and moved to each chunk of turns."""
+    chunk_size, n_phase_space_particles = buffers["dic_phase_space"]["x"].shape
+    return xt.ParticlesMonitor(
+        start_at_turn=0,
+        stop_at_turn=chunk_size,
+        num_particles=n_phase_space_particles,
+        _context=particles._context,
+    )
+
+
+def track_chunk(tracker, particles, monitor, buffers, turn, n_turns):
+    """Track the particles for a chunk of turns in a single call, starting at a given turn, with
+    the turn-by-turn monitor of the tracking moved to the chunk, and record the displayed data in
+    the buffers."""
+    # The monitor keeps spanning a whole chunk (the last chunk may be shorter): its records are
+    # read for the turns tracked only
+    chunk_size = monitor.stop_at_turn - monitor.start_at_turn
+    monitor.start_at_turn = turn
+    monitor.stop_at_turn = turn + chunk_size
+    monitor.data.state[:] = 0
+    tracker.track(particles, num_turns=n_turns, turn_by_turn_monitor=monitor)
+    record_chunk(monitor, particles, buffers, turn, n_turns)
+
+
+def iterate_tracking(function_track_chunk, n_turns, chunk_size):
+    """Track particles for a number of turns, by chunks of turns, and yield the number of turns
+    tracked and the displayed data after each chunk. Each chunk is tracked by
+    function_track_chunk(n_turns), which returns the phase space of the chunk, the turn-by-turn
+    data recorded during the chunk, and whether some particles are still alive. The turn-by-turn
+    data is gathered in arrays of fixed size, so that the memory used does not depend on the
+    number of turns."""
+    _, dic_turn_by_turn = return_turn_by_turn_arrays(n_turns)
+    n_turn_points = 0
+
+    turn = 0
+    while turn < n_turns:
+        n_turns_chunk = min(chunk_size, n_turns - turn)
+        dic_phase_space, dic_chunk_turn_by_turn, alive = function_track_chunk(n_turns_chunk)
+        n_chunk_turn_points = len(dic_chunk_turn_by_turn["turn"])
+        for column, array in dic_chunk_turn_by_turn.items():
+            dic_turn_by_turn[column][n_turn_points : n_turn_points + n_chunk_turn_points] = array
+        n_turn_points += n_chunk_turn_points
+        turn += n_turns_chunk
+        yield turn, (
+            dic_phase_space,
+            {column: array[:n_turn_points] for column, array in dic_turn_by_turn.items()},
+        )
+
+        # Stop early if all the particles are lost
+        if not alive:
+            return